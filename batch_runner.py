@@ -0,0 +1,146 @@
+# Runs many independent command files through gatorTaxi.runFile on a pool of worker processes
+#
+# Every input file, text or a binary_format command file, gets a fresh CabService and its own output file, named by
+# --output-pattern. The pool workers import gatorTaxi once and are reused for all files they are given, so the
+# per-file cost is only the run itself.
+# Files are handed out largest first, so that a large file picked up last does not leave the other workers idle.
+# A failing file is reported and does not stop the batch. At the end a report with the lines, time and throughput
+# of every file and of the whole batch is written to stderr, and to --report as JSON if given.
+#
+# Usage: python3 batch_runner.py input1.txt input2.txt ... [-j JOBS] [--output-pattern "{dir}/{stem}.out"]
+#                                [--heap binary|4-ary|pairing] [--print-cache N] [--columnar] [--ttl TICKS]
+#                                [--binary-results] [--report report.json]
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import gatorTaxi
+import print_cache
+
+DEFAULT_OUTPUT_PATTERN = "{dir}/{stem}_output.txt"
+
+
+# Returns the output path of an input file. The pattern may use {dir}, {name}, {stem} and {ext} of the input path
+# and {index}, its position in the batch.
+def outputPathFor(pattern, inputPath, index):
+    directory, name = os.path.split(inputPath)
+    stem, ext = os.path.splitext(name)
+    return pattern.format(dir=directory or ".", name=name, stem=stem, ext=ext, index=index)
+
+
+# Returns the (inputPath, outputPath) pairs of a batch. Raises ValueError if two files would be written to the same
+# output or an output would overwrite an input.
+def planOutputs(inputPaths, pattern):
+    tasks = [(inputPath, outputPathFor(pattern, inputPath, index)) for index, inputPath in enumerate(inputPaths)]
+    inputs = {os.path.realpath(inputPath) for inputPath in inputPaths}
+    seen = {}
+    for inputPath, outputPath in tasks:
+        key = os.path.realpath(outputPath)
+        if key in inputs:
+            raise ValueError("Output %s would overwrite an input file" % outputPath)
+        if key in seen:
+            raise ValueError("%s and %s would both be written to %s" % (seen[key], inputPath, outputPath))
+        seen[key] = inputPath
+    return tasks
+
+
+# Runs one file in a pool worker. Returns a result record; "error" is None if the run succeeded.
+def runTask(task):
+    inputPath, outputPath, options = task
+    printCache = None
+    if options["printCache"]:
+        printCache = print_cache.PrintCache(options["printCache"], options["printCachePolicy"])
+    result = {"input": inputPath, "output": outputPath, "lines": 0, "seconds": 0.0, "error": None,
+              "pid": os.getpid()}
+    try:
+        result["lines"], result["seconds"] = gatorTaxi.runFile(
+            inputPath, outputPath, heap=options["heap"], printCache=printCache, columnar=options["columnar"],
+            ttl=options["ttl"] or None, binaryResults=options["binaryResults"])
+    except Exception as error:
+        result["error"] = "%s: %s" % (type(error).__name__, error)
+    return result
+
+
+# Runs every (inputPath, outputPath) pair of tasks on jobs worker processes with the given runFile options.
+# Returns the report as a dict with the per-file results in input order and the totals of the batch.
+def runBatch(tasks, jobs, options):
+    # Largest files first, so that the last files handed out are short
+    ordered = sorted(tasks, key=lambda task: os.path.getsize(task[0]) if os.path.exists(task[0]) else 0,
+                     reverse=True)
+    startTime = time.perf_counter()
+    with multiprocessing.Pool(jobs) as pool:
+        results = list(pool.imap_unordered(runTask, [(inputPath, outputPath, options)
+                                                     for inputPath, outputPath in ordered]))
+    wallSeconds = time.perf_counter() - startTime
+
+    position = {inputPath: i for i, (inputPath, outputPath) in enumerate(tasks)}
+    results.sort(key=lambda result: position[result["input"]])
+    for result in results:
+        result["linesPerSec"] = result["lines"] / result["seconds"] if result["seconds"] > 0 else None
+    lines = sum(result["lines"] for result in results)
+    busySeconds = sum(result["seconds"] for result in results)
+    totals = {"files": len(results), "failed": sum(1 for result in results if result["error"] is not None),
+              "jobs": jobs, "workers": len({result["pid"] for result in results}), "lines": lines,
+              "wallSeconds": wallSeconds, "busySeconds": busySeconds,
+              "linesPerSec": lines / wallSeconds if wallSeconds > 0 else None,
+              "parallelism": busySeconds / wallSeconds if wallSeconds > 0 else None}
+    return {"options": options, "totals": totals, "files": results}
+
+
+# Writes the report as a table to out
+def printReport(report, out):
+    for result in report["files"]:
+        if result["error"] is not None:
+            print("%-40s FAILED %s" % (result["input"], result["error"]), file=out)
+        else:
+            print("%-40s %10d lines %8.3fs %10.0f lines/sec -> %s" % (
+                result["input"], result["lines"], result["seconds"], result["linesPerSec"] or 0, result["output"]),
+                file=out)
+    totals = report["totals"]
+    print("%d files (%d failed) on %d workers: %d lines in %.3fs wall, %.3fs busy, %.0f lines/sec, parallelism %.2f" % (
+        totals["files"], totals["failed"], totals["workers"], totals["lines"], totals["wallSeconds"],
+        totals["busySeconds"], totals["linesPerSec"] or 0, totals["parallelism"] or 0), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run many Gator Taxi command files on a process pool")
+    parser.add_argument("input_files", nargs="+", help="files with one command per line")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument("--output-pattern", default=DEFAULT_OUTPUT_PATTERN,
+                        help="output path of each input, using {dir}, {name}, {stem}, {ext} and {index} "
+                             "(default: %s)" % DEFAULT_OUTPUT_PATTERN.replace("%", "%%"))
+    parser.add_argument("--heap", choices=sorted(gatorTaxi.HEAP_BACKENDS), default="binary",
+                        help="priority queue backend (default: binary)")
+    parser.add_argument("--print-cache", type=int, default=0, metavar="N",
+                        help="cache the results of up to N Print(rideNumber) lookups per file")
+    parser.add_argument("--print-cache-policy", choices=print_cache.EVICTION_POLICIES, default="lru")
+    parser.add_argument("--columnar", action="store_true",
+                        help="answer runs of range queries from a columnar snapshot of the rides")
+    parser.add_argument("--ttl", type=int, default=0, metavar="TICKS",
+                        help="expire rides TICKS ticks of the logical clock set by AdvanceClock(t) after their insert")
+    parser.add_argument("--binary-results", action="store_true",
+                        help="write the results in the binary result format of binary_format.py")
+    parser.add_argument("--report", metavar="PATH", help="also write the report as JSON to this file")
+    args = parser.parse_args(argv)
+
+    try:
+        tasks = planOutputs(args.input_files, args.output_pattern)
+    except (KeyError, IndexError, ValueError) as error:
+        parser.error("invalid --output-pattern: %s" % error)
+    options = {"heap": args.heap, "printCache": args.print_cache, "printCachePolicy": args.print_cache_policy,
+               "columnar": args.columnar, "ttl": args.ttl, "binaryResults": args.binary_results}
+    report = runBatch(tasks, max(1, min(args.jobs, len(tasks))), options)
+    printReport(report, sys.stderr)
+    if args.report:
+        with open(args.report, "w") as reportFile:
+            json.dump(report, reportFile, indent=1)
+    sys.exit(1 if report["totals"]["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# Measures the throughput of ShardedCabService with 1, 2, 4 and 8 shards on a seeded command mix.
+# Usage: python3 bench_shards.py [numberOfCommands]
+
+import io
+import random
+import sys
+import time
+
+import gatorTaxi
+import sharded_service
+
+MAX_RIDE_NUMBER = 1000000
+
+
+# Builds a seeded mix of command lines: a bulk load followed by single-ride commands and Print ranges
+def makeCommands(numberOfCommands, seed=1):
+    rng = random.Random(seed)
+    rideNumbers = rng.sample(range(1, MAX_RIDE_NUMBER + 1), numberOfCommands)
+    lines = ["Insert(%d,%d,%d)" % (rideNumber, rng.randint(1, 1000), rng.randint(1, 1000))
+             for rideNumber in rideNumbers[:numberOfCommands // 2]]
+    for _ in range(numberOfCommands - len(lines)):
+        choice = rng.random()
+        rideNumber = rng.choice(rideNumbers)
+        if choice < 0.2:
+            lines.append("GetNextRide()")
+        elif choice < 0.45:
+            lines.append("CancelRide(%d)" % rideNumber)
+        elif choice < 0.7:
+            lines.append("UpdateTrip(%d,%d)" %
+                         (rideNumber, rng.randint(1, 2000)))
+        elif choice < 0.9:
+            lines.append("Print(%d)" % rideNumber)
+        else:
+            lines.append("Print(%d,%d)" % (rideNumber, rideNumber + 20000))
+    return lines
+
+
+def main():
+    numberOfCommands = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = makeCommands(numberOfCommands)
+    for numShards in (1, 2, 4, 8):
+        boundaries = sharded_service.evenBoundaries(
+            numShards, MAX_RIDE_NUMBER)
+        with sharded_service.ShardedCabService(boundaries, io.StringIO()) as service:
+            startTime = time.perf_counter()
+            gatorTaxi.CommandEngine(service).run(lines)
+            elapsed = time.perf_counter() - startTime
+        print("%d shard(s): %10.0f commands/sec" %
+              (numShards, len(lines) / elapsed))
+
+
+if __name__ == "__main__":
+    main()
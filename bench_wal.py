@@ -0,0 +1,69 @@
+# Measures CabService mutation throughput with the write-ahead log off, with group commit and with an fsync per record.
+# Usage: python3 bench_wal.py [numberOfOps]
+
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+import gatorTaxi
+import write_ahead_log
+
+
+# Builds a seeded mix of mutations: inserts, GetNextRide, cancellations and trip updates
+def makeOps(numberOfOps, seed=1):
+    rng = random.Random(seed)
+    ops = []
+    nextRideNumber = 1
+    for _ in range(numberOfOps):
+        choice = rng.random()
+        if choice < 0.5 or nextRideNumber == 1:
+            ops.append((gatorTaxi.OP_INSERT, (nextRideNumber,
+                       rng.randint(1, 1000), rng.randint(1, 1000))))
+            nextRideNumber += 1
+        elif choice < 0.65:
+            ops.append((gatorTaxi.OP_GET_NEXT_RIDE, ()))
+        elif choice < 0.8:
+            ops.append((gatorTaxi.OP_CANCEL_RIDE,
+                       (rng.randint(1, nextRideNumber),)))
+        else:
+            ops.append((gatorTaxi.OP_UPDATE_TRIP,
+                       (rng.randint(1, nextRideNumber), rng.randint(1, 2000))))
+    return ops
+
+
+# Runs ops against a fresh CabService that logs to walPath with the given group commit settings,
+# or without a log if walPath is None. Returns the throughput in ops/sec.
+def runOps(ops, walPath=None, syncEveryOps=1, syncIntervalMs=0.0):
+    wal = None
+    if walPath is not None:
+        wal = write_ahead_log.WriteAheadLog(
+            walPath, syncEveryOps, syncIntervalMs)
+    engine = gatorTaxi.CommandEngine(gatorTaxi.CabService(io.StringIO(), wal))
+    startTime = time.perf_counter()
+    for opcode, args in ops:
+        engine.execute(opcode, args)
+    if wal is not None:
+        wal.close()
+    return len(ops) / (time.perf_counter() - startTime)
+
+
+def main():
+    numberOfOps = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    ops = makeOps(numberOfOps)
+    with tempfile.TemporaryDirectory() as tmpDir:
+        modes = [
+            ("durability off", None, 1, 0.0),
+            ("group commit (%d ops / %g ms)" % (write_ahead_log.DEFAULT_SYNC_EVERY_OPS, write_ahead_log.DEFAULT_SYNC_INTERVAL_MS),
+             os.path.join(tmpDir, "group.wal"), write_ahead_log.DEFAULT_SYNC_EVERY_OPS, write_ahead_log.DEFAULT_SYNC_INTERVAL_MS),
+            ("fsync per op", os.path.join(tmpDir, "sync.wal"), 1, 0.0),
+        ]
+        for name, walPath, syncEveryOps, syncIntervalMs in modes:
+            opsPerSec = runOps(ops, walPath, syncEveryOps, syncIntervalMs)
+            print("%-32s %10.0f ops/sec" % (name, opsPerSec))
+
+
+if __name__ == "__main__":
+    main()
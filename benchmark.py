@@ -0,0 +1,304 @@
+# Benchmark suite for the Gator Taxi data structures and command engine
+#
+# A seeded workload generator produces command streams for several operation mixes and rideNumber distributions.
+# Every operation type is timed separately for the RedBlackTree, every priority queue backend and the end-to-end
+# engine (parsing and dispatch included). Results are written as JSON so that runs can be compared to catch
+# regressions.
+#
+# Usage:
+#   python3 benchmark.py [--sizes 1e3,1e4,1e5] [--mixes ...] [--distributions ...] [--heaps binary,4-ary,pairing]
+#                        [--seed N] [-o results.json]
+#   python3 benchmark.py --compare baseline.json results.json [--tolerance 0.1]
+#   python3 benchmark.py --check-distributions [--sizes ...]
+
+import argparse
+import io
+import json
+import platform
+import random
+import sys
+import time
+
+import gatorTaxi
+import red_black_tree
+
+# Relative weights of the commands issued after the initial inserts, per operation mix
+MIXES = {
+    "insert-heavy": {"Insert": 70, "GetNextRide": 10, "CancelRide": 5, "UpdateTrip": 10, "Print": 5, "PrintRange": 0},
+    "getnext-heavy": {"Insert": 35, "GetNextRide": 50, "CancelRide": 5, "UpdateTrip": 5, "Print": 5, "PrintRange": 0},
+    "update-storm": {"Insert": 10, "GetNextRide": 5, "CancelRide": 5, "UpdateTrip": 75, "Print": 5, "PrintRange": 0},
+    "wide-print": {"Insert": 20, "GetNextRide": 10, "CancelRide": 5, "UpdateTrip": 10, "Print": 25, "PrintRange": 30},
+}
+
+DISTRIBUTIONS = ("sequential", "uniform", "clustered")
+
+# Number of keys per cluster in the clustered distribution
+CLUSTER_SIZE = 1000
+
+# Fraction of all rides that a wide Print range covers
+WIDE_RANGE_FRACTION = 0.01
+
+
+# Returns count distinct rideNumbers in insertion order for the given distribution
+def rideNumbers(distribution, count, rng):
+    if distribution == "sequential":
+        return list(range(1, count + 1))
+    if distribution == "uniform":
+        return rng.sample(range(1, 10 * count + 1), count)
+    if distribution == "clustered":
+        # Runs of consecutive rideNumbers starting at random, widely spaced offsets, inserted cluster by cluster
+        # Rounded up, so that the last cluster is cut short instead of missing
+        numClusters = max(1, -(-count // CLUSTER_SIZE))
+        starts = rng.sample(range(numClusters * 10), numClusters)
+        keys = []
+        for start in starts:
+            keys.extend(range(start * 10 * CLUSTER_SIZE + 1,
+                              start * 10 * CLUSTER_SIZE + CLUSTER_SIZE + 1))
+        return keys[:count]
+    raise ValueError("Unknown distribution: " + distribution)
+
+
+# Sizes that rideNumbers is checked at besides the requested ones, including sizes that are not a multiple of
+# CLUSTER_SIZE
+CHECK_SIZES = (1, 999, 1000, 1250, 2500)
+
+
+# Checks that every distribution returns exactly count distinct rideNumbers for every count in sizes and
+# CHECK_SIZES. Returns the list of failures as text lines.
+def checkDistributions(sizes, seed):
+    failures = []
+    for distribution in DISTRIBUTIONS:
+        for count in sorted(set(sizes) | set(CHECK_SIZES)):
+            keys = rideNumbers(distribution, count, random.Random(seed))
+            if len(keys) != count or len(set(keys)) != count:
+                failures.append("%s size=%d: %d rideNumbers, %d distinct" % (
+                    distribution, count, len(keys), len(set(keys))))
+    return failures
+
+
+# Generates a command stream of size initial Inserts followed by size commands drawn from the mix.
+# Returns the text lines.
+def generateWorkload(mix, distribution, size, seed):
+    rng = random.Random(seed)
+    keys = rideNumbers(distribution, 2 * size, rng)
+    span = max(keys) - min(keys)
+    lines = ["Insert(%d,%d,%d)" % (key, rng.randint(1, 1000), rng.randint(1, 1000))
+             for key in keys[:size]]
+    nextKey = size
+    names = list(MIXES[mix])
+    weights = [MIXES[mix][name] for name in names]
+    for name in rng.choices(names, weights, k=size):
+        if name == "Insert":
+            lines.append("Insert(%d,%d,%d)" % (keys[nextKey], rng.randint(1, 1000), rng.randint(1, 1000)))
+            nextKey += 1
+        elif name == "GetNextRide":
+            lines.append("GetNextRide()")
+        elif name == "CancelRide":
+            lines.append("CancelRide(%d)" % keys[rng.randrange(nextKey)])
+        elif name == "UpdateTrip":
+            lines.append("UpdateTrip(%d,%d)" % (keys[rng.randrange(nextKey)], rng.randint(1, 2000)))
+        elif name == "Print":
+            lines.append("Print(%d)" % keys[rng.randrange(nextKey)])
+        else:
+            low = keys[rng.randrange(nextKey)]
+            lines.append("Print(%d,%d)" % (low, low + int(span * WIDE_RANGE_FRACTION)))
+    return lines
+
+
+# Times fn() and returns a result record for ops operations
+def timeOps(name, ops, fn):
+    startTime = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - startTime
+    return {"benchmark": name, "ops": ops, "seconds": seconds,
+            "opsPerSec": ops / seconds if seconds > 0 else None}
+
+
+# Times every RedBlackTree operation on size rideNumbers of the distribution
+def benchRedBlackTree(distribution, size, seed):
+    rng = random.Random(seed)
+    keys = rideNumbers(distribution, size, rng)
+    lookups = [rng.choice(keys) for _ in range(size)]
+    tree = red_black_tree.RedBlackTree()
+    span = max(keys) - min(keys)
+    ranges = [(low, low + int(span * WIDE_RANGE_FRACTION)) for low in lookups[:max(1, size // 100)]]
+
+    def insertAll():
+        for key in keys:
+            tree.insert(key, 1, 1)
+
+    def searchAll():
+        for key in lookups:
+            tree.search(key, tree.getRoot())
+
+    def rangeAll():
+        for low, high in ranges:
+            for node in tree.iter_range(low, high):
+                pass
+
+    def deleteAll():
+        for key in lookups:
+            node = tree.search(key, tree.getRoot())
+            if node is not None:
+                tree.deleteNode(node)
+
+    return [timeOps("rbtree.insert", size, insertAll),
+            timeOps("rbtree.search", size, searchAll),
+            timeOps("rbtree.iter_range", len(ranges), rangeAll),
+            timeOps("rbtree.deleteNode", size, deleteAll)]
+
+
+# Times every operation of the priority queue backend named heapName on size random rides
+def benchHeap(heapName, size, seed):
+    rng = random.Random(seed)
+    rides = [(i, rng.randint(1, 1000), rng.randint(1, 1000)) for i in range(size)]
+    heap = gatorTaxi.HEAP_BACKENDS[heapName]()
+    nodes = []
+
+    def insertAll():
+        for rideNumber, rideCost, tripDuration in rides:
+            nodes.append(heap.insert(rideNumber, rideCost, tripDuration, None))
+
+    updates = [(rng.randrange(size), rng.randint(1, 1000), rng.randint(1, 1000)) for _ in range(size)]
+
+    def updateAll():
+        for i, rideCost, tripDuration in updates:
+            heap.updateKey(nodes[i], rideCost, tripDuration)
+
+    deletes = rng.sample(range(size), size // 2)
+
+    def deleteArbitraryAll():
+        for i in deletes:
+            heap.deleteNode(nodes[i])
+
+    def deleteMinAll():
+        while heap.deleteMin() is not None:
+            pass
+
+    return [timeOps("heap.insert", size, insertAll),
+            timeOps("heap.updateKey", size, updateAll),
+            timeOps("heap.deleteNode", len(deletes), deleteArbitraryAll),
+            timeOps("heap.deleteMin", size - len(deletes), deleteMinAll)]
+
+
+# Runs a workload through the engine twice: once as a whole stream (lines/sec) and once timing the parse and
+# dispatch of every command by opcode. The CabService uses the priority queue backend named heapName.
+def benchEngine(lines, heapName="binary"):
+    results = [timeOps("engine.stream", len(lines),
+                       lambda: gatorTaxi.CommandEngine(gatorTaxi.CabService(io.StringIO(), heap=heapName)).run(lines))]
+
+    engine = gatorTaxi.CommandEngine(gatorTaxi.CabService(io.StringIO(), heap=heapName))
+    perf_counter = time.perf_counter
+    totals = {}
+    parseSeconds = 0.0
+    for line in lines:
+        startTime = perf_counter()
+        opcode, args = gatorTaxi.parseCommand(line)
+        parsedTime = perf_counter()
+        engine.execute(opcode, args)
+        endTime = perf_counter()
+        parseSeconds += parsedTime - startTime
+        count, seconds = totals.get(opcode, (0, 0.0))
+        totals[opcode] = (count + 1, seconds + endTime - parsedTime)
+    results.append({"benchmark": "engine.parse", "ops": len(lines), "seconds": parseSeconds,
+                    "opsPerSec": len(lines) / parseSeconds if parseSeconds > 0 else None})
+    for opcode, (count, seconds) in sorted(totals.items()):
+        results.append({"benchmark": "engine." + gatorTaxi.OPCODE_NAMES[opcode], "ops": count, "seconds": seconds,
+                        "opsPerSec": count / seconds if seconds > 0 else None})
+    return results
+
+
+def runSuite(sizes, mixes, distributions, heaps, seed):
+    results = []
+
+    def add(records, **labels):
+        for record in records:
+            record.update(labels)
+            results.append(record)
+            print("%-28s %-8s %-14s %-11s %9d %12.0f ops/sec" % (record["benchmark"], labels.get("heap", "-"),
+                  labels.get("mix", "-"), labels.get("distribution", "-"), labels["size"],
+                  record["opsPerSec"] or 0), file=sys.stderr)
+
+    for size in sizes:
+        for heapName in heaps:
+            add(benchHeap(heapName, size, seed), heap=heapName, size=size)
+        for distribution in distributions:
+            add(benchRedBlackTree(distribution, size, seed), distribution=distribution, size=size)
+            for mix in mixes:
+                lines = generateWorkload(mix, distribution, size, seed)
+                for heapName in heaps:
+                    add(benchEngine(lines, heapName), heap=heapName, mix=mix, distribution=distribution, size=size)
+    return {"meta": {"python": platform.python_version(), "platform": platform.platform(), "seed": seed,
+                     "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results": results}
+
+
+def resultKey(record):
+    return (record["benchmark"], record.get("heap", "binary"), record.get("mix"), record.get("distribution"),
+            record["size"])
+
+
+# Compares two result files and prints the throughput ratio of every benchmark present in both.
+# Returns the number of benchmarks that became slower by more than tolerance.
+def compare(baselinePath, currentPath, tolerance):
+    with open(baselinePath) as baselineFile, open(currentPath) as currentFile:
+        baseline = {resultKey(record): record for record in json.load(baselineFile)["results"]}
+        current = json.load(currentFile)["results"]
+    regressions = 0
+    for record in current:
+        old = baseline.get(resultKey(record))
+        if old is None or not old["opsPerSec"] or not record["opsPerSec"]:
+            continue
+        ratio = record["opsPerSec"] / old["opsPerSec"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            flag = "  REGRESSION"
+            regressions += 1
+        print("%-28s %-8s %-14s %-11s %9d %7.2fx%s" % (record["benchmark"], record.get("heap") or "-",
+              record.get("mix") or "-", record.get("distribution") or "-", record["size"], ratio, flag))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gator Taxi benchmark suite")
+    parser.add_argument("--sizes", default="1e3,1e4",
+                        type=lambda value: [int(float(size)) for size in value.split(",")],
+                        help="comma separated numbers of rides, e.g. 1e3,1e5,1e7")
+    parser.add_argument("--mixes", default=",".join(MIXES),
+                        type=lambda value: value.split(","))
+    parser.add_argument("--distributions", default=",".join(DISTRIBUTIONS),
+                        type=lambda value: value.split(","))
+    parser.add_argument("--heaps", default="binary",
+                        type=lambda value: value.split(","),
+                        help="comma separated priority queue backends: " + ",".join(gatorTaxi.HEAP_BACKENDS))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("-o", "--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="compare two result files instead of running the suite")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="relative slowdown reported as a regression by --compare")
+    parser.add_argument("--check-distributions", action="store_true",
+                        help="check that every distribution yields exactly as many rideNumbers as requested for "
+                             "--sizes and some sizes that are not a multiple of %d, instead of running the suite"
+                             % CLUSTER_SIZE)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        sys.exit(1 if compare(args.compare[0], args.compare[1], args.tolerance) else 0)
+    if args.check_distributions:
+        failures = checkDistributions(args.sizes, args.seed)
+        for failure in failures:
+            print("FAIL " + failure)
+        print("distributions OK" if not failures else "%d failures" % len(failures))
+        sys.exit(1 if failures else 0)
+
+    report = runSuite(args.sizes, args.mixes, args.distributions, args.heaps, args.seed)
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=1)
+    else:
+        json.dump(report, sys.stdout, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+# Binary formats for the commands read and the results written by gatorTaxi, as an alternative to text lines
+#
+# A command file consists of
+#   header:   magic (8 bytes), number of commands (uint64)
+#   commands: fixed-width (opcode uint8, number of arguments uint8, 6 padding bytes, three int64 arguments)
+# The opcodes are those of gatorTaxi, after parsing: Print with two arguments is stored as PrintRange. Unused
+# arguments are 0. Reading a command file needs no text decoding at all: the records are unpacked straight from the
+# mapped file.
+#
+# A result file consists of
+#   header:   magic (8 bytes)
+#   results:  (kind uint32, count uint32) followed by a payload, one record per output line
+#               RIDES:   count rides as 3*count int64 values (rideNumber, rideCost, tripDuration); (0,0,0) is a ride
+#               NUMBER:  one int64 value, count is 1
+#               TEXT:    count bytes of UTF-8 text exactly as written, including its newline if it has one, padded
+#                        with zero bytes to a multiple of 8
+# Every payload is a multiple of 8 bytes, so the int64 values of a record are aligned and can be used in place.
+# All values are little-endian. A CabService whose output is a ResultWriter writes its rides and numbers as typed
+# records at the places it would format them, so they are never turned into text and parsed back; its messages,
+# like "No active ride requests", and the stats lines are written as TEXT records.
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+COMMAND_MAGIC = b"GTAXCMD1"
+COMMAND_HEADER = struct.Struct("<8sQ")
+COMMAND_RECORD = struct.Struct("<BB6xqqq")
+MAX_ARGS = 3
+
+RESULT_MAGIC = b"GTAXRES1"
+RESULT_RECORD = struct.Struct("<II")
+# A whole record holding one ride or one number
+RIDE_RECORD = struct.Struct("<IIqqq")
+NUMBER_RECORD = struct.Struct("<IIq")
+
+# Kinds of result records
+RIDES = 1
+NUMBER = 2
+TEXT = 3
+
+# The values are written little-endian, which is what array("q") holds only on little-endian machines
+NATIVE_LITTLE_ENDIAN = sys.byteorder == "little"
+
+
+class BinaryFormatError(Exception):
+    pass
+
+
+# Returns True if the file at path starts with the magic of a command file
+def isCommandFile(path):
+    with open(path, "rb") as commandFile:
+        return commandFile.read(len(COMMAND_MAGIC)) == COMMAND_MAGIC
+
+
+# Writes an iterable of parsed (opcode, args) commands to a command file at path. None entries, the blank and
+# unknown lines of a text input, are skipped. Returns the number of commands written.
+# Time complexity : O(m)
+def writeCommands(path, commands):
+    count = 0
+    with open(path, "wb") as commandFile:
+        commandFile.write(COMMAND_HEADER.pack(COMMAND_MAGIC, 0))
+        pack = COMMAND_RECORD.pack
+        for command in commands:
+            if command is None:
+                continue
+            opcode, args = command
+            if len(args) > MAX_ARGS:
+                raise BinaryFormatError("Command %d has %d arguments, at most %d fit in a record" % (
+                    count, len(args), MAX_ARGS))
+            commandFile.write(pack(opcode, len(args), *args, *(0,) * (MAX_ARGS - len(args))))
+            count += 1
+        commandFile.seek(0)
+        commandFile.write(COMMAND_HEADER.pack(COMMAND_MAGIC, count))
+    return count
+
+
+# Yields (opcode, args) for every command of the command file at path, the same commands gatorTaxi.parseCommand
+# returns for the text lines they were converted from. The records are unpacked from the mapped file by
+# struct.iter_unpack, without creating a string per command.
+def readCommands(path):
+    with open(path, "rb") as commandFile:
+        header = commandFile.read(COMMAND_HEADER.size)
+        if len(header) < COMMAND_HEADER.size:
+            raise BinaryFormatError("Command file is truncated: " + path)
+        magic, count = COMMAND_HEADER.unpack(header)
+        if magic != COMMAND_MAGIC:
+            raise BinaryFormatError("Not a command file: " + path)
+        end = COMMAND_HEADER.size + count * COMMAND_RECORD.size
+        if os.fstat(commandFile.fileno()).st_size != end:
+            raise BinaryFormatError("Command file %s does not hold the %d commands of its header" % (path, count))
+        if count == 0:
+            return
+        with mmap.mmap(commandFile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                with view[COMMAND_HEADER.size:end] as recordsView:
+                    recordIter = COMMAND_RECORD.iter_unpack(recordsView)
+                    try:
+                        for opcode, argCount, arg1, arg2, arg3 in recordIter:
+                            yield opcode, (arg1, arg2, arg3)[:argCount]
+                    finally:
+                        # Drop the export of the mapped buffer before it is unmapped
+                        del recordIter
+
+
+# Writes a buffer of int64 values, an array("q") or a NumPy int64 array, in the little-endian byte order of the
+# formats
+def writeValues(resultFile, values):
+    if not NATIVE_LITTLE_ENDIAN:
+        values = array("q", values)
+        values.byteswap()
+    resultFile.write(values)
+
+
+# The output of a CabService for the result format. The service calls writeRide, writeRides, writeNumber and
+# writeNumbers with the values of its result lines; write() takes any text, which becomes one TEXT record per call.
+class ResultWriter:
+    def __init__(self, resultFile):
+        self.resultFile = resultFile
+        resultFile.write(RESULT_MAGIC)
+
+    # Writes text as a TEXT record, exactly as given
+    def write(self, text):
+        if text:
+            data = text.encode("utf-8")
+            self.resultFile.write(RESULT_RECORD.pack(TEXT, len(data)))
+            self.resultFile.write(data + b"\0" * (-len(data) % 8))
+        return len(text)
+
+    # Writes a line of one ride
+    def writeRide(self, rideNumber, rideCost, tripDuration):
+        self.resultFile.write(RIDE_RECORD.pack(RIDES, 1, rideNumber, rideCost, tripDuration))
+
+    # Writes a line of rides given as the int64 buffer of their (rideNumber, rideCost, tripDuration) values. A line
+    # without rides is the ride (0,0,0), as in the text output.
+    def writeRides(self, values):
+        if len(values) == 0:
+            self.writeRide(0, 0, 0)
+            return
+        self.resultFile.write(RESULT_RECORD.pack(RIDES, len(values) // 3))
+        writeValues(self.resultFile, values)
+
+    def writeNumber(self, value):
+        self.resultFile.write(NUMBER_RECORD.pack(NUMBER, 1, value))
+
+    # Writes a line for every number of an iterable
+    def writeNumbers(self, values):
+        pack = NUMBER_RECORD.pack
+        self.resultFile.write(b"".join([pack(NUMBER, 1, value) for value in values]))
+
+    def flush(self):
+        self.resultFile.flush()
+
+    def close(self):
+        self.resultFile.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# Yields (kind, values) for every record of the result file at path: a memoryview of the 3*count int64 values of a
+# RIDES record, the int of a NUMBER record or the str of a TEXT record. The memoryviews refer to the file contents
+# without copying them.
+def readResults(path):
+    with open(path, "rb") as resultFile:
+        data = resultFile.read()
+    if data[:len(RESULT_MAGIC)] != RESULT_MAGIC:
+        raise BinaryFormatError("Not a result file: " + path)
+    if not NATIVE_LITTLE_ENDIAN:
+        raise BinaryFormatError("Reading result files needs a little-endian machine")
+    view = memoryview(data)
+    offset = len(RESULT_MAGIC)
+    unpack = RESULT_RECORD.unpack_from
+    while offset < len(data):
+        if offset + RESULT_RECORD.size > len(data):
+            raise BinaryFormatError("Result file is truncated: " + path)
+        kind, count = unpack(data, offset)
+        offset += RESULT_RECORD.size
+        if kind == RIDES:
+            end = offset + 24 * count
+            values = view[offset:end].cast("q")
+        elif kind == NUMBER:
+            end = offset + 8
+            values = struct.unpack_from("<q", data, offset)[0]
+        elif kind == TEXT:
+            end = offset + count + (-count % 8)
+            values = data[offset:offset + count].decode("utf-8")
+        else:
+            raise BinaryFormatError("Unknown result kind %d at offset %d of %s" % (kind, offset, path))
+        if end > len(data):
+            raise BinaryFormatError("Result file is truncated: " + path)
+        yield kind, values
+        offset = end
+
+
+# Yields the text lines that the results of a result file were encoded from
+def formatResults(path):
+    for kind, values in readResults(path):
+        if kind == RIDES:
+            yield ",".join(["(%d,%d,%d)" % (values[i], values[i + 1], values[i + 2])
+                            for i in range(0, len(values), 3)]) + "\n"
+        elif kind == NUMBER:
+            yield "%d\n" % values
+        else:
+            yield values
@@ -0,0 +1,127 @@
+# Read-optimized columnar copy of the rides of a CabService for batches of range queries
+#
+# The rides are kept as columns of rideNumber, rideCost and tripDuration sorted by rideNumber, together with the
+# prefix sums of the rideCosts and the formatted "(rideNumber,rideCost,tripDuration)" string of every ride. A range
+# [rideNumber1, rideNumber2] is then located by two binary searches, its count and cost sum are two subtractions and
+# its output is one join over a slice of the formatted strings.
+# With NumPy the columns are int64 arrays and a whole batch of ranges is located by one vectorized searchsorted.
+# Without it they are array("q") columns searched with bisect one range at a time, which gives the same results.
+# The columns are rebuilt from the RBTree in O(n) and describe the rides only until the next mutation, which marks
+# them stale.
+
+import bisect
+from array import array
+from itertools import accumulate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class ColumnarSnapshot:
+    def __init__(self):
+        self.stale = True
+        # Rides visited by range queries answered from the RBTree since the snapshot became stale
+        self.ridesScanned = 0
+        self.rebuilds = 0
+        self.rideNumbers = array("q")
+        self.rideCosts = array("q")
+        self.tripDurations = array("q")
+        self.costPrefix = array("q", [0])
+        self.formatted = []
+
+    # Marks the snapshot stale after a mutation of the rides
+    def invalidate(self):
+        self.stale = True
+        self.ridesScanned = 0
+
+    # Rebuilds the columns from tree nodes in ascending order of rideNumber
+    # Time complexity : O(n)
+    def rebuild(self, sortedNodes):
+        rideNumbers = array("q")
+        rideCosts = array("q")
+        tripDurations = array("q")
+        for node in sortedNodes:
+            rideNumbers.append(node.rideNumber)
+            rideCosts.append(node.rideCost)
+            tripDurations.append(node.tripDuration)
+        costPrefix = array("q", [0])
+        costPrefix.extend(accumulate(rideCosts))
+        self.formatted = list(map("(%d,%d,%d)".__mod__, zip(rideNumbers, rideCosts, tripDurations)))
+        if numpy is not None:
+            rideNumbers = numpy.frombuffer(rideNumbers, dtype=numpy.int64)
+            rideCosts = numpy.frombuffer(rideCosts, dtype=numpy.int64)
+            tripDurations = numpy.frombuffer(tripDurations, dtype=numpy.int64)
+            costPrefix = numpy.frombuffer(costPrefix, dtype=numpy.int64)
+        self.rideNumbers = rideNumbers
+        self.rideCosts = rideCosts
+        self.tripDurations = tripDurations
+        self.costPrefix = costPrefix
+        self.stale = False
+        self.ridesScanned = 0
+        self.rebuilds += 1
+
+    # Returns the start and end positions in the columns of every (rideNumber1, rideNumber2) range.
+    # The rides of a range are the ones at positions start to end-1; an empty range has start == end.
+    # Time complexity : O(mlogn) for m ranges
+    def locate(self, ranges):
+        rideNumbers = self.rideNumbers
+        if numpy is not None:
+            bounds = numpy.array(ranges, dtype=numpy.int64).reshape(-1, 2)
+            starts = numpy.searchsorted(rideNumbers, bounds[:, 0], "left")
+            ends = numpy.maximum(starts, numpy.searchsorted(rideNumbers, bounds[:, 1], "right"))
+            return starts, ends
+        bisect_left = bisect.bisect_left
+        bisect_right = bisect.bisect_right
+        starts = [bisect_left(rideNumbers, rideNumber1) for rideNumber1, rideNumber2 in ranges]
+        ends = [max(start, bisect_right(rideNumbers, rideNumber2))
+                for start, (rideNumber1, rideNumber2) in zip(starts, ranges)]
+        return starts, ends
+
+    # Returns the number of rides in every range
+    # Time complexity : O(mlogn) for m ranges
+    def countRanges(self, ranges):
+        starts, ends = self.locate(ranges)
+        if numpy is not None:
+            return (ends - starts).tolist()
+        return [end - start for start, end in zip(starts, ends)]
+
+    # Returns the sum of the rideCosts of the rides in every range
+    # Time complexity : O(mlogn) for m ranges
+    def sumCostRanges(self, ranges):
+        starts, ends = self.locate(ranges)
+        costPrefix = self.costPrefix
+        if numpy is not None:
+            return (costPrefix[ends] - costPrefix[starts]).tolist()
+        return [costPrefix[end] - costPrefix[start] for start, end in zip(starts, ends)]
+
+    # Returns the output line of Print(rideNumber1, rideNumber2), without the newline, for every range
+    # Time complexity : O(mlogn + S) where S is the number of rides in the ranges
+    def formatRanges(self, ranges):
+        starts, ends = self.locate(ranges)
+        if numpy is not None:
+            starts = starts.tolist()
+            ends = ends.tolist()
+        formatted = self.formatted
+        return [",".join(formatted[start:end]) if end > start else "(0,0,0)" for start, end in zip(starts, ends)]
+
+    # Returns the (rideNumber, rideCost, tripDuration) values of the rides of every range, interleaved in one int64
+    # array per range, as the RIDES records of binary_format hold them
+    # Time complexity : O(mlogn + S) where S is the number of rides in the ranges
+    def rangeValues(self, ranges):
+        starts, ends = self.locate(ranges)
+        if numpy is not None:
+            starts = starts.tolist()
+            ends = ends.tolist()
+        columns = (self.rideNumbers, self.rideCosts, self.tripDurations)
+        rangeValues = []
+        for start, end in zip(starts, ends):
+            if numpy is not None:
+                values = numpy.empty(3 * (end - start), dtype=numpy.int64)
+            else:
+                values = array("q", bytes(24 * (end - start)))
+            for offset, column in enumerate(columns):
+                values[offset::3] = column[start:end]
+            rangeValues.append(values)
+        return rangeValues
@@ -0,0 +1,40 @@
+# Converts between the text formats of gatorTaxi and the binary formats of binary_format.py
+# Usage: python3 convert_commands.py encode input.txt input.bin      text commands to a binary command file
+#        python3 convert_commands.py decode input.bin input.txt      binary command file back to text commands
+#        python3 convert_commands.py results output.bin output.txt   binary results to the text gatorTaxi writes
+
+import argparse
+import sys
+
+import binary_format
+import gatorTaxi
+
+
+# Returns the text line of a parsed command, which parses back to the same command
+def formatCommand(opcode, args):
+    name = "Print" if opcode == gatorTaxi.OP_PRINT_RANGE else gatorTaxi.OPCODE_NAMES[opcode]
+    return "%s(%s)\n" % (name, ",".join(map(str, args)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert Gator Taxi commands and results between text and binary")
+    parser.add_argument("mode", choices=("encode", "decode", "results"))
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args(argv)
+
+    if args.mode == "encode":
+        with open(args.source, "r") as textFile:
+            count = binary_format.writeCommands(args.destination, map(gatorTaxi.parseCommand, textFile))
+        print("Wrote %d commands to %s" % (count, args.destination), file=sys.stderr)
+    elif args.mode == "decode":
+        with open(args.destination, "w") as textFile:
+            for opcode, commandArgs in binary_format.readCommands(args.source):
+                textFile.write(formatCommand(opcode, commandArgs))
+    else:
+        with open(args.destination, "w") as textFile:
+            textFile.writelines(binary_format.formatResults(args.source))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# d-ary Min Heap stores nodes according to their rideCost, with arity children per node
+#
+# The list layout, the dummy node at index 0, the listIdx handles and every operation that only moves nodes through
+# heapifyUpwards/heapifyDownwards are inherited from min_heap.MinHeap. With 1-based indices the children of node i
+# are at arity*(i-1)+2 ... arity*i+1 and its parent is at (i-2)//arity+1.
+# A 4-ary heap is half as tall as a binary heap, so heapifying upwards (insert, smaller keys) visits half as many
+# levels, while heapifying downwards compares up to 4 children per level.
+
+import heapq
+
+import min_heap
+
+
+class DaryHeap(min_heap.MinHeap):
+    def __init__(self, arity=4):
+        super().__init__()
+        self.arity = arity
+
+    # Moves the value up in the tree to maintain the heap property, shifting larger parents down into the hole.
+    # Time complexity: O(log_d n)
+    def heapifyUpwards(self, i):
+        arity = self.arity
+        heapNodesList = self.heapNodesList
+        node = heapNodesList[i]
+        rideCost = node.rideCost
+        tripDuration = node.tripDuration
+        levels = 0
+        while i > 1:
+            parentIdx = (i - 2) // arity + 1
+            parent = heapNodesList[parentIdx]
+            parentCost = parent.rideCost
+            if rideCost < parentCost or (rideCost == parentCost and tripDuration < parent.tripDuration):
+                heapNodesList[i] = parent
+                parent.listIdx = i
+                i = parentIdx
+                levels += 1
+            else:
+                break
+        heapNodesList[i] = node
+        node.listIdx = i
+        if self.metrics is not None:
+            self.metrics.recordSiftUp(levels)
+
+    # Moves the value down in the tree to maintain the heap property, shifting the smallest of the children up
+    # into the hole.
+    # Time complexity: O(d log_d n)
+    def heapifyDownwards(self, i):
+        arity = self.arity
+        heapNodesList = self.heapNodesList
+        heapSize = self.currentHeapSize
+        node = heapNodesList[i]
+        rideCost = node.rideCost
+        tripDuration = node.tripDuration
+        levels = 0
+        firstChildIdx = arity * (i - 1) + 2
+        while firstChildIdx <= heapSize:
+            # Find the smallest child
+            childIdx = idx = firstChildIdx
+            child = heapNodesList[childIdx]
+            childCost = child.rideCost
+            # Iterating over a slice is cheaper than indexing every sibling
+            for other in heapNodesList[firstChildIdx + 1:firstChildIdx + arity]:
+                idx += 1
+                otherCost = other.rideCost
+                if otherCost < childCost or (otherCost == childCost and other.tripDuration < child.tripDuration):
+                    childIdx = idx
+                    child = other
+                    childCost = otherCost
+            if childCost < rideCost or (childCost == rideCost and child.tripDuration < tripDuration):
+                heapNodesList[i] = child
+                child.listIdx = i
+                i = childIdx
+                firstChildIdx = arity * (i - 1) + 2
+                levels += 1
+            else:
+                break
+        heapNodesList[i] = node
+        node.listIdx = i
+        if self.metrics is not None:
+            self.metrics.recordSiftDown(levels)
+
+    # Restores the heap property of the whole list bottom-up, starting from the parent of the last node.
+    # Time complexity : O(n)
+    def heapify(self):
+        if self.currentHeapSize > 1:
+            for i in range((self.currentHeapSize - 2) // self.arity + 1, 0, -1):
+                self.heapifyDownwards(i)
+
+    # Returns the k nodes with the smallest (rideCost, tripDuration) in ascending order without changing the heap,
+    # using a frontier of candidate indices like MinHeap.peekSmallest.
+    # Time complexity : O(dklog(dk))
+    def peekSmallest(self, k):
+        arity = self.arity
+        heapNodesList = self.heapNodesList
+        heapSize = self.currentHeapSize
+        smallest = []
+        if heapSize == 0 or k < 1:
+            return smallest
+        root = heapNodesList[1]
+        frontier = [(root.rideCost, root.tripDuration, 1)]
+        while frontier and len(smallest) < k:
+            i = heapq.heappop(frontier)[2]
+            smallest.append(heapNodesList[i])
+            firstChildIdx = arity * (i - 1) + 2
+            for childIdx in range(firstChildIdx, min(firstChildIdx + arity, heapSize + 1)):
+                child = heapNodesList[childIdx]
+                heapq.heappush(frontier, (child.rideCost, child.tripDuration, childIdx))
+        return smallest
@@ -0,0 +1,425 @@
+# Differential fuzzer for CabService
+#
+# Replays seeded random command streams against a CabService and against ReferenceCabService, a dict-based model of
+# the specification, and compares the output of every command. GetNextRide may return any of the rides with the
+# smallest (rideCost, tripDuration), so its result is checked against all of them. The streams alternate between
+# growing and draining phases to stress delete rebalancing.
+# Every checkEvery commands the full invariant check runs and the tree height is compared with log2(n+1). A tree
+# taller than maxHeightRatio*log2(n+1) is reported as a height regression.
+# With a print cache every Print goes through it, so a missed invalidation shows up as a stale Print result.
+# With --columnar the range queries go through the batch methods of CabService, so a stale columnar snapshot shows
+# up the same way, and every COLUMNAR_CHECK_EVERY commands a batch of ranges is answered by columnar snapshots with
+# and without NumPy and compared with one Print(rideNumber1, rideNumber2) per range. With --ttl rides expire as AdvanceClock commands move the logical clock. With --versioned the
+# CabService publishes read versions, which the invariant check compares with the tree. With --wal every mutation
+# is logged, a checkpoint is written in the middle of every phase, and at the end of every phase a CabService
+# recovered from the checkpoint and the log tail must hold exactly the rides of the live tree and heap.
+#
+# Usage: python3 fuzz_service.py [--seeds 10] [--commands 10000] [--max-rides 1000] [--check-every 1]
+#                                [--max-height-ratio 2.0] [--heap binary|4-ary|pairing] [--print-cache N]
+#                                [--columnar] [--ttl TICKS] [--versioned] [--wal]
+
+import argparse
+import io
+import math
+import os
+import random
+import sys
+import tempfile
+
+import columnar_snapshot
+import gatorTaxi
+import invariant_checker
+import print_cache
+import write_ahead_log
+
+# Number of commands between two comparisons of the columnar snapshot paths, and ranges per comparison
+COLUMNAR_CHECK_EVERY = 100
+COLUMNAR_CHECK_RANGES = 50
+
+# Relative weights of the commands in the growing and the draining phase
+PHASE_WEIGHTS = [
+    {"Insert": 55, "BulkInsert": 2, "GetNextRide": 10, "CancelRide": 10, "UpdateTrip": 13, "Print": 5, "PrintRange": 5,
+     "CountRange": 2, "SumCostRange": 2, "Rank": 2, "Select": 2, "GetNextRides": 1, "PeekNextRides": 2,
+     "AdvanceClock": 5},
+    {"Insert": 10, "BulkInsert": 0, "GetNextRide": 40, "CancelRide": 30, "UpdateTrip": 10, "Print": 5, "PrintRange": 5,
+     "CountRange": 2, "SumCostRange": 2, "Rank": 2, "Select": 2, "GetNextRides": 4, "PeekNextRides": 2,
+     "AdvanceClock": 5},
+]
+
+# Largest step of the logical clock made by one AdvanceClock command
+MAX_CLOCK_STEP = 20
+
+# Number of commands per phase
+PHASE_LENGTH = 1000
+
+# Maximum number of rides inserted by one bulk insert
+MAX_BULK_SIZE = 200
+
+OPCODES = {"Insert": gatorTaxi.OP_INSERT, "GetNextRide": gatorTaxi.OP_GET_NEXT_RIDE,
+           "CancelRide": gatorTaxi.OP_CANCEL_RIDE, "UpdateTrip": gatorTaxi.OP_UPDATE_TRIP,
+           "Print": gatorTaxi.OP_PRINT, "PrintRange": gatorTaxi.OP_PRINT_RANGE,
+           "CountRange": gatorTaxi.OP_COUNT_RANGE, "SumCostRange": gatorTaxi.OP_SUM_COST_RANGE,
+           "Rank": gatorTaxi.OP_RANK, "Select": gatorTaxi.OP_SELECT,
+           "GetNextRides": gatorTaxi.OP_GET_NEXT_RIDES, "PeekNextRides": gatorTaxi.OP_PEEK_NEXT_RIDES,
+           "AdvanceClock": gatorTaxi.OP_ADVANCE_CLOCK}
+
+
+# The specification as a dict from rideNumber to (rideCost, tripDuration). With a ttl, the deadline of every ride
+# is kept in a second dict and advanceClock drops the rides whose deadline has passed.
+class ReferenceCabService:
+    def __init__(self, ttl=None):
+        self.rides = {}
+        self.ttl = ttl
+        self.deadlines = {}
+        self.clock = 0
+
+    def format(self, rideNumber):
+        rideCost, tripDuration = self.rides[rideNumber]
+        return "(%d,%d,%d)" % (rideNumber, rideCost, tripDuration)
+
+    def insert(self, rideNumber, rideCost, tripDuration):
+        if rideNumber in self.rides:
+            return "Duplicate RideNumber"
+        self.rides[rideNumber] = (rideCost, tripDuration)
+        self.deadlines[rideNumber] = self.clock + (self.ttl or 0)
+        return ""
+
+    def bulkLoad(self, rides):
+        for rideNumber, rideCost, tripDuration in rides:
+            if rideNumber in self.rides:
+                return "Duplicate RideNumber"
+            self.rides[rideNumber] = (rideCost, tripDuration)
+            self.deadlines[rideNumber] = self.clock + (self.ttl or 0)
+        return ""
+
+    def advanceClock(self, now):
+        if self.ttl and now > self.clock:
+            self.clock = now
+            for rideNumber in [rideNumber for rideNumber in self.rides if self.deadlines[rideNumber] <= now]:
+                del self.rides[rideNumber]
+        return ""
+
+    # Returns the set of output lines GetNextRide may produce
+    def nextRideCandidates(self):
+        if not self.rides:
+            return {"No active ride requests\n"}
+        smallest = min(self.rides.values())
+        return {self.format(rideNumber) + "\n" for rideNumber, key in self.rides.items() if key == smallest}
+
+    # Returns the rideNumbers of the rides in an output line of GetNextRides(k) or PeekNextRides(k), or None if the
+    # line does not hold the k rides with the smallest (rideCost, tripDuration) in ascending order. Ties may be in
+    # any order.
+    def acceptedNextRides(self, output, k):
+        if not self.rides:
+            return [] if output == "No active ride requests\n" else None
+        smallest = sorted(self.rides.values())[:max(k, 0)]
+        if not smallest:
+            return [] if output == "(0,0,0)\n" else None
+        rides = [tuple(map(int, ride.strip("()").split(","))) for ride in output.rstrip("\n").split("),(")]
+        rideNumbers = [ride[0] for ride in rides]
+        if len(set(rideNumbers)) != len(rides) or [ride[1:] for ride in rides] != smallest:
+            return None
+        if any(self.rides.get(rideNumber) != (rideCost, tripDuration) for rideNumber, rideCost, tripDuration in rides):
+            return None
+        return rideNumbers
+
+    def cancelRide(self, rideNumber):
+        self.rides.pop(rideNumber, None)
+        return ""
+
+    def updateTrip(self, rideNumber, newTripDuration):
+        if rideNumber in self.rides:
+            rideCost, tripDuration = self.rides[rideNumber]
+            if newTripDuration > 2 * tripDuration:
+                del self.rides[rideNumber]
+            elif newTripDuration > tripDuration:
+                self.rides[rideNumber] = (rideCost + 10, newTripDuration)
+            else:
+                self.rides[rideNumber] = (rideCost, newTripDuration)
+        return ""
+
+    def print(self, rideNumber):
+        return (self.format(rideNumber) if rideNumber in self.rides else "(0,0,0)") + "\n"
+
+    def printRange(self, rideNumber1, rideNumber2):
+        found = [self.format(rideNumber) for rideNumber in sorted(self.rides)
+                 if rideNumber1 <= rideNumber <= rideNumber2]
+        return (",".join(found) if found else "(0,0,0)") + "\n"
+
+    def countRange(self, rideNumber1, rideNumber2):
+        return "%d\n" % sum(1 for rideNumber in self.rides if rideNumber1 <= rideNumber <= rideNumber2)
+
+    def sumCostRange(self, rideNumber1, rideNumber2):
+        return "%d\n" % sum(rideCost for rideNumber, (rideCost, tripDuration) in self.rides.items()
+                            if rideNumber1 <= rideNumber <= rideNumber2)
+
+    def rank(self, rideNumber):
+        return "%d\n" % sum(1 for key in self.rides if key <= rideNumber)
+
+    def select(self, k):
+        rideNumbers = sorted(self.rides)
+        return (self.format(rideNumbers[k - 1]) if 1 <= k <= len(rideNumbers) else "(0,0,0)") + "\n"
+
+
+# Yields (name, args) commands. rideNumbers are drawn from a range twice as large as maxRides, so that
+# duplicates and misses are common.
+def generateCommands(rng, numberOfCommands, maxRides):
+    maxRideNumber = 2 * maxRides
+    clock = 0
+    for i in range(numberOfCommands):
+        weights = PHASE_WEIGHTS[(i // PHASE_LENGTH) % len(PHASE_WEIGHTS)]
+        name = rng.choices(list(weights), list(weights.values()))[0]
+        rideNumber = rng.randint(1, maxRideNumber)
+        if name == "Insert":
+            yield name, (rideNumber, rng.randint(1, 50), rng.randint(1, 50))
+        elif name == "BulkInsert":
+            yield name, ([(key, rng.randint(1, 50), rng.randint(1, 50))
+                          for key in rng.sample(range(1, maxRideNumber + 1), rng.randint(1, min(MAX_BULK_SIZE, maxRideNumber)))],)
+        elif name == "GetNextRide":
+            yield name, ()
+        elif name == "UpdateTrip":
+            yield name, (rideNumber, rng.randint(1, 100))
+        elif name in ("PrintRange", "CountRange", "SumCostRange"):
+            yield name, (rideNumber, rideNumber + rng.randint(-10, maxRideNumber // 10))
+        elif name == "Select":
+            yield name, (rng.randint(0, maxRides),)
+        elif name in ("GetNextRides", "PeekNextRides"):
+            yield name, (rng.choice((0, 1, 5, 50, maxRides // 4, maxRides)),)
+        elif name == "AdvanceClock":
+            clock += rng.randint(0, MAX_CLOCK_STEP)
+            yield name, (clock,)
+        else:
+            yield name, (rideNumber,)
+
+
+# Returns the (rideNumber, rideCost, tripDuration) of the rides in the tree and in the heap of service, both sorted
+def rideSets(service):
+    treeRides = [(node.rideNumber, node.rideCost, node.tripDuration) for node in service.redBlack.nodes()]
+    heapRides = sorted((node.rideNumber, node.rideCost, node.tripDuration)
+                       for node in service.minHeap.nodesInHeapOrder())
+    return treeRides, heapRides
+
+
+# Recovers a CabService from the snapshot at snapshotPath and the write-ahead log at walPath, which service logs to.
+# Returns None if the recovered service is consistent and holds exactly the rides of service, else an error message.
+def checkRecovery(service, snapshotPath, walPath, heap):
+    service.wal.sync()
+    recovered = gatorTaxi.CabService.recover(snapshotPath, walPath, io.StringIO(), heap=heap)
+    recovered.wal.close()
+    try:
+        invariant_checker.checkService(recovered)
+    except invariant_checker.InvariantError as error:
+        return "recovered service: %s" % error
+    liveTree, liveHeap = rideSets(service)
+    recoveredTree, recoveredHeap = rideSets(recovered)
+    if recoveredTree != liveTree or recoveredHeap != liveHeap:
+        missing = sorted(set(liveTree) - set(recoveredTree))
+        extra = sorted(set(recoveredTree) - set(liveTree))
+        return "recovered %d rides, live %d; missing %r, extra %r" % (
+            len(recoveredTree), len(liveTree), missing[:3], extra[:3])
+    return None
+
+
+# Answers ranges, a list of (rideNumber1, rideNumber2), from columnar snapshots of the rides of service, one built
+# with NumPy if it is installed and one with array columns. Their Print lines, typed ride values, counts and cost
+# sums must equal what service writes for one range at a time from the RBTree.
+# Returns None if they do, else an error message.
+def checkColumnarPaths(service, ranges):
+    previousOut = service.out
+    output = io.StringIO()
+    service.setOutput(output)
+    try:
+        for rideNumber1, rideNumber2 in ranges:
+            service.printRange(rideNumber1, rideNumber2)
+    finally:
+        service.setOutput(previousOut)
+    expectedLines = output.getvalue().split("\n")[:-1]
+    redBlack = service.redBlack
+    expectedValues = [[value for node in redBlack.iter_range(rideNumber1, rideNumber2)
+                       for value in (node.rideNumber, node.rideCost, node.tripDuration)]
+                      for rideNumber1, rideNumber2 in ranges]
+    expectedCounts = [redBlack.count_range(rideNumber1, rideNumber2) for rideNumber1, rideNumber2 in ranges]
+    expectedSums = [redBlack.sum_cost_range(rideNumber1, rideNumber2) for rideNumber1, rideNumber2 in ranges]
+
+    paths = [("array", None)]
+    if columnar_snapshot.numpy is not None:
+        paths.insert(0, ("numpy", columnar_snapshot.numpy))
+    savedNumpy = columnar_snapshot.numpy
+    try:
+        for pathName, numpyModule in paths:
+            columnar_snapshot.numpy = numpyModule
+            columnar = columnar_snapshot.ColumnarSnapshot()
+            columnar.rebuild(redBlack.nodes())
+            got = {"Print lines": columnar.formatRanges(ranges),
+                   "ride values": [list(values) for values in columnar.rangeValues(ranges)],
+                   "counts": columnar.countRanges(ranges),
+                   "cost sums": columnar.sumCostRanges(ranges)}
+            expected = {"Print lines": expectedLines, "ride values": expectedValues, "counts": expectedCounts,
+                        "cost sums": expectedSums}
+            for name in got:
+                for j, (gotResult, expectedResult) in enumerate(zip(got[name], expected[name])):
+                    if gotResult != expectedResult:
+                        return "%s columnar %s of range %r: got %r, expected %r" % (
+                            pathName, name, ranges[j], str(gotResult)[:100], str(expectedResult)[:100])
+                if len(got[name]) != len(ranges):
+                    return "%s columnar %s: %d results for %d ranges" % (pathName, name, len(got[name]), len(ranges))
+    finally:
+        columnar_snapshot.numpy = savedNumpy
+    return None
+
+
+# Runs one seeded command stream. Returns a dict with the results; "error" is None if no difference and no
+# invariant violation was found. A printCacheCapacity above 0 gives the CabService a print cache of that size,
+# columnar a columnar snapshot, ttl a ride TTL and versioned read versions. With wal the mutations are logged, a
+# checkpoint is written in the middle of every phase and recovery is checked at the end of every phase.
+def fuzz(seed, numberOfCommands, maxRides, checkEvery, maxHeightRatio, heap="binary", printCacheCapacity=0,
+         columnar=False, ttl=None, versioned=False, wal=False):
+    if wal:
+        with tempfile.TemporaryDirectory() as tmpDir:
+            return runFuzz(seed, numberOfCommands, maxRides, checkEvery, maxHeightRatio, heap, printCacheCapacity,
+                           columnar, ttl, versioned, tmpDir)
+    return runFuzz(seed, numberOfCommands, maxRides, checkEvery, maxHeightRatio, heap, printCacheCapacity,
+                   columnar, ttl, versioned, None)
+
+
+# Runs the command stream of fuzz. If walDir is given, the write-ahead log is kept there.
+def runFuzz(seed, numberOfCommands, maxRides, checkEvery, maxHeightRatio, heap, printCacheCapacity, columnar, ttl,
+            versioned, walDir):
+    rng = random.Random(seed)
+    output = io.StringIO()
+    printCache = print_cache.PrintCache(printCacheCapacity) if printCacheCapacity else None
+    service = gatorTaxi.CabService(output, heap=heap, printCache=printCache, columnar=columnar, ttl=ttl,
+                                   versioned=versioned)
+    walPath = snapshotPath = None
+    if walDir is not None:
+        walPath = os.path.join(walDir, "fuzz.wal")
+        snapshotPath = os.path.join(walDir, "fuzz.snapshot")
+        # Synced explicitly before every recovery check
+        service.wal = write_ahead_log.WriteAheadLog(walPath, syncEveryOps=1 << 30, syncIntervalMs=1e9)
+    engine = gatorTaxi.CommandEngine(service)
+    rangeBatches = {"PrintRange": service.printRanges, "CountRange": service.countRanges,
+                    "SumCostRange": service.sumCostRanges} if columnar else {}
+    reference = ReferenceCabService(ttl)
+    result = {"seed": seed, "commands": 0, "maxRides": 0, "maxHeight": 0, "worstHeightRatio": 0.0, "error": None}
+    for i, (name, args) in enumerate(generateCommands(rng, numberOfCommands, maxRides)):
+        output.seek(0)
+        output.truncate()
+        if name == "BulkInsert":
+            service.bulk_load(args[0])
+            expected = {reference.bulkLoad(args[0])}
+        else:
+            if name in rangeBatches:
+                rangeBatches[name]([args])
+            else:
+                engine.execute(OPCODES[name], args)
+            if name == "GetNextRide":
+                expected = reference.nextRideCandidates()
+            elif name in ("GetNextRides", "PeekNextRides"):
+                expected = {"the %d smallest rides" % args[0]}
+            else:
+                method = {"Insert": reference.insert, "CancelRide": reference.cancelRide,
+                          "UpdateTrip": reference.updateTrip, "Print": reference.print,
+                          "PrintRange": reference.printRange, "CountRange": reference.countRange,
+                          "SumCostRange": reference.sumCostRange, "Rank": reference.rank,
+                          "Select": reference.select, "AdvanceClock": reference.advanceClock}[name]
+                expected = {method(*args)}
+        got = output.getvalue()
+        result["commands"] = i + 1
+        if name in ("GetNextRides", "PeekNextRides"):
+            rideNumbers = reference.acceptedNextRides(got, args[0])
+            if rideNumbers is not None:
+                expected = {got}
+                if name == "GetNextRides":
+                    for rideNumber in rideNumbers:
+                        del reference.rides[rideNumber]
+        if got not in expected:
+            result["error"] = "command %d %s%r: got %r, expected one of %r" % (
+                i + 1, name, args, got[:200], sorted(expected)[:3])
+            return result
+        if name == "GetNextRide" and reference.rides:
+            del reference.rides[int(got[1:got.index(",")])]
+
+        if (i + 1) % checkEvery == 0:
+            try:
+                count, height = invariant_checker.checkService(service)
+            except invariant_checker.InvariantError as error:
+                result["error"] = "command %d %s%r: %s" % (i + 1, name, args, error)
+                return result
+            if count != len(reference.rides):
+                result["error"] = "command %d: %d rides, expected %d" % (i + 1, count, len(reference.rides))
+                return result
+            result["maxRides"] = max(result["maxRides"], count)
+            result["maxHeight"] = max(result["maxHeight"], height)
+            if count:
+                ratio = height / math.log2(count + 1)
+                result["worstHeightRatio"] = max(result["worstHeightRatio"], ratio)
+                if ratio > maxHeightRatio:
+                    result["error"] = "command %d: height regression, height %d for %d rides (%.2f*log2(n+1))" % (
+                        i + 1, height, count, ratio)
+                    return result
+
+        if columnar and (i + 1) % COLUMNAR_CHECK_EVERY == 0:
+            # A separate generator, so that the command stream of the seed stays the same
+            rangeRng = random.Random(seed * 1000003 + i)
+            ranges = [(rideNumber, rideNumber + rangeRng.randint(-10, maxRides // 5))
+                      for rideNumber in (rangeRng.randint(0, 2 * maxRides + 1) for _ in range(COLUMNAR_CHECK_RANGES))]
+            ranges.append((0, 2 * maxRides + 1))
+            error = checkColumnarPaths(service, ranges)
+            if error is not None:
+                result["error"] = "command %d: %s" % (i + 1, error)
+                return result
+
+        if walPath is not None and (i + 1) % PHASE_LENGTH == PHASE_LENGTH // 2:
+            service.checkpoint(snapshotPath)
+        if walPath is not None and ((i + 1) % PHASE_LENGTH == 0 or i + 1 == numberOfCommands):
+            error = checkRecovery(service, snapshotPath, walPath, heap)
+            if error is not None:
+                result["error"] = "command %d: %s" % (i + 1, error)
+                return result
+    if walPath is not None:
+        service.wal.close()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Differential fuzzer for CabService")
+    parser.add_argument("--seeds", type=int, default=10, help="number of seeds to run, starting at --first-seed")
+    parser.add_argument("--first-seed", type=int, default=1)
+    parser.add_argument("--commands", type=int, default=10000, help="commands per seed")
+    parser.add_argument("--max-rides", type=int, default=1000, help="rideNumbers are drawn from [1, 2*max-rides]")
+    parser.add_argument("--check-every", type=int, default=1,
+                        help="run the full invariant check every N commands")
+    parser.add_argument("--max-height-ratio", type=float, default=2.0,
+                        help="report trees taller than this times log2(n+1) as a height regression")
+    parser.add_argument("--heap", choices=sorted(gatorTaxi.HEAP_BACKENDS), default="binary",
+                        help="priority queue backend of the CabService")
+    parser.add_argument("--print-cache", type=int, default=0, metavar="N",
+                        help="give the CabService a print cache of N entries")
+    parser.add_argument("--columnar", action="store_true",
+                        help="give the CabService a columnar snapshot and send range queries through its batch methods")
+    parser.add_argument("--ttl", type=int, default=0, metavar="TICKS",
+                        help="let rides expire TICKS ticks of the logical clock after their insert")
+    parser.add_argument("--versioned", action="store_true",
+                        help="let the CabService publish read versions and check them against the tree")
+    parser.add_argument("--wal", action="store_true",
+                        help="log every mutation, checkpoint in the middle of every phase and check the state "
+                             "recovered from the checkpoint and the log after every phase")
+    args = parser.parse_args(argv)
+    if args.columnar and columnar_snapshot.numpy is None:
+        print("NumPy is not installed, the columnar snapshots are only checked with array columns", file=sys.stderr)
+
+    failures = 0
+    for seed in range(args.first_seed, args.first_seed + args.seeds):
+        result = fuzz(seed, args.commands, args.max_rides, args.check_every, args.max_height_ratio, args.heap,
+                      args.print_cache, args.columnar, args.ttl or None, args.versioned,
+                      args.wal)
+        print("seed=%d commands=%d maxRides=%d maxHeight=%d worstHeightRatio=%.2f %s" % (
+            seed, result["commands"], result["maxRides"], result["maxHeight"], result["worstHeightRatio"],
+            "OK" if result["error"] is None else "FAIL " + result["error"]))
+        if result["error"] is not None:
+            failures += 1
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,292 @@
 # This is the main driver program
 
+import argparse
+import binary_format
+import columnar_snapshot
+import contextlib
+import dary_heap
+import gc
+import invariant_checker
+import metrics as metricsModule
 import min_heap
+import os
+import pairing_heap
+import print_cache
 import red_black_tree
+import ride_versions
+import snapshot
 import sys
+import time
+import timer_wheel
+import write_ahead_log
+from array import array
+
+# Number of rides formatted per write() call when streaming a range of rides
+WRITE_CHUNK_SIZE = 1024
+
+
+# Pauses the cyclic garbage collector while large batches of long-lived nodes are allocated,
+# so that it does not repeatedly scan the growing structures.
+@contextlib.contextmanager
+def pausedGarbageCollection():
+    gcWasEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gcWasEnabled:
+            gc.enable()
+
+
+# Priority queue backends that CabService can keep the rides in, by name. They share the interface described in
+# min_heap.py.
+HEAP_BACKENDS = {
+    "binary": min_heap.MinHeap,
+    "4-ary": dary_heap.DaryHeap,
+    "pairing": pairing_heap.PairingHeap,
+}
 
 
 class CabService:
-    def __init__(self):
-        self.minHeap = min_heap.MinHeap()
+    # Results are written to out, which defaults to sys.stdout. If out is a binary_format.ResultWriter, rides and
+    # numbers are written to it as typed records instead of being formatted.
+    # If a write_ahead_log.WriteAheadLog is given, every mutation is appended to it before it is applied.
+    # If a metrics.Metrics is given, the RBTree and minHeap record their structural changes in it.
+    # heap names the priority queue backend in HEAP_BACKENDS.
+    # If a print_cache.PrintCache is given, Print(rideNumber) results are served from it and every mutation
+    # invalidates the rideNumbers it touches.
+    # If columnar is True, batches of range queries are answered from a columnar_snapshot.ColumnarSnapshot.
+    # If ttl is set, every ride expires ttl ticks of the logical clock after it was inserted; advanceClock moves the
+    # clock and removes the expired rides.
+    # If versioned is True, every mutation also publishes a new version of the rides in a ride_versions.RideVersions,
+    # from which readView() hands out consistent views that other threads can read while the service goes on.
+    def __init__(self, out=None, wal=None, metrics=None, heap="binary", printCache=None, columnar=False, ttl=None,
+                 versioned=False):
+        self.out = out if out is not None else sys.stdout
+        # The typed output of the results, or None to write them as text
+        self.results = out if isinstance(out, binary_format.ResultWriter) else None
+        self.wal = wal
+        self.metrics = metrics
+        self.printCache = printCache
+        self.columnar = columnar_snapshot.ColumnarSnapshot() if columnar else None
+        self.ttl = ttl
+        self.expiry = timer_wheel.TimerWheel() if ttl else None
+        self.ridesExpired = 0
+        self.versions = ride_versions.RideVersions() if versioned else None
+        self.heapBackend = HEAP_BACKENDS[heap]
+        self.minHeap = self.heapBackend()
         self.redBlack = red_black_tree.RedBlackTree()
+        self.minHeap.metrics = self.redBlack.metrics = metrics
+
+    # Returns the number of active rides
+    def size(self):
+        return self.minHeap.currentHeapSize
+
+    # Returns the height of the RBTree
+    # Time complexity = O(n)
+    def height(self):
+        return self.redBlack.height()
+
+    # Makes out the output of the results, as the out argument of the constructor does. The print cache holds what
+    # Print writes, a text line or the values of a typed record, so it is cleared when the kind of output changes.
+    def setOutput(self, out):
+        results = out if isinstance(out, binary_format.ResultWriter) else None
+        if (results is None) != (self.results is None) and self.printCache is not None:
+            self.printCache.clear()
+        self.out = out
+        self.results = results
 
     # Searches for the ride with given rideNumber in RBTree and prints its details. If such a ride is not found, prints (0,0,0)
-    # Time complexity = O(logn) as search in RBTree is O(logn)
+    # With a printCache, a cached line is written without searching and a searched line is cached.
+    # Time complexity = O(logn) as search in RBTree is O(logn), O(1) on a cache hit
     def print(self, rideNumber):
+        if self.results is not None:
+            self.printRecord(rideNumber)
+            return
+        printCache = self.printCache
+        if printCache is not None:
+            line = printCache.get(rideNumber)
+            if line is not None:
+                self.out.write(line)
+                return
+        result = self.redBlack.search(rideNumber, self.redBlack.getRoot())
+        if result != None:
+            line = "(%d,%d,%d)\n" % (result.rideNumber,
+                                     result.rideCost, result.tripDuration)
+        else:
+            line = "(0,0,0)\n"
+        self.out.write(line)
+        if printCache is not None:
+            printCache.put(rideNumber, line)
+
+    # Print for typed results: writes the ride as a record, caching its (rideNumber, rideCost, tripDuration)
+    def printRecord(self, rideNumber):
+        printCache = self.printCache
+        if printCache is not None:
+            ride = printCache.get(rideNumber)
+            if ride is not None:
+                self.results.writeRide(*ride)
+                return
         result = self.redBlack.search(rideNumber, self.redBlack.getRoot())
         if result != None:
-            print("(" + str(result.rideNumber) + "," +
-                  str(result.rideCost) + "," + str(result.tripDuration) + ")", end="\n")
+            ride = (result.rideNumber, result.rideCost, result.tripDuration)
         else:
-            print("(0,0,0)")
+            ride = (0, 0, 0)
+        self.results.writeRide(*ride)
+        if printCache is not None:
+            printCache.put(rideNumber, ride)
 
     # Searches for all the rides with ride numbers lying between rideNumber1 and rideNumber2 in RBTree.
     # Prints the details of all the rides found in ascending order of rideNums.
     # Time complexity = O(logn+S) where S is the number of rides in range.
     def printRange(self, rideNumber1, rideNumber2):
-        res = self.redBlack.printRange(
-            self.redBlack.getRoot(), rideNumber1, rideNumber2, [])
-        if len(res) == 0:
-            print("(0,0,0)")
+        self.writeRides(self.redBlack.iter_range(rideNumber1, rideNumber2))
+
+    # Prints the number of rides with rideNumber between rideNumber1 and rideNumber2, using the subtree sizes of the RBTree
+    # Time complexity = O(logn)
+    def countRange(self, rideNumber1, rideNumber2):
+        self.writeNumber(self.redBlack.count_range(rideNumber1, rideNumber2))
+
+    # Prints the sum of the rideCosts of the rides with rideNumber between rideNumber1 and rideNumber2
+    # Time complexity = O(logn)
+    def sumCostRange(self, rideNumber1, rideNumber2):
+        self.writeNumber(self.redBlack.sum_cost_range(rideNumber1, rideNumber2))
+
+    # Prints the number of rides with a rideNumber smaller than or equal to rideNumber
+    # Time complexity = O(logn)
+    def rank(self, rideNumber):
+        self.writeNumber(self.redBlack.rank(rideNumber))
+
+    # Prints the ride with the k-th smallest rideNumber, or (0,0,0) if there are fewer than k rides
+    # Time complexity = O(logn)
+    def select(self, k):
+        result = self.redBlack.select(k)
+        if result is not None:
+            self.writeRide(result.rideNumber, result.rideCost, result.tripDuration)
+        else:
+            self.writeRide(0, 0, 0)
+
+    # Prints the rides of every (rideNumber1, rideNumber2) range of a batch, one line per range as printRange does.
+    # While the columnar snapshot is stale the ranges are answered from the RBTree, until the ranges printed since the
+    # last mutation have visited as many rides as rebuilding the snapshot costs. The snapshot is then rebuilt and
+    # answers the rest of the batch.
+    # Time complexity = O(mlogn+S) where S is the number of rides in the ranges, plus O(n) for a rebuild
+    def printRanges(self, ranges):
+        columnar = self.columnar
+        i = 0
+        if columnar is None or columnar.stale:
+            iter_range = self.redBlack.iter_range
+            size = self.size()
+            while i < len(ranges) and (columnar is None or columnar.ridesScanned < size):
+                ridesWritten = self.writeRides(iter_range(ranges[i][0], ranges[i][1]))
+                if columnar is not None:
+                    columnar.ridesScanned += ridesWritten
+                i += 1
+            if i == len(ranges):
+                return
+            columnar.rebuild(self.redBlack.nodes())
+        if self.results is not None:
+            for values in columnar.rangeValues(ranges[i:]):
+                self.results.writeRides(values)
+            return
+        lines = columnar.formatRanges(ranges[i:])
+        lines.append("")
+        self.out.write("\n".join(lines))
+
+    # Prints the number of rides in every range of a batch. Only an up to date columnar snapshot is used, as the
+    # RBTree answers a count in O(logn) as well.
+    # Time complexity = O(mlogn) for m ranges
+    def countRanges(self, ranges):
+        if self.columnar is None or self.columnar.stale:
+            for rideNumber1, rideNumber2 in ranges:
+                self.countRange(rideNumber1, rideNumber2)
+            return
+        self.writeNumbers(self.columnar.countRanges(ranges))
+
+    # Prints the sum of the rideCosts in every range of a batch, from an up to date columnar snapshot if there is one
+    # Time complexity = O(mlogn) for m ranges
+    def sumCostRanges(self, ranges):
+        if self.columnar is None or self.columnar.stale:
+            for rideNumber1, rideNumber2 in ranges:
+                self.sumCostRange(rideNumber1, rideNumber2)
+            return
+        self.writeNumbers(self.columnar.sumCostRanges(ranges))
+
+    # Writes a result line of one ride
+    def writeRide(self, rideNumber, rideCost, tripDuration):
+        if self.results is not None:
+            self.results.writeRide(rideNumber, rideCost, tripDuration)
+        else:
+            self.out.write("(%d,%d,%d)\n" % (rideNumber, rideCost, tripDuration))
+
+    # Writes a result line of one number
+    def writeNumber(self, value):
+        if self.results is not None:
+            self.results.writeNumber(value)
+        else:
+            self.out.write("%d\n" % value)
+
+    # Writes a result line for every number of a list
+    def writeNumbers(self, values):
+        if self.results is not None:
+            self.results.writeNumbers(values)
+        else:
+            self.out.write("".join(["%d\n" % value for value in values]))
+
+    # Streams the rides of an iterable of nodes to the output as a comma separated line, or (0,0,0) if it is empty.
+    # Rides are formatted in chunks of WRITE_CHUNK_SIZE, so the extra memory does not grow with the number of rides.
+    # With typed results the rides are collected into one record instead.
+    # Returns the number of rides written.
+    def writeRides(self, nodes):
+        if self.results is not None:
+            values = array("q", [value for node in nodes
+                                 for value in (node.rideNumber, node.rideCost, node.tripDuration)])
+            self.results.writeRides(values)
+            return len(values) // 3
+        write = self.out.write
+        chunk = []
+        separator = ""
+        count = 0
+        for node in nodes:
+            chunk.append("(%d,%d,%d)" %
+                         (node.rideNumber, node.rideCost, node.tripDuration))
+            if len(chunk) == WRITE_CHUNK_SIZE:
+                write(separator)
+                write(",".join(chunk))
+                count += WRITE_CHUNK_SIZE
+                chunk.clear()
+                separator = ","
+        if chunk:
+            write(separator)
+            write(",".join(chunk))
+        elif not separator:
+            write("(0,0,0)")
+        write("\n")
+        return count + len(chunk)
+
+    # Drops the cached Print line of rideNumber and marks the columnar snapshot stale after the ride was inserted,
+    # changed or removed
+    def rideChanged(self, rideNumber):
+        if self.printCache is not None:
+            self.printCache.invalidate(rideNumber)
+        if self.columnar is not None:
+            self.columnar.invalidate()
+
+    # Publishes the removal of a batch of rides, given as nodes with a rideNumber, to the read versions. Like the
+    # batch deletes of the RBTree, a batch that is a large part of the rides rebuilds the versions from the RBTree.
+    # Time complexity = O(min(n, mlogn))
+    def versionsRemoved(self, nodes):
+        if self.versions is None:
+            return
+        if len(nodes) * red_black_tree.BATCH_REBUILD_FACTOR < self.size():
+            for node in nodes:
+                self.versions.delete(node.rideNumber)
         else:
-            res.sort()
-            resStr = str(res)
-            resStr = resStr.replace('[', '')
-            resStr = resStr.replace(']', '')
-            resStr = resStr.replace(' ', '')
-            print(resStr)
+            self.versions.rebuild(self.redBlack.nodes())
+
+    # Returns a ride_versions.ReadView of the rides as they are now. Requires a versioned service.
+    def readView(self):
+        return self.versions.view()
 
     # Inserts node in both RBTree and minHeap. Connects the inserted nodes by pointers.
     # If node with same rideNum already present, the program is terminated.
@@ -42,28 +294,161 @@ class CabService:
     def insert(self, rideNumber, rideCost, tripDuration):
         res = self.redBlack.search(rideNumber, self.redBlack.getRoot())
         if res:
-            print("Duplicate RideNumber", end="")
+            self.out.write("Duplicate RideNumber")
             return False
         else:
+            if self.wal is not None:
+                self.wal.append(write_ahead_log.INSERT,
+                                rideNumber, rideCost, tripDuration)
             rbtNode = self.redBlack.insert(rideNumber, rideCost, tripDuration)
             minHeapNode = self.minHeap.insert(
                 rideNumber, rideCost, tripDuration, rbtNode)
             rbtNode.minHeapNode = minHeapNode
+            self.rideChanged(rideNumber)
+            if self.versions is not None:
+                self.versions.insert(rideNumber, rideCost, tripDuration)
+            if self.expiry is not None:
+                rbtNode.deadline = self.expiry.now + self.ttl
+                self.expiry.schedule(rbtNode.deadline, rideNumber)
             return True
 
+    # Inserts a batch of rides given as (rideNumber, rideCost, tripDuration) tuples in one pass.
+    # Rides are accepted in order until the first rideNumber that is already present in the RBTree or earlier in the
+    # batch. The accepted rides are sorted, the RBTree is rebuilt balanced from the sorted nodes and the minHeap is
+    # heapified bottom-up, after which the nodes of both structures are connected by pointers.
+    # Returns False if a duplicate was found, just like insert().
+    # Time complexity = O(n+m) for m rides, plus O(mlogm) for the sort and O(mlogn) duplicate checks if the tree is not empty.
+    def bulk_load(self, rides):
+        checkTree = self.redBlack.getRoot() is not self.redBlack.TNULL
+        seen = set()
+        accepted = []
+        duplicate = False
+        for ride in rides:
+            rideNumber = ride[0]
+            if rideNumber in seen or (checkTree and self.redBlack.search(rideNumber, self.redBlack.getRoot()) is not None):
+                duplicate = True
+                break
+            seen.add(rideNumber)
+            accepted.append(ride)
+
+        if accepted:
+            if self.wal is not None:
+                for rideNumber, rideCost, tripDuration in accepted:
+                    self.wal.append(write_ahead_log.INSERT,
+                                    rideNumber, rideCost, tripDuration)
+            with pausedGarbageCollection():
+                accepted.sort()
+                rbtNodes = self.redBlack.bulkInsert(accepted)
+                minHeapNodes = self.minHeap.bulkInsert(
+                    [(node.rideNumber, node.rideCost, node.tripDuration, node) for node in rbtNodes])
+                for rbtNode, minHeapNode in zip(rbtNodes, minHeapNodes):
+                    rbtNode.minHeapNode = minHeapNode
+            for ride in accepted:
+                self.rideChanged(ride[0])
+            if self.versions is not None:
+                self.versions.rebuild(self.redBlack.nodes())
+            if self.expiry is not None:
+                self.scheduleExpiry(rbtNodes)
+
+        if duplicate:
+            self.out.write("Duplicate RideNumber")
+            return False
+        return True
+
+    # Writes all rides to a binary snapshot file at path, sorted by rideNumber together with the heap order, the
+    # arity of the heap and the sequence number of the next write-ahead log record.
+    # Time complexity = O(n)
+    def save_snapshot(self, path):
+        logSequence = self.wal.sequence if self.wal is not None else 0
+        snapshot.write(path, self.redBlack.nodes(), self.minHeap.nodesInHeapOrder(),
+                       logSequence, self.minHeap.arity)
+
+    # Replaces all rides with the ones in the snapshot file at path. The file is memory-mapped, the RBTree is built
+    # balanced from the sorted records and the minHeap is restored in its saved order without heapifying if it was
+    # saved by an array heap of the same arity.
+    # Returns the sequence number of the first write-ahead log record that is not contained in the snapshot.
+    # Time complexity = O(n)
+    def load_snapshot(self, path):
+        self.minHeap = self.heapBackend()
+        self.redBlack = red_black_tree.RedBlackTree()
+        self.minHeap.metrics = self.redBlack.metrics = self.metrics
+        if self.printCache is not None:
+            self.printCache.clear()
+        if self.columnar is not None:
+            self.columnar.invalidate()
+        if self.expiry is not None:
+            self.expiry = timer_wheel.TimerWheel(self.expiry.now)
+        with pausedGarbageCollection():
+            return snapshot.read(path, self.restoreRides)
+
+    # Builds both structures from the sorted rides and heap order of a snapshot and connects their nodes.
+    # Snapshots hold no deadlines, so with a TTL every restored ride gets a full TTL from the current clock.
+    def restoreRides(self, rides, heapOrder, heapArity):
+        rbtNodes = self.redBlack.loadSorted(rides)
+        heapNodes = [rbtNodes[idx] for idx in heapOrder]
+        ordered = heapArity != 0 and heapArity == self.minHeap.arity
+        minHeapNodes = self.minHeap.loadHeapOrder(
+            [(node.rideNumber, node.rideCost, node.tripDuration, node) for node in heapNodes], ordered)
+        for rbtNode, minHeapNode in zip(heapNodes, minHeapNodes):
+            rbtNode.minHeapNode = minHeapNode
+        if self.versions is not None:
+            self.versions.rebuild(rbtNodes)
+        if self.expiry is not None:
+            self.scheduleExpiry(rbtNodes)
+
     # Gets the next ride with the minimum rideCost from the minHeap and prints it.
     # Deletes this node from the minHeap and also deletes the corresponding RBTree node by using the pointer available to it in the minHeap node.
+    # The ride is logged as a cancellation of its rideNumber: rides that tie on (rideCost, tripDuration) may be
+    # picked in a different order by the heap a replay builds, so the log names the ride that was removed.
     # If the heap is empty, prints an error message
     # Time complexity = O(logn) as deleting from a minHeap takes O(logn) and deletion from a RBTree also takes O(logn)
     def getNextRide(self):
         minHeapNode = self.minHeap.deleteMin()
 
         if minHeapNode != None:
-            print("(" + str(minHeapNode.rideNumber) + "," +
-                  str(minHeapNode.rideCost) + "," + str(minHeapNode.tripDuration) + ")", end="\n")
+            if self.wal is not None:
+                self.wal.append(write_ahead_log.CANCEL_RIDE, minHeapNode.rideNumber)
+            self.writeRide(minHeapNode.rideNumber, minHeapNode.rideCost, minHeapNode.tripDuration)
             self.redBlack.deleteNode(minHeapNode.RBTNode)
+            minHeapNode.RBTNode.minHeapNode = None
+            self.rideChanged(minHeapNode.rideNumber)
+            if self.versions is not None:
+                self.versions.delete(minHeapNode.rideNumber)
         else:
-            print("No active ride requests")
+            self.out.write("No active ride requests\n")
+
+    # Removes the k rides with the smallest (rideCost, tripDuration) in one batch and prints them as one comma
+    # separated line in that order. The rides are selected by a frontier walk over the heap and deleted from both
+    # structures as a batch, which rebuilds them instead of deleting ride by ride when k is a large part of the rides.
+    # They are logged as cancellations, so that replaying the log removes exactly the same rides.
+    # Time Complexity = O(klogk + min(n, klogn))
+    def getNextRides(self, k):
+        if self.minHeap.currentHeapSize == 0:
+            self.out.write("No active ride requests\n")
+            return
+        minHeapNodes = self.minHeap.peekSmallest(k)
+        if self.wal is not None:
+            for minHeapNode in minHeapNodes:
+                self.wal.append(write_ahead_log.CANCEL_RIDE,
+                                minHeapNode.rideNumber)
+        with pausedGarbageCollection():
+            self.minHeap.deleteNodes(minHeapNodes)
+            self.redBlack.deleteNodes(
+                [minHeapNode.RBTNode for minHeapNode in minHeapNodes])
+        for minHeapNode in minHeapNodes:
+            minHeapNode.RBTNode.minHeapNode = None
+            self.rideChanged(minHeapNode.rideNumber)
+        self.versionsRemoved(minHeapNodes)
+        self.writeRides(minHeapNodes)
+
+    # Prints the k rides with the smallest (rideCost, tripDuration) in that order as one comma separated line
+    # without removing them.
+    # Time Complexity = O(klogk)
+    def peekNextRides(self, k):
+        if self.minHeap.currentHeapSize == 0:
+            self.out.write("No active ride requests\n")
+        else:
+            self.writeRides(self.minHeap.peekSmallest(k))
 
     # Retrieves the ride with the rideNumber from RBTree and deletes it.
     # Also deletes the corresponding heap node by using the pointer to it from the RBTree node.
@@ -72,100 +457,502 @@ class CabService:
         # If the node doesn't exist, delete_node returns False
         rbtNode = self.redBlack.search(rideNumber, self.redBlack.getRoot())
         if rbtNode:
+            if self.wal is not None:
+                self.wal.append(write_ahead_log.CANCEL_RIDE, rideNumber)
             self.redBlack.deleteNode(rbtNode)
-            self.minHeap.deleteArbitraryByIdx(rbtNode.minHeapNode.listIdx)
+            self.minHeap.deleteNode(rbtNode.minHeapNode)
+            rbtNode.minHeapNode = None
+            self.rideChanged(rideNumber)
+            if self.versions is not None:
+                self.versions.delete(rideNumber)
 
     # Updates the ride with rideNumber with a new tripDuration.
-    # For this operation, the current ride is retrived and deleted from the RBTree and
-    # MinHeap and a new ride with the same rideNumber but new tripDuration is inserted in the RBTree and MinHeap.
-    # Time Complexity = O(logn). TC of cancelRide + insertRide
+    # The ride is looked up once in the RBTree. If it is declined it is deleted from both structures,
+    # otherwise its details are updated in place and the heap node is sifted to its new position.
+    # Time Complexity = O(logn). One RBTree search plus one heapify or one deletion.
     def updateTrip(self, rideNumber, newTripDuration):
-        currNode = self.redBlack.search(rideNumber, self.redBlack.getRoot())
+        rbtNode = self.redBlack.search(rideNumber, self.redBlack.getRoot())
 
-        if currNode == None:
+        if rbtNode == None:
             return
+        if self.wal is not None:
+            self.wal.append(write_ahead_log.UPDATE_TRIP,
+                            rideNumber, newTripDuration)
+        self.rideChanged(rideNumber)
 
-        rideCost = currNode.rideCost
-        if newTripDuration > 2*currNode.tripDuration:
+        rideCost = rbtNode.rideCost
+        if newTripDuration > 2*rbtNode.tripDuration:
             # If new tripDuration more than twice old duration, delete ride
-            rbtNode = self.redBlack.search(rideNumber, self.redBlack.getRoot())
             self.redBlack.deleteNode(rbtNode)
-            self.minHeap.deleteArbitraryByIdx(rbtNode.minHeapNode.listIdx)
-        elif newTripDuration > currNode.tripDuration:
+            self.minHeap.deleteNode(rbtNode.minHeapNode)
+            rbtNode.minHeapNode = None
+            if self.versions is not None:
+                self.versions.delete(rideNumber)
+            return
+        elif newTripDuration > rbtNode.tripDuration:
             # If new tripDuration more than oldDuration, add 10 to tripCost
-            oldRBTnode = self.redBlack.search(
-                rideNumber, self.redBlack.getRoot())
-            self.redBlack.deleteNode(oldRBTnode)
-            self.minHeap.deleteArbitraryByIdx(oldRBTnode.minHeapNode.listIdx)
-            newRBTNode = self.redBlack.insert(
-                rideNumber, rideCost+10, newTripDuration)
-            newMinHeapNode = self.minHeap.insert(rideNumber, rideCost+10,
-                                                 newTripDuration, newRBTNode)
-            newRBTNode.minHeapNode = newMinHeapNode
-        elif newTripDuration <= currNode.tripDuration:
-            # If new tripDuration less than oldDuration, delete the old nodes and add new nodes with new trip durations
-            oldRBTnode = self.redBlack.search(
-                rideNumber, self.redBlack.getRoot())
-            self.redBlack.deleteNode(oldRBTnode)
-            self.minHeap.deleteArbitraryByIdx(oldRBTnode.minHeapNode.listIdx)
-            newRBTNode = self.redBlack.insert(
-                rideNumber, rideCost, newTripDuration)
-            newMinHeapNode = self.minHeap.insert(rideNumber, rideCost,
-                                                 newTripDuration, newRBTNode)
-            newRBTNode.minHeapNode = newMinHeapNode
-
-
-orig_stdout = sys.stdout
-output_file = open('output_file.txt', 'w')
-sys.stdout = output_file
-
-obj = CabService()
-# Parsing input from the input file and calling the appropriate functions
-with open(sys.argv[1], "r") as input_file:
-    for inputStr in input_file:
-        if "Insert" in inputStr:
-            idx1 = inputStr.find("(")
-            idx2 = inputStr.find(")")
-            tmpList = inputStr[idx1+1: idx2]
-            listToStr = ''.join([str(i) for i in tmpList])
-            listAfterSplit = listToStr.split(",")
-            rideNumber = int(listAfterSplit[0].strip())
-            rideCost = int(listAfterSplit[1].strip())
-            tripDuration = int(listAfterSplit[2].strip())
-            flag = obj.insert(rideNumber, rideCost, tripDuration)
-            if flag == False:
-                break
-        elif "GetNextRide" in inputStr:
-            obj.getNextRide()
-        elif "Cancel" in inputStr:
-            idx1 = inputStr.find("(")
-            idx2 = inputStr.find(")")
-            tmpList = inputStr[idx1+1: idx2]
-            listToStr = ''.join([str(i) for i in tmpList])
-            rideNumber = int(listToStr.strip())
-            obj.cancelRide(rideNumber)
-        elif "UpdateTrip" in inputStr:
-            idx1 = inputStr.find("(")
-            idx2 = inputStr.find(")")
-            tmpList = inputStr[idx1+1: idx2]
-            listToStr = ''.join([str(i) for i in tmpList])
-            listAfterSplit = listToStr.split(",")
-            rideNumber = int(listAfterSplit[0].strip())
-            newTripDuration = int(listAfterSplit[1].strip())
-            obj.updateTrip(rideNumber, newTripDuration)
-        elif "Print(" in inputStr:
-            idx1 = inputStr.find("(")
-            idx2 = inputStr.find(")")
-            tmpList = inputStr[idx1+1: idx2]
-            listToStr = ''.join([str(i) for i in tmpList])
-            listAfterSplit = listToStr.split(",")
-            if len(listAfterSplit) == 1:
-                rideNumber = int(listAfterSplit[0].strip())
-                obj.print(rideNumber)
-            else:
-                lowIdx = int(listAfterSplit[0].strip())
-                highIdx = int(listAfterSplit[1].strip())
-                obj.printRange(lowIdx, highIdx)
-
-sys.stdout = orig_stdout
-output_file.close()
+            rideCost += 10
+
+        rbtNode.updatePayload(rideCost, newTripDuration)
+        self.minHeap.updateKey(rbtNode.minHeapNode,
+                               rideCost, newTripDuration)
+        if self.versions is not None:
+            self.versions.update(rideNumber, rideCost, newTripDuration)
+
+    # Schedules the expiry of newly added tree nodes one TTL from the current clock. The timer wheel only holds the
+    # rideNumbers, so a ride that is removed early does not keep its nodes alive until its deadline.
+    def scheduleExpiry(self, rbtNodes):
+        expiry = self.expiry
+        deadline = expiry.now + self.ttl
+        for rbtNode in rbtNodes:
+            rbtNode.deadline = deadline
+            expiry.schedule(deadline, rbtNode.rideNumber)
+
+    # Advances the logical clock to now and removes the rides whose TTL has run out from both structures as one batch.
+    # The timer wheel returns the rideNumbers that came due, which are looked up in the RBTree. A ride that was
+    # removed in the meantime is not found, and one that was removed and inserted again has a later deadline than
+    # the entry that named it, so both are skipped. Expired rides are logged as cancellations, so that replaying
+    # the log removes exactly the same rides. Without a TTL nothing happens.
+    # Time complexity = O(1) amortized per entry for the timer wheel plus O(mlogn) for m lookups and m deletions
+    def advanceClock(self, now):
+        if self.expiry is None:
+            return
+        clock = self.expiry.now if now < self.expiry.now else now
+        search = self.redBlack.search
+        root = self.redBlack.getRoot()
+        expired = {}
+        for rideNumber in self.expiry.advance(now):
+            rbtNode = search(rideNumber, root)
+            if rbtNode is not None and rbtNode.deadline <= clock:
+                expired[rideNumber] = rbtNode
+        if not expired:
+            return
+        rbtNodes = list(expired.values())
+        if self.wal is not None:
+            for rbtNode in rbtNodes:
+                self.wal.append(write_ahead_log.CANCEL_RIDE, rbtNode.rideNumber)
+        with pausedGarbageCollection():
+            self.minHeap.deleteNodes([rbtNode.minHeapNode for rbtNode in rbtNodes])
+            self.redBlack.deleteNodes(rbtNodes)
+        for rbtNode in rbtNodes:
+            rbtNode.minHeapNode = None
+            self.rideChanged(rbtNode.rideNumber)
+        self.versionsRemoved(rbtNodes)
+        self.ridesExpired += len(rbtNodes)
+
+    # Writes a snapshot to path and then empties the write-ahead log, whose records are all contained in it.
+    # If the process crashes between the two steps, recovery skips the records by their sequence numbers.
+    def checkpoint(self, snapshotPath):
+        self.wal.sync()
+        self.save_snapshot(snapshotPath)
+        self.wal.reset()
+
+    # Applies the records of the write-ahead log at path from sequence number fromSequence on, without logging
+    # them again and without writing any results.
+    def replayLog(self, path, fromSequence=0):
+        out, results, wal = self.out, self.results, self.wal
+        self.results = self.wal = None
+        try:
+            with open(os.devnull, "w") as self.out:
+                for sequence, recordType, arg1, arg2, arg3 in write_ahead_log.records(path, fromSequence):
+                    if recordType == write_ahead_log.INSERT:
+                        self.insert(arg1, arg2, arg3)
+                    elif recordType == write_ahead_log.GET_NEXT_RIDE:
+                        # Written by earlier versions only
+                        self.getNextRide()
+                    elif recordType == write_ahead_log.CANCEL_RIDE:
+                        self.cancelRide(arg1)
+                    elif recordType == write_ahead_log.UPDATE_TRIP:
+                        self.updateTrip(arg1, arg2)
+                    else:
+                        raise write_ahead_log.WALError(
+                            "Unknown record type %d at sequence %d" % (recordType, sequence))
+        finally:
+            self.out, self.results, self.wal = out, results, wal
+
+    # Rebuilds the state after a restart: loads the snapshot at snapshotPath if there is one, replays the tail of
+    # the write-ahead log at walPath and returns a CabService that keeps appending to that log.
+    # Time complexity = O(n+r) where r is the number of log records after the snapshot
+    @classmethod
+    def recover(cls, snapshotPath, walPath, out=None, syncEveryOps=write_ahead_log.DEFAULT_SYNC_EVERY_OPS,
+                syncIntervalMs=write_ahead_log.DEFAULT_SYNC_INTERVAL_MS, heap="binary"):
+        service = cls(out, heap=heap)
+        fromSequence = 0
+        if snapshotPath is not None and os.path.exists(snapshotPath):
+            fromSequence = service.load_snapshot(snapshotPath)
+        if os.path.exists(walPath) and os.path.getsize(walPath) > 0:
+            service.replayLog(walPath, fromSequence)
+
+        service.wal = write_ahead_log.WriteAheadLog(
+            walPath, syncEveryOps, syncIntervalMs)
+        if service.wal.sequence < fromSequence:
+            # The log is older than the snapshot, so continue numbering after the snapshot
+            service.wal.sequence = fromSequence
+            service.wal.reset()
+        return service
+
+
+# Opcodes of the command language. Each input line is parsed once into an opcode and its int arguments.
+OP_INSERT = 0
+OP_GET_NEXT_RIDE = 1
+OP_CANCEL_RIDE = 2
+OP_UPDATE_TRIP = 3
+OP_PRINT = 4
+OP_PRINT_RANGE = 5
+OP_STATS = 6
+OP_COUNT_RANGE = 7
+OP_SUM_COST_RANGE = 8
+OP_RANK = 9
+OP_SELECT = 10
+OP_GET_NEXT_RIDES = 11
+OP_PEEK_NEXT_RIDES = 12
+OP_ADVANCE_CLOCK = 13
+
+OPCODE_NAMES = ["Insert", "GetNextRide", "CancelRide", "UpdateTrip", "Print", "PrintRange", "Stats",
+                "CountRange", "SumCostRange", "Rank", "Select", "GetNextRides", "PeekNextRides", "AdvanceClock"]
+
+# Number of arguments of every opcode, by opcode
+OPCODE_ARG_COUNTS = [3, 0, 1, 2, 1, 2, 0, 2, 2, 1, 1, 1, 1, 1]
+
+COMMAND_OPCODES = {
+    "Insert": OP_INSERT,
+    "GetNextRide": OP_GET_NEXT_RIDE,
+    "CancelRide": OP_CANCEL_RIDE,
+    "UpdateTrip": OP_UPDATE_TRIP,
+    "Print": OP_PRINT,
+    "Stats": OP_STATS,
+    "CountRange": OP_COUNT_RANGE,
+    "SumCostRange": OP_SUM_COST_RANGE,
+    "Rank": OP_RANK,
+    "Select": OP_SELECT,
+    "GetNextRides": OP_GET_NEXT_RIDES,
+    "PeekNextRides": OP_PEEK_NEXT_RIDES,
+    "AdvanceClock": OP_ADVANCE_CLOCK,
+}
+
+OUTPUT_BUFFER_SIZE = 1 << 20
+
+# Shortest run of consecutive Insert commands that is loaded through CabService.bulk_load.
+# Runs are also bulk loaded only when they are at least as long as the number of resident rides,
+# since bulk loading rebuilds both structures.
+BULK_LOAD_MIN_RUN = 64
+
+
+# Parses a line like "Insert(5,50,120)" into (opcode, args). Returns None for blank or unknown lines.
+# Print with two arguments is mapped to OP_PRINT_RANGE so that dispatch never has to look at the arguments again.
+def parseCommand(line):
+    idx1 = line.find("(")
+    if idx1 < 0:
+        return None
+    opcode = COMMAND_OPCODES.get(line[:idx1].strip())
+    if opcode is None:
+        return None
+    argStr = line[idx1+1: line.rfind(")")]
+    if argStr and not argStr.isspace():
+        args = tuple(map(int, argStr.split(",")))
+    else:
+        args = ()
+    if opcode == OP_PRINT and len(args) == 2:
+        opcode = OP_PRINT_RANGE
+    return opcode, args
+
+
+# Streams parsed commands into a CabService through a dispatch table indexed by opcode.
+# If the service keeps a columnar snapshot, runs of consecutive range queries of the same kind are executed as one
+# batch by its printRanges, countRanges or sumCostRanges.
+# If a metrics.Metrics is given, every command is timed, the tree height and heap size are sampled every
+# metrics.SAMPLE_INTERVAL commands and, when statsInterval is set, a stats line is written to the output every
+# statsInterval commands.
+# If an invariant_checker.SampledChecker is given, it is called after every command.
+# If checkpointEvery is set, the service writes a checkpoint to checkpointPath every checkpointEvery commands, which
+# keeps its write-ahead log, and the time recovery takes, bounded.
+class CommandEngine:
+    def __init__(self, service, metrics=None, statsInterval=0, checker=None, checkpointEvery=0, checkpointPath=None):
+        self.service = service
+        self.metrics = metrics
+        self.checker = checker
+        self.statsInterval = statsInterval
+        self.nextStatsAt = statsInterval
+        self.nextSampleAt = metricsModule.SAMPLE_INTERVAL
+        self.checkpointEvery = checkpointEvery
+        self.checkpointPath = checkpointPath
+        self.checkpoints = 0
+        self.dispatch = [
+            service.insert,
+            service.getNextRide,
+            service.cancelRide,
+            service.updateTrip,
+            service.print,
+            service.printRange,
+            self.writeStats,
+            service.countRange,
+            service.sumCostRange,
+            service.rank,
+            service.select,
+            service.getNextRides,
+            service.peekNextRides,
+            service.advanceClock,
+        ]
+        # Batch methods of the service by opcode, for the range queries that are collected into batches
+        self.rangeBatches = {}
+        if getattr(service, "columnar", None) is not None:
+            self.rangeBatches = {
+                OP_PRINT_RANGE: service.printRanges,
+                OP_COUNT_RANGE: service.countRanges,
+                OP_SUM_COST_RANGE: service.sumCostRanges,
+            }
+        self.linesProcessed = 0
+
+    # Executes a single parsed command. Returns False if the stream must stop (duplicate rideNumber).
+    def execute(self, opcode, args):
+        if self.metrics is None:
+            result = self.dispatch[opcode](*args)
+        else:
+            startTime = time.perf_counter()
+            result = self.dispatch[opcode](*args)
+            self.recordCommand(OPCODE_NAMES[opcode], startTime)
+        if self.checker is not None:
+            self.checker.afterCommand()
+        return result is not False
+
+    # Records the latency of commands started at startTime, samples the shape of the structures and writes a stats
+    # line when one is due
+    def recordCommand(self, name, startTime, count=1):
+        metrics = self.metrics
+        metrics.recordCommand(name, time.perf_counter() - startTime, count)
+        if metrics.commandsSeen >= self.nextSampleAt:
+            self.nextSampleAt = metrics.commandsSeen + max(metricsModule.SAMPLE_INTERVAL, self.service.size())
+            self.takeSample()
+        if self.statsInterval and metrics.commandsSeen >= self.nextStatsAt:
+            self.nextStatsAt = metrics.commandsSeen + self.statsInterval
+            self.takeSample()
+            self.service.out.write(metrics.summaryLine() + "\n")
+
+    # Records the current tree height and number of rides. Only the height() and size() of the service are used, which
+    # the sharded service implements as well.
+    def takeSample(self):
+        self.metrics.sample(self.service.height(), self.service.size())
+
+    # Handles the Stats() command by writing all metrics and the print cache counters to the output
+    def writeStats(self):
+        if self.metrics is None:
+            self.service.out.write("# metrics disabled\n")
+        else:
+            self.takeSample()
+            self.service.out.write("\n".join(self.metrics.dump()) + "\n")
+        printCache = getattr(self.service, "printCache", None)
+        if printCache is not None:
+            self.service.out.write(printCache.summaryLine() + "\n")
+        expiry = getattr(self.service, "expiry", None)
+        if expiry is not None:
+            self.service.out.write("# expiry ttl=%d clock=%d expired=%d scheduled=%d\n" % (
+                self.service.ttl, expiry.now, self.service.ridesExpired, expiry.size))
+
+    # Executes a run of consecutive Insert commands. Long runs go through CabService.bulk_load,
+    # short ones are inserted one at a time. Returns False if a duplicate rideNumber was found.
+    def flushInserts(self, pendingInserts):
+        if not pendingInserts:
+            return True
+        service = self.service
+        startTime = time.perf_counter()
+        count = len(pendingInserts)
+        try:
+            if count >= BULK_LOAD_MIN_RUN and count >= service.size():
+                return service.bulk_load(pendingInserts)
+            insert = service.insert
+            for args in pendingInserts:
+                if insert(*args) is False:
+                    return False
+            return True
+        finally:
+            pendingInserts.clear()
+            if self.metrics is not None:
+                self.recordCommand("Insert", startTime, count)
+            if self.checker is not None:
+                self.checker.afterCommand()
+
+    # Executes a batch of range queries with the given opcode through the batch method of the service
+    def flushRanges(self, opcode, pendingRanges):
+        startTime = time.perf_counter()
+        count = len(pendingRanges)
+        try:
+            self.rangeBatches[opcode](pendingRanges)
+        finally:
+            pendingRanges.clear()
+            if self.metrics is not None:
+                self.recordCommand(OPCODE_NAMES[opcode], startTime, count)
+            if self.checker is not None:
+                self.checker.afterCommand()
+
+    # Yields the commands of an iterable and writes a checkpoint after every checkpointEvery of them. The next
+    # command is only taken once the previous one was executed or queued, and queued inserts are not logged yet, so
+    # the snapshot holds exactly the mutations logged before it.
+    def checkpointed(self, commands):
+        checkpointEvery = self.checkpointEvery
+        for count, command in enumerate(commands, 1):
+            yield command
+            if count % checkpointEvery == 0:
+                self.service.checkpoint(self.checkpointPath)
+                self.checkpoints += 1
+
+    # Parses and executes every line of an iterable of text lines.
+    # Returns False if processing was stopped early by a duplicate insert.
+    def run(self, lines):
+        return self.runCommands(map(parseCommand, lines))
+
+    # Executes every command of an iterable of parsed (opcode, args) commands, in which None stands for a line
+    # without a command.
+    # Consecutive Insert commands are collected and executed together by flushInserts, and consecutive range
+    # queries of the same kind by flushRanges.
+    # Returns False if processing was stopped early by a duplicate insert.
+    def runCommands(self, commands):
+        # With metrics or a checker every command goes through execute(), which times and checks it
+        dispatch = self.dispatch if self.metrics is None and self.checker is None else [
+            lambda *args, opcode=opcode: self.execute(opcode, args) for opcode in range(len(self.dispatch))]
+        rangeBatches = self.rangeBatches
+        if self.checkpointEvery:
+            commands = self.checkpointed(commands)
+        pendingInserts = []
+        pendingRanges = []
+        pendingRangeOpcode = None
+        count = 0
+        try:
+            for command in commands:
+                count += 1
+                if command is None:
+                    continue
+                opcode, args = command
+                if pendingRanges and opcode != pendingRangeOpcode:
+                    self.flushRanges(pendingRangeOpcode, pendingRanges)
+                if opcode == OP_INSERT:
+                    pendingInserts.append(args)
+                    continue
+                if pendingInserts and not self.flushInserts(pendingInserts):
+                    return False
+                if opcode in rangeBatches:
+                    pendingRangeOpcode = opcode
+                    pendingRanges.append(args)
+                    continue
+                if dispatch[opcode](*args) is False:
+                    return False
+            if pendingRanges:
+                self.flushRanges(pendingRangeOpcode, pendingRanges)
+            return self.flushInserts(pendingInserts)
+        finally:
+            self.linesProcessed += count
+
+
+# Runs a whole input file through service, or a fresh CabService, and writes the results to outputPath.
+# The input is either text lines or a binary_format command file, which is recognized by its magic. If binaryResults
+# is True, the results are written in the binary_format result format instead of as text.
+# metrics, statsInterval, checkSampleRate, checkpointEvery and checkpointPath are passed on to the CommandEngine,
+# heap, printCache, columnar and ttl to a fresh CabService.
+# Returns (linesProcessed, elapsedSeconds); for a command file the lines are its commands.
+def runFile(inputPath, outputPath, bufferSize=OUTPUT_BUFFER_SIZE, service=None, metrics=None, statsInterval=0,
+            checkSampleRate=0, heap="binary", printCache=None, columnar=False, ttl=None, binaryResults=False,
+            checkpointEvery=0, checkpointPath=None):
+    startTime = time.perf_counter()
+    with contextlib.ExitStack() as stack:
+        if binary_format.isCommandFile(inputPath):
+            commands = stack.enter_context(contextlib.closing(binary_format.readCommands(inputPath)))
+        else:
+            commands = map(parseCommand, stack.enter_context(open(inputPath, "r")))
+        if binaryResults:
+            output_file = stack.enter_context(
+                binary_format.ResultWriter(open(outputPath, "wb", buffering=bufferSize)))
+        else:
+            output_file = stack.enter_context(open(outputPath, "w", buffering=bufferSize))
+        if service is None:
+            service = CabService(output_file, metrics=metrics, heap=heap, printCache=printCache, columnar=columnar,
+                                 ttl=ttl)
+        else:
+            service.setOutput(output_file)
+        checker = None
+        if checkSampleRate:
+            checker = invariant_checker.SampledChecker(service, checkSampleRate)
+        engine = CommandEngine(service, metrics, statsInterval, checker, checkpointEvery, checkpointPath)
+        engine.runCommands(commands)
+        if metrics is not None:
+            # The final shape, for the dump at the end of the run
+            engine.takeSample()
+    return engine.linesProcessed, time.perf_counter() - startTime
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gator Taxi ride service")
+    parser.add_argument("input_file", help="file with one command per line, or a binary command file")
+    parser.add_argument("-o", "--output", default="output_file.txt",
+                        help="file the results are written to (default: output_file.txt)")
+    parser.add_argument("--stats", action="store_true",
+                        help="report lines processed per second on stderr")
+    parser.add_argument("--wal", metavar="PATH",
+                        help="recover from and append all mutations to this write-ahead log")
+    parser.add_argument("--snapshot", metavar="PATH",
+                        help="snapshot to recover from before replaying the write-ahead log")
+    parser.add_argument("--checkpoint-every", type=int, default=0, metavar="N",
+                        help="write a snapshot to --snapshot and empty the write-ahead log every N commands")
+    parser.add_argument("--sync-every", type=int, default=write_ahead_log.DEFAULT_SYNC_EVERY_OPS,
+                        help="fsync the write-ahead log after this many records")
+    parser.add_argument("--sync-interval-ms", type=float, default=write_ahead_log.DEFAULT_SYNC_INTERVAL_MS,
+                        help="fsync the write-ahead log after this many milliseconds")
+    parser.add_argument("--metrics", action="store_true",
+                        help="record per-command latencies and structural changes and dump them on stderr")
+    parser.add_argument("--stats-interval", type=int, default=0, metavar="N",
+                        help="write a '# stats' line to the output every N commands (implies --metrics)")
+    parser.add_argument("--check-sample", type=float, default=0, metavar="RATE",
+                        help="check a sample of the tree and heap invariants after this fraction of the commands")
+    parser.add_argument("--heap", choices=sorted(HEAP_BACKENDS), default="binary",
+                        help="priority queue backend (default: binary)")
+    parser.add_argument("--print-cache", type=int, default=0, metavar="N",
+                        help="cache the results of up to N Print(rideNumber) lookups and report its counters on stderr")
+    parser.add_argument("--print-cache-policy", choices=print_cache.EVICTION_POLICIES, default="lru",
+                        help="eviction policy of the print cache (default: lru)")
+    parser.add_argument("--columnar", action="store_true",
+                        help="answer runs of range queries from a columnar snapshot of the rides")
+    parser.add_argument("--ttl", type=int, default=0, metavar="TICKS",
+                        help="expire rides TICKS ticks of the logical clock set by AdvanceClock(t) after their insert")
+    parser.add_argument("--binary-results", action="store_true",
+                        help="write the results in the binary result format of binary_format.py")
+    args = parser.parse_args(argv)
+    if args.checkpoint_every and not (args.wal and args.snapshot):
+        parser.error("--checkpoint-every needs --wal and --snapshot")
+
+    metrics = None
+    if args.metrics or args.stats_interval:
+        metrics = metricsModule.Metrics()
+    printCache = None
+    if args.print_cache:
+        printCache = print_cache.PrintCache(args.print_cache, args.print_cache_policy)
+    service = None
+    if args.wal:
+        service = CabService.recover(
+            args.snapshot, args.wal, None, args.sync_every, args.sync_interval_ms, args.heap)
+        service.metrics = service.minHeap.metrics = service.redBlack.metrics = metrics
+        service.printCache = printCache
+        if args.columnar:
+            service.columnar = columnar_snapshot.ColumnarSnapshot()
+        if args.ttl:
+            service.ttl = args.ttl
+            service.expiry = timer_wheel.TimerWheel()
+            service.scheduleExpiry(service.redBlack.nodes())
+    try:
+        lines, elapsed = runFile(args.input_file, args.output, service=service,
+                                 metrics=metrics, statsInterval=args.stats_interval,
+                                 checkSampleRate=args.check_sample, heap=args.heap, printCache=printCache,
+                                 columnar=args.columnar, ttl=args.ttl or None, binaryResults=args.binary_results,
+                                 checkpointEvery=args.checkpoint_every, checkpointPath=args.snapshot)
+    finally:
+        if service is not None:
+            service.wal.close()
+    if args.stats:
+        rate = lines / elapsed if elapsed > 0 else float("inf")
+        print("Processed %d lines in %.3fs (%.0f lines/sec)" %
+              (lines, elapsed, rate), file=sys.stderr)
+    if args.metrics:
+        print("\n".join(metrics.dump()), file=sys.stderr)
+    if printCache is not None:
+        print(printCache.summaryLine(), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+# Local load generator for gator_server.py
+#
+# Opens several connections and sends a mix of pipelined commands at a fixed total rate (open loop). The latency of
+# a request is measured from the time it was scheduled to be sent until its response arrives, so a server that falls
+# behind shows up in the percentiles instead of silently lowering the offered load.
+#
+# Usage: python3 gator_loadgen.py [--host HOST] [--port PORT | --unix PATH] [--rates 1000,10000,50000]
+
+import argparse
+import asyncio
+import collections
+import random
+import time
+
+import gator_server
+
+# Interval at which each connection sends the requests that are due
+TICK_SECONDS = 0.001
+
+
+# Generates an endless mix of commands. Each connection inserts ride numbers from its own range.
+def commandStream(connectionId, seed):
+    rng = random.Random(seed)
+    firstRideNumber = connectionId * 10000000 + 1
+    nextRideNumber = firstRideNumber
+    while True:
+        choice = rng.random()
+        if choice < 0.4 or nextRideNumber == firstRideNumber:
+            yield "Insert(%d,%d,%d)" % (nextRideNumber, rng.randint(1, 1000), rng.randint(1, 1000))
+            nextRideNumber += 1
+        elif choice < 0.55:
+            yield "GetNextRide()"
+        elif choice < 0.65:
+            yield "CancelRide(%d)" % rng.randint(firstRideNumber, nextRideNumber)
+        elif choice < 0.8:
+            yield "UpdateTrip(%d,%d)" % (rng.randint(firstRideNumber, nextRideNumber), rng.randint(1, 2000))
+        elif choice < 0.95:
+            yield "Print(%d)" % rng.randint(firstRideNumber, nextRideNumber)
+        else:
+            low = rng.randint(firstRideNumber, nextRideNumber)
+            yield "Print(%d,%d)" % (low, low + 50)
+
+
+async def runConnection(connectionId, openConnection, rate, duration, latencies):
+    reader, writer = await openConnection()
+    commands = commandStream(connectionId, connectionId)
+    scheduled = collections.deque()
+
+    async def readResponses(expected):
+        for _ in range(expected):
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Server closed the connection")
+            latencies.append(time.perf_counter() - scheduled.popleft())
+
+    startTime = time.perf_counter()
+    sent = 0
+    total = int(rate * duration)
+    readerTask = asyncio.create_task(readResponses(total))
+    while sent < total:
+        now = time.perf_counter()
+        due = min(total, int((now - startTime) * rate) + 1)
+        if due > sent:
+            lines = []
+            for i in range(sent, due):
+                scheduled.append(startTime + i / rate)
+                lines.append(next(commands))
+            writer.write(("\n".join(lines) + "\n").encode())
+            sent = due
+        await asyncio.sleep(TICK_SECONDS)
+    await readerTask
+    writer.close()
+    await writer.wait_closed()
+
+
+def percentile(sortedValues, fraction):
+    return sortedValues[min(len(sortedValues) - 1, int(fraction * len(sortedValues)))]
+
+
+# Offers rate requests/sec spread over the given number of connections for duration seconds.
+# Returns (achievedRate, p50Seconds, p99Seconds).
+async def measure(openConnection, rate, duration, connections):
+    latencies = []
+    startTime = time.perf_counter()
+    await asyncio.gather(*[runConnection(connectionId, openConnection, rate / connections, duration, latencies)
+                           for connectionId in range(connections)])
+    elapsed = time.perf_counter() - startTime
+    latencies.sort()
+    return len(latencies) / elapsed, percentile(latencies, 0.5), percentile(latencies, 0.99)
+
+
+async def runAll(args):
+    if args.unix is not None:
+        def openConnection(): return asyncio.open_unix_connection(args.unix)
+    else:
+        def openConnection(): return asyncio.open_connection(args.host, args.port)
+    print("%10s %12s %10s %10s" % ("offered", "achieved", "p50 ms", "p99 ms"))
+    for rate in args.rates:
+        achieved, p50, p99 = await measure(openConnection, rate, args.duration, args.connections)
+        print("%10d %12.0f %10.3f %10.3f" %
+              (rate, achieved, p50 * 1000, p99 * 1000))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load generator for gator_server.py")
+    parser.add_argument("--host", default=gator_server.DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=gator_server.DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH",
+                        help="connect to a Unix socket instead of TCP")
+    parser.add_argument("--rates", default="1000,10000,50000",
+                        type=lambda value: [int(rate) for rate in value.split(",")],
+                        help="comma separated offered loads in requests/sec")
+    parser.add_argument("--duration", type=float, default=5.0,
+                        help="seconds per offered load")
+    parser.add_argument("--connections", type=int, default=8)
+    asyncio.run(runAll(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
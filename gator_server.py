@@ -0,0 +1,189 @@
+# Long-lived asyncio server that accepts the gatorTaxi command language over a TCP or Unix socket
+#
+# Every non-blank request line is one command such as "Insert(5,50,120)" and gets exactly one response line:
+# the output of the command, "OK" for commands without output, or "ERROR ..." for lines that cannot be parsed,
+# including commands with the wrong number of arguments. A command whose output has several lines, like Stats(),
+# gets them joined by RESPONSE_LINE_SEPARATOR.
+# Clients may pipeline any number of requests; responses come back in request order.
+# All commands from all connections go through a single queue that one writer task drains, so the
+# RedBlackTree/MinHeap pair of the CabService is never touched concurrently.
+# With --read-threads N the service publishes read versions (ride_versions.py). When the writer task reaches a
+# Print command it only takes a view of the current version and hands the command to a pool of N threads, which
+# answer it from the view while the writer goes on with the next commands. The view is taken at the position of
+# the command in the queue, so the response is the same as if the writer had executed it.
+#
+# Usage: python3 gator_server.py [--host HOST] [--port PORT | --unix PATH] [--read-threads N]
+
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import io
+
+import gatorTaxi
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7777
+
+# Number of bytes read from a connection at a time
+READ_SIZE = 1 << 16
+
+# Maximum number of queued commands the writer task executes before yielding to the event loop
+MAX_BATCH = 256
+
+
+# Joins the output lines of a command into its single response line
+RESPONSE_LINE_SEPARATOR = " | "
+
+# Commands that the read threads answer from a view
+READ_OPCODES = (gatorTaxi.OP_PRINT, gatorTaxi.OP_PRINT_RANGE)
+
+
+class GatorServer:
+    # With readThreads above 0, Print commands are answered by a pool of that many threads; a given service must then
+    # be versioned.
+    def __init__(self, service=None, readThreads=0):
+        self.output = io.StringIO()
+        self.service = service if service is not None else gatorTaxi.CabService(versioned=readThreads > 0)
+        self.service.out = self.output
+        self.engine = gatorTaxi.CommandEngine(self.service)
+        self.commandQueue = asyncio.Queue()
+        self.writerTask = None
+        self.readPool = None
+        if readThreads:
+            if getattr(self.service, "versions", None) is None:
+                raise ValueError("Read threads need a versioned CabService")
+            self.readPool = concurrent.futures.ThreadPoolExecutor(readThreads, thread_name_prefix="gator-read")
+
+    # Executes one command against the service and returns its response line
+    def execute(self, command):
+        output = self.output
+        output.seek(0)
+        output.truncate()
+        self.engine.execute(*command)
+        response = output.getvalue().rstrip("\n").replace("\n", RESPONSE_LINE_SEPARATOR)
+        return response if response else "OK"
+
+    # Answers a Print command on the read pool from a view of the current version. Called by the writer task in
+    # queue order; the response future is completed when a read thread has formatted the result.
+    def submitRead(self, command, future):
+        opcode, args = command
+        view = self.service.readView()
+        read = view.formatRide if opcode == gatorTaxi.OP_PRINT else view.formatRange
+        readFuture = asyncio.get_running_loop().run_in_executor(self.readPool, read, *args)
+        readFuture.add_done_callback(functools.partial(self.deliverRead, future))
+
+    # Completes the response future of a read with its result, once the read thread is done
+    def deliverRead(self, future, readFuture):
+        if future.cancelled():
+            return
+        error = readFuture.exception()
+        future.set_result(readFuture.result() if error is None else "ERROR " + str(error))
+
+    # Single writer: the only coroutine that touches the service. Drains the queue in batches.
+    async def runWriter(self):
+        commandQueue = self.commandQueue
+        while True:
+            batch = [await commandQueue.get()]
+            while len(batch) < MAX_BATCH and not commandQueue.empty():
+                batch.append(commandQueue.get_nowait())
+            for command, future in batch:
+                if future.cancelled():
+                    continue
+                if self.readPool is not None and command[0] in READ_OPCODES:
+                    self.submitRead(command, future)
+                    continue
+                try:
+                    future.set_result(self.execute(command))
+                except Exception as error:
+                    future.set_result("ERROR " + str(error))
+
+    # Reads pipelined requests from one connection and queues them. Responses are written by a
+    # separate task in request order, so reading never waits for earlier commands to finish.
+    async def handleConnection(self, reader, writer):
+        loop = asyncio.get_running_loop()
+        pending = asyncio.Queue()
+        responder = asyncio.create_task(self.writeResponses(pending, writer))
+        remainder = b""
+        try:
+            while True:
+                data = await reader.read(READ_SIZE)
+                if data:
+                    lines = (remainder + data).split(b"\n")
+                    remainder = lines.pop()
+                else:
+                    # The last request may not end with a newline
+                    lines = [remainder]
+                futures = []
+                for line in lines:
+                    text = line.decode()
+                    if not text.strip():
+                        continue
+                    future = loop.create_future()
+                    try:
+                        command = gatorTaxi.parseCommand(text)
+                    except ValueError:
+                        command = None
+                    if command is not None and len(command[1]) != gatorTaxi.OPCODE_ARG_COUNTS[command[0]]:
+                        command = None
+                    if command is None:
+                        future.set_result("ERROR cannot parse " + text.strip())
+                    else:
+                        self.commandQueue.put_nowait((command, future))
+                    futures.append(future)
+                pending.put_nowait(futures)
+                if not data:
+                    break
+        finally:
+            pending.put_nowait(None)
+            await responder
+
+    # Writes the responses of every chunk of requests of one connection, in request order
+    async def writeResponses(self, pending, writer):
+        try:
+            while True:
+                futures = await pending.get()
+                if futures is None:
+                    break
+                responses = [await future for future in futures]
+                if responses:
+                    writer.write(("\n".join(responses) + "\n").encode())
+                # Flush once no further responses are ready, so pipelined responses share a write
+                if pending.empty():
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unixPath=None):
+        self.writerTask = asyncio.create_task(self.runWriter())
+        if unixPath is not None:
+            return await asyncio.start_unix_server(self.handleConnection, path=unixPath)
+        return await asyncio.start_server(self.handleConnection, host, port)
+
+
+async def serve(host, port, unixPath, readThreads=0):
+    server = await GatorServer(readThreads=readThreads).start(host, port, unixPath)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the Gator Taxi command language over a socket")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH",
+                        help="listen on a Unix socket instead of TCP")
+    parser.add_argument("--read-threads", type=int, default=0, metavar="N",
+                        help="answer Print commands from read versions on N threads while the writer goes on")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix, args.read_threads))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
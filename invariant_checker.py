@@ -0,0 +1,309 @@
+# Invariant checks for the RedBlackTree / MinHeap pair of a CabService
+#
+# checkService is a full O(n) check of both structures and of the pointers between them. The heap checks cover the
+# array heaps (min_heap.MinHeap, dary_heap.DaryHeap) and pairing_heap.PairingHeap. For a versioned service it also
+# checks that the current read version holds exactly the rides of the tree.
+# SampledChecker checks one random root-to-leaf path of the tree and one heap entry after a sample of the
+# commands, which costs O(log n) per sample and is cheap enough to leave enabled in canaries.
+
+import math
+import random
+
+import pairing_heap
+import red_black_tree
+import ride_versions
+
+
+class InvariantError(Exception):
+    pass
+
+
+# Returns the largest height a red black tree with count nodes may have: 2*log2(count+1)
+def maxRedBlackHeight(count):
+    return 2 * math.log2(count + 1)
+
+
+# Returns True if the heap key of node1 is larger than the one of node2
+def heapKeyGreater(node1, node2):
+    return (node1.rideCost, node1.tripDuration) > (node2.rideCost, node2.tripDuration)
+
+
+# Checks that the size and costSum of node match the ones of its children
+def checkAggregates(node):
+    left = node.left
+    right = node.right
+    if node.size != left.size + right.size + 1:
+        raise InvariantError("size of node %d is %d, expected %d" %
+                             (node.rideNumber, node.size, left.size + right.size + 1))
+    if node.costSum != left.costSum + right.costSum + node.rideCost:
+        raise InvariantError("costSum of node %d is %d, expected %d" %
+                             (node.rideNumber, node.costSum, left.costSum + right.costSum + node.rideCost))
+
+
+# Checks the BST order, the parent pointers, the subtree aggregates, that no red node has a red child and that every
+# path from the root to a leaf has the same number of black nodes. Iterative, so that a degraded tree does not hit
+# the recursion limit.
+# Returns (numberOfNodes, height).
+# Time complexity : O(n)
+def checkRedBlackTree(tree):
+    TNULL = tree.TNULL
+    root = tree.root
+    if TNULL.color is not red_black_tree.BLACK:
+        raise InvariantError("TNULL is red")
+    if TNULL.size != 0 or TNULL.costSum != 0:
+        raise InvariantError("TNULL has a size or costSum")
+    if root is TNULL:
+        return 0, 0
+    if root.color is not red_black_tree.BLACK:
+        raise InvariantError("root %d is red" % root.rideNumber)
+    if root.parent is not None and root.parent is not TNULL:
+        raise InvariantError("root %d has a parent" % root.rideNumber)
+
+    count = 0
+    height = 0
+    blackHeight = None
+    # (node, lowerBound, upperBound, black nodes above node, depth of node)
+    stack = [(root, None, None, 0, 1)]
+    while stack:
+        node, lowerBound, upperBound, blackCount, depth = stack.pop()
+        if node is TNULL:
+            if blackHeight is None:
+                blackHeight = blackCount
+            elif blackCount != blackHeight:
+                raise InvariantError("black height %d differs from %d" % (blackCount, blackHeight))
+            continue
+        count += 1
+        height = max(height, depth)
+        rideNumber = node.rideNumber
+        if (lowerBound is not None and rideNumber <= lowerBound) or (upperBound is not None and rideNumber >= upperBound):
+            raise InvariantError("rideNumber %d violates the BST order" % rideNumber)
+        if node.color is red_black_tree.RED and (node.left.color is red_black_tree.RED or
+                                                node.right.color is red_black_tree.RED):
+            raise InvariantError("red node %d has a red child" % rideNumber)
+        for child in (node.left, node.right):
+            if child is None:
+                raise InvariantError("node %d has a None child" % rideNumber)
+            if child is not TNULL and child.parent is not node:
+                raise InvariantError("parent pointer of %d does not point to %d" % (child.rideNumber, rideNumber))
+        checkAggregates(node)
+        if node.color is red_black_tree.BLACK:
+            blackCount += 1
+        stack.append((node.left, lowerBound, rideNumber, blackCount, depth + 1))
+        stack.append((node.right, rideNumber, upperBound, blackCount, depth + 1))
+    return count, height
+
+
+# Checks the heap order of an array heap of any arity and that every node knows its own index
+# Time complexity : O(n)
+def checkMinHeap(heap):
+    heapNodesList = heap.heapNodesList
+    arity = heap.arity
+    if len(heapNodesList) != heap.currentHeapSize + 1:
+        raise InvariantError("heap list holds %d nodes, currentHeapSize is %d" %
+                             (len(heapNodesList) - 1, heap.currentHeapSize))
+    for i in range(1, heap.currentHeapSize + 1):
+        node = heapNodesList[i]
+        if node.listIdx != i:
+            raise InvariantError("heap node %d at index %d has listIdx %d" % (node.rideNumber, i, node.listIdx))
+        if i > 1 and heapKeyGreater(heapNodesList[(i - 2) // arity + 1], node):
+            raise InvariantError("heap node %d is smaller than its parent %d" %
+                                 (node.rideNumber, heapNodesList[(i - 2) // arity + 1].rideNumber))
+
+
+# Checks the heap order, the prev pointers and the size of a pairing heap
+# Time complexity : O(n)
+def checkPairingHeap(heap):
+    root = heap.root
+    if root is not None and (root.prev is not None or root.sibling is not None):
+        raise InvariantError("heap root %d has a prev or sibling" % root.rideNumber)
+    count = 0
+    stack = [root] if root is not None else []
+    while stack:
+        node = stack.pop()
+        count += 1
+        prev = node
+        child = node.child
+        while child is not None:
+            if child.prev is not prev:
+                raise InvariantError("prev pointer of heap node %d is wrong" % child.rideNumber)
+            if heapKeyGreater(node, child):
+                raise InvariantError("heap node %d is smaller than its parent %d" % (child.rideNumber, node.rideNumber))
+            stack.append(child)
+            prev = child
+            child = child.sibling
+    if count != heap.currentHeapSize:
+        raise InvariantError("heap holds %d nodes, currentHeapSize is %d" % (count, heap.currentHeapSize))
+
+
+def checkHeap(heap):
+    if isinstance(heap, pairing_heap.PairingHeap):
+        checkPairingHeap(heap)
+    else:
+        checkMinHeap(heap)
+
+
+# Checks that a heap node is linked into heap: at its listIdx in an array heap, reachable through its prev
+# pointer in a pairing heap
+def checkHeapMembership(minHeapNode, heap):
+    if isinstance(heap, pairing_heap.PairingHeap):
+        prev = minHeapNode.prev
+        if prev is None:
+            if minHeapNode is not heap.root:
+                raise InvariantError("heap node of ride %d is not linked into the heap" % minHeapNode.rideNumber)
+        elif prev.child is not minHeapNode and prev.sibling is not minHeapNode:
+            raise InvariantError("prev pointer of heap node %d is wrong" % minHeapNode.rideNumber)
+        return
+    idx = minHeapNode.listIdx
+    if not 1 <= idx <= heap.currentHeapSize or heap.heapNodesList[idx] is not minHeapNode:
+        raise InvariantError("heap node of ride %d is not at its listIdx %d" % (minHeapNode.rideNumber, idx))
+
+
+# Checks the heap order between a heap node and its parent and children. In a pairing heap only the first child is
+# checked, so that a root with many children does not make the check O(n).
+def checkHeapEntry(minHeapNode, heap):
+    if isinstance(heap, pairing_heap.PairingHeap):
+        child = minHeapNode.child
+        if child is not None and (child.prev is not minHeapNode or heapKeyGreater(minHeapNode, child)):
+            raise InvariantError("first child of heap node %d is wrong" % minHeapNode.rideNumber)
+        return
+    heapNodesList = heap.heapNodesList
+    arity = heap.arity
+    i = minHeapNode.listIdx
+    if i > 1 and heapKeyGreater(heapNodesList[(i - 2) // arity + 1], minHeapNode):
+        raise InvariantError("heap node %d is smaller than its parent" % minHeapNode.rideNumber)
+    firstChildIdx = arity * (i - 1) + 2
+    for childIdx in range(firstChildIdx, min(firstChildIdx + arity, heap.currentHeapSize + 1)):
+        if heapKeyGreater(minHeapNode, heapNodesList[childIdx]):
+            raise InvariantError("heap node %d is larger than its child" % minHeapNode.rideNumber)
+
+
+# Checks that the tree node and the heap node of a ride point to each other and hold the same details
+def checkCrossPointers(rbtNode, heap):
+    minHeapNode = rbtNode.minHeapNode
+    if minHeapNode is None:
+        raise InvariantError("ride %d has no heap node" % rbtNode.rideNumber)
+    if minHeapNode.RBTNode is not rbtNode:
+        raise InvariantError("heap node of ride %d points to another tree node" % rbtNode.rideNumber)
+    checkHeapMembership(minHeapNode, heap)
+    if (minHeapNode.rideNumber, minHeapNode.rideCost, minHeapNode.tripDuration) != \
+            (rbtNode.rideNumber, rbtNode.rideCost, rbtNode.tripDuration):
+        raise InvariantError("tree and heap disagree on the details of ride %d" % rbtNode.rideNumber)
+
+
+# Checks the BST order and the priorities of the treap of the current version of versions, and that it holds the
+# same rides with the same details as sortedNodes, in order.
+# Time complexity : O(n)
+def checkVersions(versions, sortedNodes):
+    stack = [(versions.root, None, None)] if versions.root is not None else []
+    while stack:
+        node, low, high = stack.pop()
+        rideNumber, rideCost, tripDuration, priority, left, right = node
+        if (low is not None and rideNumber <= low) or (high is not None and rideNumber >= high):
+            raise InvariantError("version node %d is out of BST order" % rideNumber)
+        if priority != ride_versions.priorityOf(rideNumber):
+            raise InvariantError("version node %d has the wrong priority" % rideNumber)
+        for child, childLow, childHigh in ((left, low, rideNumber), (right, rideNumber, high)):
+            if child is not None:
+                if child[3] > priority:
+                    raise InvariantError("version node %d has a larger priority than its parent %d" % (
+                        child[0], rideNumber))
+                stack.append((child, childLow, childHigh))
+    rides = [node[:3] for node in versions.view().iterRange(-math.inf, math.inf)]
+    expected = [(node.rideNumber, node.rideCost, node.tripDuration) for node in sortedNodes]
+    for ride, expectedRide in zip(rides, expected):
+        if ride != expectedRide:
+            raise InvariantError("read version holds ride %r where the tree holds %r" % (ride, expectedRide))
+    if len(rides) != len(expected):
+        raise InvariantError("read version holds %d rides, the tree %d" % (len(rides), len(expected)))
+
+
+# Checks both structures of service and the pointers between them. Raises InvariantError on the first violation.
+# Returns (numberOfRides, treeHeight).
+# Time complexity : O(n)
+def checkService(service):
+    heap = service.minHeap
+    count, height = checkRedBlackTree(service.redBlack)
+    checkHeap(heap)
+    if count != heap.currentHeapSize:
+        raise InvariantError("tree holds %d rides, heap holds %d" % (count, heap.currentHeapSize))
+    for rbtNode in service.redBlack.nodes():
+        checkCrossPointers(rbtNode, heap)
+    if getattr(service, "versions", None) is not None:
+        checkVersions(service.versions, service.redBlack.nodes())
+    return count, height
+
+
+# Checks a random sample of the invariants after a fraction sampleRate of the commands.
+# A sample walks one random root-to-leaf path of the tree, checking its order, colors, aggregates, parent and cross
+# pointers, and compares its black count with the one of the leftmost path and its length with the height bound.
+# It also checks the heap order around the heap node of the last ride on the path.
+class SampledChecker:
+    def __init__(self, service, sampleRate=0.01, seed=None):
+        self.service = service
+        self.sampleRate = sampleRate
+        self.random = random.Random(seed)
+        self.commandsSeen = 0
+        self.samplesChecked = 0
+
+    # Called after every command. Raises InvariantError if the sample taken finds a violation.
+    def afterCommand(self):
+        self.commandsSeen += 1
+        if self.random.random() < self.sampleRate:
+            self.checkSample()
+
+    # Time complexity : O(logn)
+    def checkSample(self):
+        self.samplesChecked += 1
+        tree = self.service.redBlack
+        heap = self.service.minHeap
+        TNULL = tree.TNULL
+        root = tree.root
+        if root is TNULL:
+            if heap.currentHeapSize != 0:
+                raise InvariantError("tree is empty, heap holds %d rides" % heap.currentHeapSize)
+            return
+        if root.color is not red_black_tree.BLACK:
+            raise InvariantError("root %d is red" % root.rideNumber)
+        if root.size != heap.currentHeapSize:
+            raise InvariantError("tree holds %d rides, heap holds %d" % (root.size, heap.currentHeapSize))
+
+        expectedBlackCount = 0
+        node = root
+        while node is not TNULL:
+            if node.color is red_black_tree.BLACK:
+                expectedBlackCount += 1
+            node = node.left
+
+        blackCount = 0
+        depth = 0
+        lowerBound = upperBound = None
+        node = root
+        lastNode = root
+        while node is not TNULL:
+            lastNode = node
+            depth += 1
+            rideNumber = node.rideNumber
+            if (lowerBound is not None and rideNumber <= lowerBound) or (upperBound is not None and rideNumber >= upperBound):
+                raise InvariantError("rideNumber %d violates the BST order" % rideNumber)
+            if node.color is red_black_tree.BLACK:
+                blackCount += 1
+            elif node.left.color is red_black_tree.RED or node.right.color is red_black_tree.RED:
+                raise InvariantError("red node %d has a red child" % rideNumber)
+            for child in (node.left, node.right):
+                if child is not TNULL and child.parent is not node:
+                    raise InvariantError("parent pointer of %d does not point to %d" % (child.rideNumber, rideNumber))
+            checkAggregates(node)
+            checkCrossPointers(node, heap)
+            if self.random.random() < 0.5:
+                upperBound = rideNumber
+                node = node.left
+            else:
+                lowerBound = rideNumber
+                node = node.right
+        if blackCount != expectedBlackCount:
+            raise InvariantError("black height %d differs from %d" % (blackCount, expectedBlackCount))
+        if depth > maxRedBlackHeight(heap.currentHeapSize):
+            raise InvariantError("path of length %d exceeds the height bound for %d rides" %
+                                 (depth, heap.currentHeapSize))
+
+        checkHeapEntry(lastNode.minHeapNode, heap)
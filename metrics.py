@@ -0,0 +1,110 @@
+# Opt-in metrics for CabService, RedBlackTree and MinHeap
+#
+# A Metrics object is attached to the structures only when metrics are enabled. The structures check for it
+# with a single "is not None" test at the end of a rotation, rebalance loop or heapify, so the cost is negligible
+# when it is absent. The command engine uses a separate timed loop when metrics are enabled.
+
+import time
+
+# Latency histograms use power-of-two buckets in microseconds: bucket k counts latencies in [2^(k-1), 2^k) us,
+# bucket 0 counts latencies below 1us.
+NUM_LATENCY_BUCKETS = 32
+
+# Number of tree height / heap size samples kept; older samples are dropped
+MAX_SAMPLES = 1000
+
+# Number of commands between two tree height / heap size samples. The interval is stretched to the number of rides
+# when there are more, so that the O(n) height walk costs O(1) amortized per command.
+SAMPLE_INTERVAL = 1000
+
+
+class Metrics:
+    def __init__(self):
+        self.commandCounts = {}
+        self.latencyHistograms = {}
+        self.latencyTotals = {}
+        self.leftRotations = 0
+        self.rightRotations = 0
+        self.insertRebalanceIterations = 0
+        self.deleteRebalanceIterations = 0
+        self.siftUps = 0
+        self.siftUpLevels = 0
+        self.maxSiftUpLevels = 0
+        self.siftDowns = 0
+        self.siftDownLevels = 0
+        self.maxSiftDownLevels = 0
+        self.commandsSeen = 0
+        self.samples = []
+        self.startTime = time.perf_counter()
+
+    # Records count executions of the named command that took seconds in total
+    def recordCommand(self, name, seconds, count=1):
+        histogram = self.latencyHistograms.get(name)
+        if histogram is None:
+            histogram = self.latencyHistograms[name] = [0] * NUM_LATENCY_BUCKETS
+            self.commandCounts[name] = 0
+            self.latencyTotals[name] = 0.0
+        bucket = min(int(seconds / count * 1000000).bit_length(),
+                     NUM_LATENCY_BUCKETS - 1)
+        histogram[bucket] += count
+        self.commandCounts[name] += count
+        self.latencyTotals[name] += seconds
+        self.commandsSeen += count
+
+    def recordSiftUp(self, levels):
+        self.siftUps += 1
+        self.siftUpLevels += levels
+        if levels > self.maxSiftUpLevels:
+            self.maxSiftUpLevels = levels
+
+    def recordSiftDown(self, levels):
+        self.siftDowns += 1
+        self.siftDownLevels += levels
+        if levels > self.maxSiftDownLevels:
+            self.maxSiftDownLevels = levels
+
+    # Records the current tree height and heap size. Computing the height visits every node, so this is called
+    # periodically rather than per command.
+    def sample(self, treeHeight, heapSize):
+        self.samples.append((self.commandsSeen, treeHeight, heapSize))
+        if len(self.samples) > MAX_SAMPLES:
+            del self.samples[0]
+
+    # Returns the smallest latency in seconds below which the fraction of the named command's executions fall,
+    # using the upper bound of the histogram bucket.
+    def latencyPercentile(self, name, fraction):
+        histogram = self.latencyHistograms[name]
+        target = fraction * self.commandCounts[name]
+        seen = 0
+        for bucket, count in enumerate(histogram):
+            seen += count
+            if seen >= target:
+                return (1 << bucket) / 1000000.0
+        return (1 << (NUM_LATENCY_BUCKETS - 1)) / 1000000.0
+
+    # Returns a single-line summary of the structural churn and the latest sample
+    def summaryLine(self):
+        height, heapSize = (self.samples[-1][1:] if self.samples else (0, 0))
+        return ("# stats commands=%d rotations=%d insertRebalance=%d deleteRebalance=%d "
+                "siftUpLevels=%d siftDownLevels=%d treeHeight=%d heapSize=%d" %
+                (self.commandsSeen, self.leftRotations + self.rightRotations, self.insertRebalanceIterations,
+                 self.deleteRebalanceIterations, self.siftUpLevels, self.siftDownLevels, height, heapSize))
+
+    # Returns all metrics as text lines starting with "# "
+    def dump(self):
+        lines = [self.summaryLine()]
+        elapsed = time.perf_counter() - self.startTime
+        lines.append("# elapsed=%.3fs leftRotations=%d rightRotations=%d siftUps=%d maxSiftUpLevels=%d "
+                     "siftDowns=%d maxSiftDownLevels=%d" %
+                     (elapsed, self.leftRotations, self.rightRotations, self.siftUps, self.maxSiftUpLevels,
+                      self.siftDowns, self.maxSiftDownLevels))
+        for name in sorted(self.commandCounts):
+            count = self.commandCounts[name]
+            lines.append("# command=%s count=%d meanUs=%.2f p50Us<=%g p99Us<=%g" %
+                         (name, count, self.latencyTotals[name] / count * 1000000,
+                          self.latencyPercentile(name, 0.5) * 1000000,
+                          self.latencyPercentile(name, 0.99) * 1000000))
+        for commandsSeen, treeHeight, heapSize in self.samples:
+            lines.append("# sample commands=%d treeHeight=%d heapSize=%d" %
+                         (commandsSeen, treeHeight, heapSize))
+        return lines
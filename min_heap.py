@@ -1,6 +1,29 @@
 # Min Heap stores nodes according to their rideCost
+#
+# Priority queue backends of CabService (MinHeap, dary_heap.DaryHeap, pairing_heap.PairingHeap) share one interface:
+#   insert(rideNumber, rideCost, tripDuration, RBTNode) returns a handle node with rideNumber, rideCost,
+#       tripDuration and RBTNode attributes. The RBTNode stores it as its minHeapNode.
+#   deleteMin() removes and returns the handle with the smallest (rideCost, tripDuration), or None.
+#   deleteNode(handle) and updateKey(handle, rideCost, tripDuration) delete or rekey the ride of a handle.
+#   bulkInsert, deleteNodes, peekSmallest, nodesInHeapOrder and loadHeapOrder work on batches.
+#   peekSmallest(k) returns the k handles with the smallest (rideCost, tripDuration) and keeps the rides and their
+#       handles. The array heaps do not change at all; the pairing heap relinks its nodes, so it counts as a write:
+#       only the writer may call it, and nothing may depend on the shape of a heap, not even the write-ahead log,
+#       which names the rides GetNextRide removes.
+#   currentHeapSize is the number of rides, arity the number of children per node of an array heap (0 otherwise)
+#   and metrics an optional metrics.Metrics.
 
+import heapq
+
+# A batch of deletions rebuilds the heap in O(n) instead of deleting node by node once it holds at least
+# 1/BATCH_REBUILD_FACTOR of the nodes
+BATCH_REBUILD_FACTOR = 4
+
+# Heap nodes use __slots__ so that every ride costs a fixed, small amount of memory
+# and attribute lookups in the heapify loops do not go through a per-node dict.
 class MinHeapNode:
+    __slots__ = ("rideNumber", "rideCost", "tripDuration", "listIdx", "RBTNode")
+
     def __init__(self, rideNumber, rideCost, tripDuration, listIdx, RBTNode):
         self.rideNumber = rideNumber
         self.rideCost = rideCost
@@ -10,42 +33,76 @@ class MinHeapNode:
 
 
 class MinHeap:
+    arity = 2
+
     def __init__(self):
         node = MinHeapNode(0, 0, 0, 0, None)
         # Initializing heap with a dummy node for ease with finding parent and child indices.
         self.heapNodesList = [node]
         self.currentHeapSize = 0
+        # Optional metrics.Metrics that records the number of levels every heapify moves a node
+        self.metrics = None
 
     # Moves the value up in the tree to maintain the heap property.
+    # Instead of swapping at every level, larger parents are shifted down into the hole and
+    # the moving node is written once at its final position.
     # Time complexity: O(height) = O(log n)
     def heapifyUpwards(self, i):
+        startIdx = i
+        heapNodesList = self.heapNodesList
+        node = heapNodesList[i]
+        rideCost = node.rideCost
+        tripDuration = node.tripDuration
         # While the element is not the root and the child is smaller than the parent, keep looping
-        while (i // 2 > 0):
-            # If the element is less than its parent, swap the elements
-            if (self.heapNodesList[i].rideCost < self.heapNodesList[i // 2].rideCost) or (self.heapNodesList[i].rideCost == self.heapNodesList[i // 2].rideCost and self.heapNodesList[i].tripDuration < self.heapNodesList[i // 2].tripDuration):
-                self.heapNodesList[i], self.heapNodesList[i //
-                                                          2] = self.heapNodesList[i // 2], self.heapNodesList[i]
-                # Update the listIdx of the swapped nodes
-                self.heapNodesList[i].listIdx = i
-                self.heapNodesList[i//2].listIdx = i//2
-                i = i // 2  # Parent's index
+        while i > 1:
+            parentIdx = i >> 1
+            parent = heapNodesList[parentIdx]
+            parentCost = parent.rideCost
+            if rideCost < parentCost or (rideCost == parentCost and tripDuration < parent.tripDuration):
+                # Move the parent into the hole
+                heapNodesList[i] = parent
+                parent.listIdx = i
+                i = parentIdx
             else:
                 break
+        heapNodesList[i] = node
+        node.listIdx = i
+        if self.metrics is not None:
+            self.metrics.recordSiftUp(startIdx.bit_length() - i.bit_length())
 
     # Moves the value down in the tree to maintain the heap property.
+    # Smaller children are shifted up into the hole and the moving node is written once at its final position.
     # Time complexity: O(height) = O(log n)
     def heapifyDownwards(self, i):
-        # While the element is not a leaf and the child is smaller than the parent, keep looping
-        while (i * 2) <= self.currentHeapSize:
-            # Get the index of the min child of the current node
-            minChildIdx = self.getMinChildIdx(i)
-            # Swap the values of the current element is greater than its min child
-            if (self.heapNodesList[i].rideCost > self.heapNodesList[minChildIdx].rideCost) or (self.heapNodesList[i].rideCost == self.heapNodesList[minChildIdx].rideCost and self.heapNodesList[i].tripDuration > self.heapNodesList[minChildIdx].tripDuration):
-                self.heapNodesList[i], self.heapNodesList[minChildIdx] = self.heapNodesList[minChildIdx], self.heapNodesList[i]
-                # Update the listIdx of the swapped nodes
-                self.heapNodesList[i].listIdx = i
-                self.heapNodesList[minChildIdx].listIdx = minChildIdx
-            i = minChildIdx
+        startIdx = i
+        heapNodesList = self.heapNodesList
+        heapSize = self.currentHeapSize
+        node = heapNodesList[i]
+        rideCost = node.rideCost
+        tripDuration = node.tripDuration
+        childIdx = i * 2
+        # While the element is not a leaf and the min child is smaller than the element, keep looping
+        while childIdx <= heapSize:
+            child = heapNodesList[childIdx]
+            if childIdx < heapSize:
+                # Pick the right child unless the left child is strictly smaller
+                rightChild = heapNodesList[childIdx + 1]
+                if not (child.rideCost < rightChild.rideCost or (child.rideCost == rightChild.rideCost and child.tripDuration < rightChild.tripDuration)):
+                    childIdx += 1
+                    child = rightChild
+            childCost = child.rideCost
+            if childCost < rideCost or (childCost == rideCost and child.tripDuration < tripDuration):
+                # Move the min child into the hole
+                heapNodesList[i] = child
+                child.listIdx = i
+                i = childIdx
+                childIdx = i * 2
+            else:
+                break
+        heapNodesList[i] = node
+        node.listIdx = i
+        if self.metrics is not None:
+            self.metrics.recordSiftDown(i.bit_length() - startIdx.bit_length())
 
     # Inserts a value into the heap by adding the new value at the end of the heap and heapifying it upwards
     # Time complexity : O(height) = O(logn)
@@ -59,19 +116,7 @@ class MinHeap:
         self.heapifyUpwards(self.currentHeapSize)
         return newNode
 
-    # Gets the index of the smaller child
-    def getMinChildIdx(self, i):
-        # Case where node has only 1 child. Return the index of that child
-        if (i*2)+1 > self.currentHeapSize:
-            return i * 2
-        else:
-            # Case where node has 2 children. Compare the children and return the index of the min child
-            if (self.heapNodesList[i*2].rideCost < self.heapNodesList[(i*2)+1].rideCost) or (self.heapNodesList[i*2].rideCost == self.heapNodesList[(i*2)+1].rideCost and self.heapNodesList[i*2].tripDuration < self.heapNodesList[(i*2)+1].tripDuration):
-                return i * 2
-            else:
-                return (i * 2) + 1
-
-    # Deletes the root by swapping it with the last heap element. Then heapifies the last element
+    # Deletes the root by moving the last heap element to the root. Then heapifies it downwards
     # Time complexity : O(height) = O(logn)
     def deleteMin(self):
         # Equal to 1 since the heap list was initialized with a value
@@ -80,17 +125,14 @@ class MinHeap:
 
         root = self.heapNodesList[1]  # Get root
 
-        # Swap the root with the last heap node
-        self.heapNodesList[1], self.heapNodesList[self.currentHeapSize] = self.heapNodesList[self.currentHeapSize], self.heapNodesList[1]
-        self.heapNodesList[1].listIdx = 1
-        self.heapNodesList[self.currentHeapSize].listIdx = self.currentHeapSize
-
-        # Pop the last heap element (This was set to the root node which we want to delete)
-        self.heapNodesList.pop(-1)
+        # Pop the last heap node and move it to the root
+        lastNode = self.heapNodesList.pop()
         self.currentHeapSize -= 1
 
-        # Heapify to satisfy the heap property
-        self.heapifyDownwards(1)
+        if self.currentHeapSize > 0:
+            self.heapNodesList[1] = lastNode
+            # Heapify to satisfy the heap property
+            self.heapifyDownwards(1)
 
         return root
 
@@ -98,17 +140,19 @@ class MinHeap:
     # Time complexity : O(height) = O(logn)
     def deleteArbitraryByIdx(self, idx):
         oldNode = self.heapNodesList[idx]
-        newNode = self.heapNodesList[self.currentHeapSize]
-
-        # Swap the node at idx index with the last heap node
-        self.heapNodesList[idx], self.heapNodesList[self.currentHeapSize] = self.heapNodesList[self.currentHeapSize], self.heapNodesList[idx]
-        self.heapNodesList[idx].listIdx = idx
-        self.heapNodesList[self.currentHeapSize].listIdx = self.currentHeapSize
 
         # Pop the last node and reduce the heapSize
-        self.heapNodesList.pop(self.currentHeapSize)
+        newNode = self.heapNodesList.pop()
         self.currentHeapSize -= 1
 
+        if idx > self.currentHeapSize:
+            # The deleted node was the last heap node
+            return
+
+        # Move the last node into the position of the deleted node
+        self.heapNodesList[idx] = newNode
+        newNode.listIdx = idx
+
         if newNode.rideCost < oldNode.rideCost:
             # If the new rideCost is lesser, we only need to heapify upwards
             self.heapifyUpwards(idx)
@@ -120,3 +164,110 @@ class MinHeap:
                 self.heapifyUpwards(idx)
             elif newNode.tripDuration > oldNode.tripDuration:
                 self.heapifyDownwards(idx)
+
+    # Deletes the heap node given as a handle
+    # Time complexity : O(height) = O(logn)
+    def deleteNode(self, node):
+        self.deleteArbitraryByIdx(node.listIdx)
+
+    # Changes the rideCost and tripDuration of a heap node in place and restores the heap property.
+    # A smaller key only needs to move upwards and a larger key only needs to move downwards.
+    # Time complexity : O(height) = O(logn)
+    def updateKey(self, node, rideCost, tripDuration):
+        idx = node.listIdx
+        oldRideCost = node.rideCost
+        oldTripDuration = node.tripDuration
+        node.rideCost = rideCost
+        node.tripDuration = tripDuration
+
+        if rideCost < oldRideCost or (rideCost == oldRideCost and tripDuration < oldTripDuration):
+            self.heapifyUpwards(idx)
+        elif rideCost > oldRideCost or (rideCost == oldRideCost and tripDuration > oldTripDuration):
+            self.heapifyDownwards(idx)
+
+    # Returns the k nodes with the smallest (rideCost, tripDuration) in ascending order without changing the heap.
+    # Walks the heap from the root with a frontier of candidate indices: a node can only be among the smallest
+    # once its parent has been taken, so the frontier holds at most k+1 entries.
+    # Time complexity : O(klogk)
+    def peekSmallest(self, k):
+        heapNodesList = self.heapNodesList
+        heapSize = self.currentHeapSize
+        smallest = []
+        if heapSize == 0 or k < 1:
+            return smallest
+        root = heapNodesList[1]
+        frontier = [(root.rideCost, root.tripDuration, 1)]
+        while frontier and len(smallest) < k:
+            i = heapq.heappop(frontier)[2]
+            smallest.append(heapNodesList[i])
+            for childIdx in (2 * i, 2 * i + 1):
+                if childIdx <= heapSize:
+                    child = heapNodesList[childIdx]
+                    heapq.heappush(frontier, (child.rideCost, child.tripDuration, childIdx))
+        return smallest
+
+    # Deletes a batch of heap nodes. Small batches are deleted one by one; once the batch holds at least
+    # 1/BATCH_REBUILD_FACTOR of the heap, the remaining nodes are compacted and heapified bottom-up instead.
+    # Time complexity : O(min(n, mlogn)) for m nodes
+    def deleteNodes(self, nodes):
+        if len(nodes) * BATCH_REBUILD_FACTOR < self.currentHeapSize:
+            for node in nodes:
+                self.deleteArbitraryByIdx(node.listIdx)
+            return
+        # listIdx 0 marks the deleted nodes, as it is never a valid index
+        for node in nodes:
+            node.listIdx = 0
+        heapNodesList = [self.heapNodesList[0]]
+        heapNodesList.extend(node for node in self.heapNodesList[1:] if node.listIdx)
+        for i in range(1, len(heapNodesList)):
+            heapNodesList[i].listIdx = i
+        self.heapNodesList = heapNodesList
+        self.currentHeapSize = len(heapNodesList) - 1
+        self.heapify()
+
+    # Restores the heap property of the whole list bottom-up, starting from the last internal node.
+    # Time complexity : O(n)
+    def heapify(self):
+        for i in range(self.currentHeapSize // 2, 0, -1):
+            self.heapifyDownwards(i)
+
+    # Inserts a batch of rides given as (rideNumber, rideCost, tripDuration, RBTNode) tuples.
+    # When the batch is at least as large as the heap, all nodes are appended and the heap is rebuilt bottom-up in
+    # O(n+m); otherwise every node is heapified upwards on its own.
+    # Returns the new heap nodes in the order of rides.
+    # Time complexity : O(min(n+m, m*logn))
+    def bulkInsert(self, rides):
+        heapNodesList = self.heapNodesList
+        rebuild = len(rides) >= self.currentHeapSize
+        newNodes = []
+        for rideNumber, rideCost, tripDuration, RBTNode in rides:
+            self.currentHeapSize += 1
+            newNode = MinHeapNode(rideNumber, rideCost,
+                                  tripDuration, self.currentHeapSize, RBTNode)
+            heapNodesList.append(newNode)
+            newNodes.append(newNode)
+            if not rebuild:
+                self.heapifyUpwards(self.currentHeapSize)
+        if rebuild:
+            self.heapify()
+        return newNodes
+
+    # Returns the heap nodes in heap list order
+    # Time complexity : O(n)
+    def nodesInHeapOrder(self):
+        return self.heapNodesList[1:self.currentHeapSize + 1]
+
+    # Replaces the contents of the heap with rides given as (rideNumber, rideCost, tripDuration, RBTNode) tuples in
+    # heap list order, e.g. as saved by nodesInHeapOrder(). If ordered is True the order must already satisfy the
+    # heap property, otherwise the list is heapified.
+    # Returns the new heap nodes in the order of rides.
+    # Time complexity : O(n)
+    def loadHeapOrder(self, rides, ordered=True):
+        self.heapNodesList = [self.heapNodesList[0]]
+        self.heapNodesList.extend(MinHeapNode(rideNumber, rideCost, tripDuration, listIdx, RBTNode)
+                                  for listIdx, (rideNumber, rideCost, tripDuration, RBTNode) in enumerate(rides, 1))
+        self.currentHeapSize = len(self.heapNodesList) - 1
+        newNodes = self.heapNodesList[1:]
+        if not ordered:
+            self.heapify()
+        return newNodes
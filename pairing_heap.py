@@ -0,0 +1,188 @@
+# Pairing Heap stores nodes according to their rideCost
+#
+# A heap-ordered multiway tree stored with child and sibling pointers. Every node also points to prev: its parent if it
+# is the first child, otherwise its left sibling. Insert and merging two trees (meld) are O(1); deleteMin merges the
+# children of the root in two passes in O(logn) amortized. Deleting or rekeying an arbitrary node cuts its subtree out
+# in O(1) through prev and melds it back, so update-heavy workloads never walk a path of the heap.
+# Nodes are the handles stored in RBTNode.minHeapNode.
+
+
+class PairingHeapNode:
+    __slots__ = ("rideNumber", "rideCost", "tripDuration", "RBTNode", "child", "sibling", "prev")
+
+    def __init__(self, rideNumber, rideCost, tripDuration, RBTNode):
+        self.rideNumber = rideNumber
+        self.rideCost = rideCost
+        self.tripDuration = tripDuration
+        self.RBTNode = RBTNode
+        self.child = None
+        self.sibling = None
+        self.prev = None
+
+
+class PairingHeap:
+    # Not an array heap, so no saved list order can be used as is
+    arity = 0
+
+    def __init__(self):
+        self.root = None
+        self.currentHeapSize = 0
+        # Unused: a pairing heap does not sift, but the attribute is part of the backend interface
+        self.metrics = None
+
+    # Links two roots and returns the new root: the one with the larger (rideCost, tripDuration) becomes the first
+    # child of the other.
+    # Time complexity : O(1)
+    def meld(self, node1, node2):
+        if node1 is None:
+            return node2
+        if node2 is None:
+            return node1
+        if node2.rideCost < node1.rideCost or (node2.rideCost == node1.rideCost and node2.tripDuration < node1.tripDuration):
+            node1, node2 = node2, node1
+        child = node1.child
+        node2.sibling = child
+        if child is not None:
+            child.prev = node2
+        node2.prev = node1
+        node1.child = node2
+        return node1
+
+    # Merges a list of sibling subtrees starting at first into one tree: pairs are melded left to right, then the
+    # results are melded right to left. Returns the new root.
+    # Time complexity : O(number of siblings)
+    def mergePairs(self, first):
+        pairs = []
+        node = first
+        while node is not None:
+            node1 = node
+            node2 = node1.sibling
+            if node2 is None:
+                node = None
+            else:
+                node = node2.sibling
+                node2.sibling = node2.prev = None
+            node1.sibling = node1.prev = None
+            pairs.append(self.meld(node1, node2))
+        root = None
+        for subtree in reversed(pairs):
+            root = self.meld(subtree, root)
+        return root
+
+    # Detaches the subtree of a node that is not the root from its parent and siblings
+    # Time complexity : O(1)
+    def cut(self, node):
+        prev = node.prev
+        sibling = node.sibling
+        if prev.child is node:
+            prev.child = sibling
+        else:
+            prev.sibling = sibling
+        if sibling is not None:
+            sibling.prev = prev
+        node.prev = node.sibling = None
+
+    # Inserts a ride as a one node tree melded with the root
+    # Time complexity : O(1)
+    def insert(self, rideNumber, rideCost, tripDuration, RBTNode):
+        node = PairingHeapNode(rideNumber, rideCost, tripDuration, RBTNode)
+        self.root = self.meld(self.root, node)
+        self.currentHeapSize += 1
+        return node
+
+    # Removes the root and merges its children
+    # Time complexity : O(logn) amortized
+    def deleteMin(self):
+        root = self.root
+        if root is None:
+            return None
+        self.root = self.mergePairs(root.child)
+        root.child = None
+        self.currentHeapSize -= 1
+        return root
+
+    # Deletes an arbitrary node: its subtree is cut out and its children are merged and melded with the root
+    # Time complexity : O(logn) amortized
+    def deleteNode(self, node):
+        if node is self.root:
+            self.deleteMin()
+            return
+        self.cut(node)
+        self.root = self.meld(self.root, self.mergePairs(node.child))
+        node.child = None
+        self.currentHeapSize -= 1
+
+    # Changes the rideCost and tripDuration of a node. A smaller key cuts the subtree out and melds it with the root.
+    # A larger key may violate the order below the node, so the node is deleted and melded back as a single node.
+    # Time complexity : O(1) for a smaller key, O(logn) amortized for a larger one
+    def updateKey(self, node, rideCost, tripDuration):
+        oldRideCost = node.rideCost
+        oldTripDuration = node.tripDuration
+        node.rideCost = rideCost
+        node.tripDuration = tripDuration
+        if rideCost < oldRideCost or (rideCost == oldRideCost and tripDuration < oldTripDuration):
+            if node is not self.root:
+                self.cut(node)
+                self.root = self.meld(self.root, node)
+        elif rideCost > oldRideCost or (rideCost == oldRideCost and tripDuration > oldTripDuration):
+            children = node.child
+            node.child = None
+            if node is self.root:
+                self.root = self.mergePairs(children)
+            else:
+                self.cut(node)
+                self.root = self.meld(self.root, self.mergePairs(children))
+            self.root = self.meld(self.root, node)
+
+    # Inserts a batch of rides given as (rideNumber, rideCost, tripDuration, RBTNode) tuples.
+    # Returns the new heap nodes in the order of rides.
+    # Time complexity : O(m)
+    def bulkInsert(self, rides):
+        insert = self.insert
+        return [insert(rideNumber, rideCost, tripDuration, RBTNode)
+                for rideNumber, rideCost, tripDuration, RBTNode in rides]
+
+    # Deletes a batch of heap nodes
+    # Time complexity : O(mlogn) amortized
+    def deleteNodes(self, nodes):
+        for node in nodes:
+            self.deleteNode(node)
+
+    # Returns the k nodes with the smallest (rideCost, tripDuration) in ascending order without changing the rides in
+    # the heap or their handles, but unlike the array heaps it changes the links between the nodes.
+    # Siblings are not ordered among themselves, so a frontier walk would have to push every child of a taken node,
+    # and the root has n children after n inserts. Instead the k nodes are removed with deleteMin and melded back as
+    # single nodes, which also consolidates the root list the way a deleteMin would. The tie order among equal
+    # (rideCost, tripDuration) may change, which is why GetNextRide logs the rideNumber it removed.
+    # Time complexity : O(klogn) amortized
+    def peekSmallest(self, k):
+        smallest = []
+        while len(smallest) < k and self.root is not None:
+            smallest.append(self.deleteMin())
+        for node in smallest:
+            self.root = self.meld(self.root, node)
+        self.currentHeapSize += len(smallest)
+        return smallest
+
+    # Returns all heap nodes, every node before its children
+    # Time complexity : O(n)
+    def nodesInHeapOrder(self):
+        nodes = []
+        stack = [self.root] if self.root is not None else []
+        while stack:
+            node = stack.pop()
+            nodes.append(node)
+            child = node.child
+            while child is not None:
+                stack.append(child)
+                child = child.sibling
+        return nodes
+
+    # Replaces the contents of the heap with rides given as (rideNumber, rideCost, tripDuration, RBTNode) tuples.
+    # The saved order is not needed, every ride is simply melded in.
+    # Returns the new heap nodes in the order of rides.
+    # Time complexity : O(n)
+    def loadHeapOrder(self, rides, ordered=True):
+        self.root = None
+        self.currentHeapSize = 0
+        return self.bulkInsert(rides)
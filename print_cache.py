@@ -0,0 +1,70 @@
+# Bounded cache of Print(rideNumber) results for CabService
+#
+# Maps a rideNumber to the line Print writes for it, including the (0,0,0) line of a ride that does not exist, or to
+# the (rideNumber, rideCost, tripDuration) of the record it writes when the results are typed.
+# CabService invalidates the rideNumbers that a mutation touches, so a cached line is always the one a search of the
+# RBTree would produce. When the cache is full, the least recently used entry ("lru") or the entry that was cached
+# first ("fifo") is evicted.
+
+import collections
+
+EVICTION_POLICIES = ("lru", "fifo")
+
+
+class PrintCache:
+    def __init__(self, capacity, policy="lru"):
+        if capacity < 1:
+            raise ValueError("Print cache capacity must be at least 1")
+        if policy not in EVICTION_POLICIES:
+            raise ValueError("Unknown eviction policy: " + policy)
+        self.capacity = capacity
+        self.policy = policy
+        self.moveOnHit = policy == "lru"
+        self.entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # Returns the cached line for rideNumber, or None if it is not cached
+    # Time complexity : O(1)
+    def get(self, rideNumber):
+        line = self.entries.get(rideNumber)
+        if line is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        if self.moveOnHit:
+            self.entries.move_to_end(rideNumber)
+        return line
+
+    # Caches the line for a rideNumber that is not cached, evicting the first entry in order if the cache is full
+    # Time complexity : O(1)
+    def put(self, rideNumber, line):
+        entries = self.entries
+        entries[rideNumber] = line
+        if len(entries) > self.capacity:
+            entries.popitem(last=False)
+            self.evictions += 1
+
+    # Drops the cached line of rideNumber, if any
+    # Time complexity : O(1)
+    def invalidate(self, rideNumber):
+        if self.entries.pop(rideNumber, None) is not None:
+            self.invalidations += 1
+
+    # Drops all cached lines
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+
+    # Returns the fraction of lookups that were hits
+    def hitRate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    # Returns the counters as a single "# print cache ..." line
+    def summaryLine(self):
+        return "# print cache policy=%s capacity=%d size=%d hits=%d misses=%d hitRate=%.3f evictions=%d invalidations=%d" % (
+            self.policy, self.capacity, len(self.entries), self.hits, self.misses, self.hitRate(), self.evictions,
+            self.invalidations)
@@ -1,6 +1,21 @@
 # Red Black Tree stores nodes according to rideNumber
 
+# Colors are stored as booleans so that every node holds a shared singleton instead of a string
+RED = True
+BLACK = False
+
+# A batch of deletions rebuilds the tree in O(n) instead of deleting node by node once it holds at least
+# 1/BATCH_REBUILD_FACTOR of the nodes
+BATCH_REBUILD_FACTOR = 4
+
+
+# Tree nodes use __slots__ to keep the per-ride memory small when millions of rides are resident.
+# Every node is augmented with the number of nodes (size) and the sum of the rideCosts (costSum) of its subtree,
+# which answer order-statistic and range aggregate queries in O(logn).
 class RBTNode():
+    __slots__ = ("rideNumber", "rideCost", "tripDuration", "parent",
+                 "left", "right", "color", "minHeapNode", "size", "costSum", "deadline")
+
     def __init__(self, rideNumber, rideCost, tripDuration):
         self.rideNumber = rideNumber
         self.rideCost = rideCost
@@ -8,96 +23,132 @@ class RBTNode():
         self.parent = None
         self.left = None
         self.right = None
-        self.color = "red"
+        self.color = RED
         self.minHeapNode = None
+        self.size = 1
+        self.costSum = rideCost
+        # Time at which the ride expires, if the service has a TTL
+        self.deadline = None
+
+    # Updates the ride details in place. The rideNumber is the key of the tree, so the node does not move,
+    # but a changed rideCost has to be added to the costSum of every ancestor.
+    # Time complexity: O(logn)
+    def updatePayload(self, rideCost, tripDuration):
+        delta = rideCost - self.rideCost
+        self.rideCost = rideCost
+        self.tripDuration = tripDuration
+        node = self
+        while delta and node is not None:
+            node.costSum += delta
+            node = node.parent
 
 
 class RedBlackTree():
     def __init__(self):
+        # Sentinel shared by every leaf and by the parent of the root's missing children
         self.TNULL = RBTNode(0, 0, 0)
         self.TNULL.left = None
         self.TNULL.right = None
-        self.TNULL.color = "black"
+        self.TNULL.color = BLACK
         self.TNULL.minHeapNode = None
+        self.TNULL.size = 0
+        self.TNULL.costSum = 0
         self.root = self.TNULL
+        # Optional metrics.Metrics that records rotations and rebalance loop iterations
+        self.metrics = None
 
     # Balancing the tree after deletion. Various cases considered depending on the color of parent, sibling and sibling's children.
     def balanceAfterDelete(self, currNode):
+        iterations = 0
         # Keep looping till the currNode becomes red or we reach the root
-        while currNode != self.root and currNode.color == "black":
+        while currNode is not self.root and currNode.color is BLACK:
+            iterations += 1
             # If currNode is the left child of its parent, get the sibling and check its color.
-            if currNode == currNode.parent.left:
+            if currNode is currNode.parent.left:
                 siblingNode = currNode.parent.right
-                if siblingNode.color == "red":
-                    siblingNode.color = "black"
-                    currNode.parent.color = "red"
+                if siblingNode.color is RED:
+                    siblingNode.color = BLACK
+                    currNode.parent.color = RED
                     # Rotate left with currNode=black, parent=red, sibling=black
                     self.rotateLeft(currNode.parent)
                     siblingNode = currNode.parent.right
 
                 # Check the color of sibling's children
-                if siblingNode.left.color == "black" and siblingNode.right.color == "black":
+                if siblingNode.left.color is BLACK and siblingNode.right.color is BLACK:
                     # If both of sibling's children are black, color the sibling red and move the problem to the parent.
-                    siblingNode.color = "red"
+                    siblingNode.color = RED
                     currNode = currNode.parent
                 else:
-                    if siblingNode.right.color == "black":
+                    if siblingNode.right.color is BLACK:
                         # If sibling's right child is black, color the sibling red and its left child black. Perform a rotateRight() on the sibling
-                        siblingNode.left.color = "black"
-                        siblingNode.color = "red"
+                        siblingNode.left.color = BLACK
+                        siblingNode.color = RED
                         self.rotateRight(siblingNode)
                         siblingNode = currNode.parent.right
 
                     siblingNode.color = currNode.parent.color
-                    currNode.parent.color = "black"
-                    siblingNode.right.color = "black"
+                    currNode.parent.color = BLACK
+                    siblingNode.right.color = BLACK
                     self.rotateLeft(currNode.parent)
                     currNode = self.root
             else:
                 siblingNode = currNode.parent.left
-                if siblingNode.color == "red":
-                    siblingNode.color = "black"
-                    currNode.parent.color = "red"
+                if siblingNode.color is RED:
+                    siblingNode.color = BLACK
+                    currNode.parent.color = RED
                     self.rotateRight(currNode.parent)
                     siblingNode = currNode.parent.left
 
-                if siblingNode.right.color == "black" and siblingNode.right.color == "black":
-                    siblingNode.color = "red"
+                if siblingNode.left.color is BLACK and siblingNode.right.color is BLACK:
+                    siblingNode.color = RED
                     currNode = currNode.parent
                 else:
-                    if siblingNode.left.color == "black":
-                        siblingNode.right.color = "black"
-                        siblingNode.color = "red"
+                    if siblingNode.left.color is BLACK:
+                        siblingNode.right.color = BLACK
+                        siblingNode.color = RED
                         self.rotateLeft(siblingNode)
                         siblingNode = currNode.parent.left
 
                     siblingNode.color = currNode.parent.color
-                    currNode.parent.color = "black"
-                    siblingNode.left.color = "black"
+                    currNode.parent.color = BLACK
+                    siblingNode.left.color = BLACK
                     self.rotateRight(currNode.parent)
                     currNode = self.root
-        currNode.color = "red"
+        currNode.color = BLACK
+        if self.metrics is not None:
+            self.metrics.deleteRebalanceIterations += iterations
 
     # Performs a rotate operation to fix the red black tree
     def rbRotate(self, node1, node2):
-        if node1.parent == None:
+        if node1.parent is None:
             self.root = node2
-        elif node1 == node1.parent.left:    # If u is the left child of its parent
+        elif node1 is node1.parent.left:    # If u is the left child of its parent
             node1.parent.left = node2
         else:
             node1.parent.right = node2
         node2.parent = node1.parent
 
+    # Removes one ride with rideCost from the size and costSum of node and all its ancestors up to, but excluding,
+    # stopNode
+    # Time complexity: O(logn)
+    def removeFromAggregates(self, node, rideCost, stopNode=None):
+        while node is not stopNode:
+            node.size -= 1
+            node.costSum -= rideCost
+            node = node.parent
+
     # Deletes a node from RBTree. Various cases depending on the color of node and the presence of child nodes.
-    # Once the node is deleted, any red black tree rule violations are fixed by balanceAfterDelete().
+    # The deleted ride is first removed from the subtree aggregates of its ancestors. Once the node is deleted, any
+    # red black tree rule violations are fixed by balanceAfterDelete().
     # Time complexity: O(logn)
     def deleteNode(self, node1):
         node2 = node1
         node2_original_color = node2.color
-        if node1.left == self.TNULL:
+        self.removeFromAggregates(node1.parent, node1.rideCost)
+        if node1.left is self.TNULL:
             node3 = node1.right
             self.rbRotate(node1, node1.right)
-        elif (node1.right == self.TNULL):
+        elif (node1.right is self.TNULL):
             node3 = node1.left
             self.rbRotate(node1, node1.left)
         else:
@@ -105,7 +156,11 @@ class RedBlackTree():
             node2 = self.getInorderSuccessor(node1.right)
             node2_original_color = node2.color
             node3 = node2.right
-            if node2.parent == node1:
+            # The nodes between the successor and node lose the successor, which takes over the subtree of node
+            self.removeFromAggregates(node2.parent, node2.rideCost, node1)
+            node2.size = node1.size - 1
+            node2.costSum = node1.costSum - node1.rideCost
+            if node2.parent is node1:
                 node3.parent = node2
             else:
                 self.rbRotate(node2, node2.right)
@@ -116,93 +171,121 @@ class RedBlackTree():
             node2.left = node1.left
             node2.left.parent = node2
             node2.color = node1.color
-        if node2_original_color == 0:
+        if node2_original_color is BLACK:
             self.balanceAfterDelete(node3)
 
         return True
 
+    # Deletes a batch of nodes. Small batches are deleted one by one; once the batch holds at least
+    # 1/BATCH_REBUILD_FACTOR of the tree, the remaining nodes are relinked into a balanced tree instead.
+    # Time complexity: O(min(n, mlogn)) for m nodes
+    def deleteNodes(self, nodes):
+        if len(nodes) * BATCH_REBUILD_FACTOR < self.root.size:
+            for node in nodes:
+                self.deleteNode(node)
+            return
+        deleted = set(nodes)
+        self.buildFromSorted([node for node in self.nodes() if node not in deleted])
+
     # Balance the tree after insertion. Various cases considered depending on the color of parent and uncle nodes.
     # Time complexity : O(height) = O(logn)
     def balanceAfterInsert(self, currNode):
-        while currNode.parent.color == "red":
+        iterations = 0
+        while currNode.parent.color is RED:
+            iterations += 1
             # Check if parent is the right child of grandparent
-            if currNode.parent == currNode.parent.parent.right:
+            if currNode.parent is currNode.parent.parent.right:
                 uncle = currNode.parent.parent.left
-                if uncle.color == "red":
-                    uncle.color = "black"
-                    currNode.parent.color = "black"
-                    currNode.parent.parent.color = "red"
+                if uncle.color is RED:
+                    uncle.color = BLACK
+                    currNode.parent.color = BLACK
+                    currNode.parent.parent.color = RED
                     currNode = currNode.parent.parent
                 else:
-                    if currNode == currNode.parent.left:
+                    if currNode is currNode.parent.left:
                         currNode = currNode.parent
                         self.rotateRight(currNode)
-                    currNode.parent.color = "black"
-                    currNode.parent.parent.color = "red"
+                    currNode.parent.color = BLACK
+                    currNode.parent.parent.color = RED
                     self.rotateLeft(currNode.parent.parent)
             else:
                 uncle = currNode.parent.parent.right
 
-                if uncle.color == "red":
-                    uncle.color = "black"
-                    currNode.parent.color = "black"
-                    currNode.parent.parent.color = "red"
+                if uncle.color is RED:
+                    uncle.color = BLACK
+                    currNode.parent.color = BLACK
+                    currNode.parent.parent.color = RED
                     currNode = currNode.parent.parent
                 else:
-                    if currNode == currNode.parent.right:
+                    if currNode is currNode.parent.right:
                         currNode = currNode.parent
                         self.rotateLeft(currNode)
-                    currNode.parent.color = "black"
-                    currNode.parent.parent.color = "red"
+                    currNode.parent.color = BLACK
+                    currNode.parent.parent.color = RED
                     self.rotateRight(currNode.parent.parent)
-            if currNode == self.root:
+            if currNode is self.root:
                 break
-        self.root.color = "black"
+        self.root.color = BLACK
+        if self.metrics is not None:
+            self.metrics.insertRebalanceIterations += iterations
 
     # Gets the inorder successor
     # Time complexity: O(logn)
     def getInorderSuccessor(self, currNode):
-        while currNode.left != self.TNULL:
+        while currNode.left is not self.TNULL:
             currNode = currNode.left
         return currNode
 
     # Left rotation to balance the tree
     # Time complexity: O(1)
     def rotateLeft(self, node1):
+        if self.metrics is not None:
+            self.metrics.leftRotations += 1
         node2 = node1.right
         node1.right = node2.left
-        if node2.left != self.TNULL:
+        if node2.left is not self.TNULL:
             node2.left.parent = node1
 
         node2.parent = node1.parent
-        if node1.parent == None:
+        if node1.parent is None:
             self.root = node2
-        elif node1 == node1.parent.left:
+        elif node1 is node1.parent.left:
             node1.parent.left = node2
         else:
             node1.parent.right = node2
         node2.left = node1
         node1.parent = node2
+        node2.size = node1.size
+        node2.costSum = node1.costSum
+        node1.size = node1.left.size + node1.right.size + 1
+        node1.costSum = node1.left.costSum + node1.right.costSum + node1.rideCost
 
     # Right rotation to balance the tree
     # Time complexity: O(1)
     def rotateRight(self, node1):
+        if self.metrics is not None:
+            self.metrics.rightRotations += 1
         node2 = node1.left
         node1.left = node2.right
-        if node2.right != self.TNULL:
+        if node2.right is not self.TNULL:
             node2.right.parent = node1
 
         node2.parent = node1.parent
-        if node1.parent == None:
+        if node1.parent is None:
             self.root = node2
-        elif node1 == node1.parent.right:
+        elif node1 is node1.parent.right:
             node1.parent.right = node2
         else:
             node1.parent.left = node2
         node2.right = node1
         node1.parent = node2
+        node2.size = node1.size
+        node2.costSum = node1.costSum
+        node1.size = node1.left.size + node1.right.size + 1
+        node1.costSum = node1.left.costSum + node1.right.costSum + node1.rideCost
 
     # Inserts a node in the red-black tree. New node is always inserted as a red node.
+    # The size and costSum of every node on the way down already include the new node.
     # If red-red conflict occurs, it is resolved by balanceAfterInsert().
     # Time complexity : O(height) = O(logn)
     def insert(self, rideNumber, rideCost, tripDuration):
@@ -210,67 +293,199 @@ class RedBlackTree():
         node.parent = None
         node.left = self.TNULL
         node.right = self.TNULL
-        node.color = "red"
+        node.color = RED
 
         node1 = None
         node2 = self.root
 
-        while node2 != self.TNULL:
+        while node2 is not self.TNULL:
             node1 = node2
+            node2.size += 1
+            node2.costSum += rideCost
             if node.rideNumber < node2.rideNumber:
                 node2 = node2.left
             else:
                 node2 = node2.right
 
         node.parent = node1
-        if node1 == None:
+        if node1 is None:
             self.root = node
         elif node.rideNumber < node1.rideNumber:
             node1.left = node
         else:
             node1.right = node
 
-        if node.parent == None:
-            node.color = "black"
+        if node.parent is None:
+            node.color = BLACK
             return node
 
-        if node.parent.parent == None:
+        if node.parent.parent is None:
             return node
 
         self.balanceAfterInsert(node)
         return node
 
+    # Returns the number of nodes on the longest path from the root to a leaf
+    # Time complexity : O(n)
+    def height(self):
+        TNULL = self.TNULL
+        height = 0
+        level = [self.root] if self.root is not TNULL else []
+        while level:
+            height += 1
+            level = [child for node in level for child in (node.left, node.right) if child is not TNULL]
+        return height
+
     def getRoot(self):
         return self.root
 
-    # Search for the node whose rideNumber = key. Search works recursively just like in a BST.
+    # Search for the node whose rideNumber = key, starting from node. Returns None if there is no such node.
+    # Search works iteratively just like in a BST, so no Python frame is created per level.
     # Time complexity : O(height) = O(logn)
     def search(self, key, node):
-        if node == None:
-            return node
-        elif node.rideNumber == key:
-            return node
-        elif key < node.rideNumber:
-            return self.search(key, node.left)
-        else:
-            return self.search(key, node.right)
+        TNULL = self.TNULL
+        while node is not TNULL and node is not None:
+            rideNumber = node.rideNumber
+            if key == rideNumber:
+                return node
+            elif key < rideNumber:
+                node = node.left
+            else:
+                node = node.right
+        return None
 
-    # Print all nodes whose rideNumber lies between lowerBound and upperBound. Searches for lowerBound and does inorder traversal till upperBound.
+    # Yields all nodes whose rideNumber lies between lowerBound and upperBound in ascending order of rideNumber.
+    # Searches for lowerBound and does a lazy inorder traversal with an explicit stack till upperBound,
+    # skipping subtrees outside the range. Only O(height) extra memory is used however wide the range is.
     # Time complexity : O(height+S) = O(logn+S) where S is the number of nodes in range
-    def printRange(self, node, lowerBound, upperBound, res):
-
-        if node == None:
-            return res
+    def iter_range(self, lowerBound, upperBound):
+        TNULL = self.TNULL
+        node = self.root
+        stack = []
+        while True:
+            # Go left as long as the left subtree can still hold rides in range
+            while node is not TNULL:
+                if node.rideNumber < lowerBound:
+                    node = node.right
+                else:
+                    stack.append(node)
+                    node = node.left
+            if not stack:
+                return
+            node = stack.pop()
+            if node.rideNumber > upperBound:
+                return
+            yield node
+            node = node.right
+
+    # Returns the number of rides and the sum of their rideCosts over all rides whose rideNumber is smaller than key,
+    # or smaller than or equal to key if inclusive is True.
+    # Time complexity : O(height) = O(logn)
+    def prefixAggregate(self, key, inclusive):
+        TNULL = self.TNULL
+        node = self.root
+        count = 0
+        costSum = 0
+        while node is not TNULL:
+            if node.rideNumber < key or (inclusive and node.rideNumber == key):
+                # The node and its whole left subtree lie in the prefix
+                count += node.left.size + 1
+                costSum += node.left.costSum + node.rideCost
+                node = node.right
+            else:
+                node = node.left
+        return count, costSum
+
+    # Returns the number of rides whose rideNumber lies between lowerBound and upperBound
+    # Time complexity : O(logn)
+    def count_range(self, lowerBound, upperBound):
+        if lowerBound > upperBound:
+            return 0
+        return self.prefixAggregate(upperBound, True)[0] - self.prefixAggregate(lowerBound, False)[0]
+
+    # Returns the sum of the rideCosts of the rides whose rideNumber lies between lowerBound and upperBound
+    # Time complexity : O(logn)
+    def sum_cost_range(self, lowerBound, upperBound):
+        if lowerBound > upperBound:
+            return 0
+        return self.prefixAggregate(upperBound, True)[1] - self.prefixAggregate(lowerBound, False)[1]
+
+    # Returns the number of rides whose rideNumber is smaller than or equal to rideNumber,
+    # i.e. the 1-based position of rideNumber in ascending order if it is present.
+    # Time complexity : O(logn)
+    def rank(self, rideNumber):
+        return self.prefixAggregate(rideNumber, True)[0]
+
+    # Returns the node with the k-th smallest rideNumber (1-based), or None if k is out of range
+    # Time complexity : O(logn)
+    def select(self, k):
+        TNULL = self.TNULL
+        node = self.root
+        while node is not TNULL:
+            leftSize = node.left.size
+            if k <= leftSize:
+                node = node.left
+            elif k == leftSize + 1:
+                return node
+            else:
+                k -= leftSize + 1
+                node = node.right
+        return None
+
+    # Yields all nodes of the tree in ascending order of rideNumber.
+    # Time complexity : O(n)
+    def nodes(self):
+        return self.iter_range(float("-inf"), float("inf"))
+
+    # Relinks a list of nodes sorted by rideNumber into a perfectly balanced tree that replaces the current one.
+    # The middle node of every sublist becomes the root of that subtree. All nodes are black except the ones on the
+    # deepest level when it is not full, which are colored red, so every path has the same number of black nodes.
+    # Time complexity : O(n)
+    def buildFromSorted(self, sortedNodes):
+        TNULL = self.TNULL
+        redDepth = len(sortedNodes).bit_length() - 1
+        if len(sortedNodes) == (1 << (redDepth + 1)) - 1:
+            # The deepest level is full, so every node can be black
+            redDepth = -1
+
+        def build(low, high, parent, depth):
+            if low > high:
+                return TNULL
+            mid = (low + high) >> 1
+            node = sortedNodes[mid]
+            node.parent = parent
+            node.color = RED if depth == redDepth else BLACK
+            node.left = left = build(low, mid - 1, node, depth + 1)
+            node.right = right = build(mid + 1, high, node, depth + 1)
+            node.size = left.size + right.size + 1
+            node.costSum = left.costSum + right.costSum + node.rideCost
+            return node
 
-        if node.rideNumber < lowerBound:
-            res += self.printRange(node.right, lowerBound, upperBound, [])
-        elif node.rideNumber > upperBound:
-            res += self.printRange(node.left, lowerBound, upperBound, [])
+        self.root = build(0, len(sortedNodes) - 1, None, 0)
+        TNULL.parent = None
+
+    # Inserts a batch of rides (rideNumber, rideCost, tripDuration) that are sorted by rideNumber and not yet present
+    # in the tree. The new nodes are merged with the existing ones and the whole tree is rebuilt in balanced form.
+    # Returns the new nodes in the order of rides.
+    # Time complexity : O(n+m) where m is the number of rides in the batch
+    def bulkInsert(self, rides):
+        newNodes = [RBTNode(rideNumber, rideCost, tripDuration)
+                    for rideNumber, rideCost, tripDuration in rides]
+        if self.root is self.TNULL:
+            allNodes = newNodes
         else:
-            res += self.printRange(node.right, lowerBound,
-                                   upperBound, [])
-            res += [(node.rideNumber, node.rideCost, node.tripDuration)]
-            res += self.printRange(node.left, lowerBound,
-                                   upperBound, [])
-
-        return res
+            # Both lists are sorted, so this sort only merges two runs
+            allNodes = list(self.nodes())
+            allNodes.extend(newNodes)
+            allNodes.sort(key=lambda node: node.rideNumber)
+        self.buildFromSorted(allNodes)
+        return newNodes
+
+    # Replaces the tree with the rides given as (rideNumber, rideCost, tripDuration) tuples in ascending order of
+    # rideNumber without duplicates. Returns the new nodes in ascending order.
+    # Time complexity : O(n)
+    def loadSorted(self, rides):
+        sortedNodes = [RBTNode(rideNumber, rideCost, tripDuration)
+                       for rideNumber, rideCost, tripDuration in rides]
+        self.buildFromSorted(sortedNodes)
+        return sortedNodes
@@ -0,0 +1,210 @@
+# Persistent copies of the ride set, so that readers get a consistent point-in-time view while the writer goes on
+#
+# The rides are kept a second time in a treap whose nodes are never changed once they are reachable from a
+# published root. Every mutation copies the O(logn) nodes on the path to the changed ride and publishes a new root;
+# all other nodes are shared with the previous versions. A reader takes the current root once, through view(), and
+# can then walk it for as long as it likes, from any thread and without locks: the writer never touches the nodes
+# it sees. A version is freed by reference counting as soon as no view refers to its root any more, and the nodes
+# hold no cycles, so no garbage collector pass is needed either.
+# A node is the tuple (rideNumber, rideCost, tripDuration, priority, left, right). Tuples make the immutability
+# explicit, and creating one costs about a quarter of creating an object, which matters as every mutation creates
+# a path of them.
+# The priority of a node is a hash of its rideNumber, which makes the shape of the treap a function of the set of
+# rideNumbers alone, so a treap rebuilt from sorted rides equals the one built by single inserts.
+
+MASK64 = (1 << 64) - 1
+
+
+# Returns the treap priority of rideNumber: the splitmix64 finalizer of it, a well mixed 64-bit value
+def priorityOf(rideNumber):
+    value = (rideNumber + 0x9E3779B97F4A7C15) & MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & MASK64
+    return value ^ (value >> 31)
+
+
+# Splits the treap at node into the treaps of the rideNumbers below and above rideNumber, which is not in it
+# Time complexity : O(logn) expected
+def split(node, rideNumber):
+    if node is None:
+        return None, None
+    nodeRideNumber, rideCost, tripDuration, priority, left, right = node
+    if nodeRideNumber < rideNumber:
+        below, above = split(right, rideNumber)
+        return (nodeRideNumber, rideCost, tripDuration, priority, left, below), above
+    below, above = split(left, rideNumber)
+    return below, (nodeRideNumber, rideCost, tripDuration, priority, above, right)
+
+
+# Joins two treaps whose rideNumbers are all smaller in the first one
+# Time complexity : O(logn) expected
+def merge(node1, node2):
+    if node1 is None:
+        return node2
+    if node2 is None:
+        return node1
+    if node1[3] > node2[3]:
+        rideNumber, rideCost, tripDuration, priority, left, right = node1
+        return rideNumber, rideCost, tripDuration, priority, left, merge(right, node2)
+    rideNumber, rideCost, tripDuration, priority, left, right = node2
+    return rideNumber, rideCost, tripDuration, priority, merge(node1, left), right
+
+
+# Returns the treap at node with the ride added
+# Time complexity : O(logn) expected
+def insertNode(node, rideNumber, rideCost, tripDuration, priority):
+    if node is None:
+        return rideNumber, rideCost, tripDuration, priority, None, None
+    if priority > node[3]:
+        below, above = split(node, rideNumber)
+        return rideNumber, rideCost, tripDuration, priority, below, above
+    nodeRideNumber, nodeRideCost, nodeTripDuration, nodePriority, left, right = node
+    if rideNumber < nodeRideNumber:
+        return (nodeRideNumber, nodeRideCost, nodeTripDuration, nodePriority,
+                insertNode(left, rideNumber, rideCost, tripDuration, priority), right)
+    return (nodeRideNumber, nodeRideCost, nodeTripDuration, nodePriority,
+            left, insertNode(right, rideNumber, rideCost, tripDuration, priority))
+
+
+# Returns the treap at node without rideNumber
+# Time complexity : O(logn) expected
+def deleteNode(node, rideNumber):
+    if node is None:
+        return None
+    nodeRideNumber, rideCost, tripDuration, priority, left, right = node
+    if rideNumber < nodeRideNumber:
+        return nodeRideNumber, rideCost, tripDuration, priority, deleteNode(left, rideNumber), right
+    if rideNumber > nodeRideNumber:
+        return nodeRideNumber, rideCost, tripDuration, priority, left, deleteNode(right, rideNumber)
+    return merge(left, right)
+
+
+# Returns the treap at node with the rideCost and tripDuration of rideNumber replaced
+# Time complexity : O(logn) expected
+def updateNode(node, rideNumber, rideCost, tripDuration):
+    if node is None:
+        return None
+    nodeRideNumber, nodeRideCost, nodeTripDuration, priority, left, right = node
+    if rideNumber < nodeRideNumber:
+        return (nodeRideNumber, nodeRideCost, nodeTripDuration, priority,
+                updateNode(left, rideNumber, rideCost, tripDuration), right)
+    if rideNumber > nodeRideNumber:
+        return (nodeRideNumber, nodeRideCost, nodeTripDuration, priority,
+                left, updateNode(right, rideNumber, rideCost, tripDuration))
+    return rideNumber, rideCost, tripDuration, priority, left, right
+
+
+# A consistent view of the rides as they were when it was taken. Its methods only read immutable nodes, so any
+# number of threads can use views while the writer publishes new versions.
+class ReadView:
+    __slots__ = ("root", "version")
+
+    def __init__(self, root, version):
+        self.root = root
+        self.version = version
+
+    # Returns the node of rideNumber, or None
+    # Time complexity : O(logn) expected
+    def search(self, rideNumber):
+        node = self.root
+        while node is not None and node[0] != rideNumber:
+            node = node[4] if rideNumber < node[0] else node[5]
+        return node
+
+    # Yields the nodes with rideNumber1 <= rideNumber <= rideNumber2 in ascending order of rideNumber
+    # Time complexity : O(logn+S) expected where S is the number of rides in range
+    def iterRange(self, rideNumber1, rideNumber2):
+        stack = []
+        node = self.root
+        while True:
+            while node is not None:
+                if node[0] < rideNumber1:
+                    node = node[5]
+                else:
+                    stack.append(node)
+                    node = node[4]
+            if not stack:
+                return
+            node = stack.pop()
+            if node[0] > rideNumber2:
+                return
+            yield node
+            node = node[5]
+
+    # Returns the line CabService.print writes for rideNumber, without its newline
+    def formatRide(self, rideNumber):
+        node = self.search(rideNumber)
+        if node is None:
+            return "(0,0,0)"
+        return "(%d,%d,%d)" % node[:3]
+
+    # Returns the line CabService.printRange writes for the range, without its newline
+    def formatRange(self, rideNumber1, rideNumber2):
+        rides = ["(%d,%d,%d)" % node[:3] for node in self.iterRange(rideNumber1, rideNumber2)]
+        return ",".join(rides) if rides else "(0,0,0)"
+
+
+class RideVersions:
+    def __init__(self):
+        self.root = None
+        # Number of versions published so far
+        self.version = 0
+
+    # Returns a view of the current version
+    def view(self):
+        return ReadView(self.root, self.version)
+
+    # Makes root the current version. A single assignment, so a reader sees either the old or the new root.
+    def publish(self, root):
+        self.root = root
+        self.version += 1
+
+    # Time complexity : O(logn) expected for each of the following three
+    def insert(self, rideNumber, rideCost, tripDuration):
+        self.publish(insertNode(self.root, rideNumber, rideCost, tripDuration, priorityOf(rideNumber)))
+
+    def update(self, rideNumber, rideCost, tripDuration):
+        self.publish(updateNode(self.root, rideNumber, rideCost, tripDuration))
+
+    def delete(self, rideNumber):
+        self.publish(deleteNode(self.root, rideNumber))
+
+    # Publishes a new version holding exactly the rides of sortedNodes (any nodes with rideNumber, rideCost and
+    # tripDuration, in ascending order of rideNumber); nothing is shared with the previous versions.
+    # The shape is found with a stack of the right spine, as for a Cartesian tree, and the nodes are then created
+    # children first, since a tuple cannot be given its children later.
+    # Time complexity : O(n)
+    def rebuild(self, sortedNodes):
+        rides = [(node.rideNumber, node.rideCost, node.tripDuration, priorityOf(node.rideNumber))
+                 for node in sortedNodes]
+        count = len(rides)
+        # Index count stands for a missing child
+        lefts = [count] * count
+        rights = [count] * count
+        spine = []
+        for i in range(count):
+            priority = rides[i][3]
+            last = count
+            while spine and rides[spine[-1]][3] < priority:
+                last = spine.pop()
+            lefts[i] = last
+            if spine:
+                rights[spine[-1]] = i
+            spine.append(i)
+        if not spine:
+            self.publish(None)
+            return
+        # Every node is visited after its parent, so the reversed visiting order creates the children first
+        order = []
+        stack = [spine[0]]
+        while stack:
+            i = stack.pop()
+            order.append(i)
+            if lefts[i] != count:
+                stack.append(lefts[i])
+            if rights[i] != count:
+                stack.append(rights[i])
+        nodes = [None] * (count + 1)
+        for i in reversed(order):
+            nodes[i] = rides[i] + (nodes[lefts[i]], nodes[rights[i]])
+        self.publish(nodes[spine[0]])
@@ -0,0 +1,341 @@
+# CabService partitioned by rideNumber range across worker processes
+#
+# Shard i owns the ride numbers in [boundaries[i-1], boundaries[i]) and runs its own CabService, i.e. its own
+# RedBlackTree and MinHeap, in a separate process. The coordinator keeps a cached head (cheapest ride) and size
+# for every shard, which every reply from a shard refreshes:
+#   Insert, Print, CancelRide and UpdateTrip go to the single shard that owns the rideNumber.
+#   Print(lo, hi) asks only the shards overlapping [lo, hi], in parallel, and concatenates their already
+#   ordered results in shard order.
+#   GetNextRide selects the cheapest cached head and pops it from that one shard.
+#   GetNextRides(k) and PeekNextRides(k) merge the k cheapest rides of every shard.
+#   CountRange and SumCostRange add up the answers of the overlapping shards. Rank and Select combine the cached
+#   sizes of the shards before the owning shard with the answer of that shard.
+#   AdvanceClock is sent to every shard, each of which expires its own rides.
+#   height(), which the metrics of CommandEngine sample, is the height of the tallest shard tree.
+# CancelRide, UpdateTrip and AdvanceClock produce no output, so they are sent without waiting for the reply. The replies are
+# collected before the next request that needs the shard's response or the cached heads.
+# The class has the same command methods as CabService and can be driven by gatorTaxi.CommandEngine.
+
+import bisect
+import heapq
+import io
+import multiprocessing
+import sys
+
+import gatorTaxi
+
+# Messages sent to the shard workers
+STOP = 0
+INSERT = 1
+GET_NEXT_RIDE = 2
+CANCEL_RIDE = 3
+UPDATE_TRIP = 4
+PRINT = 5
+PRINT_RANGE = 6
+CHECK_BATCH = 7
+LOAD_BATCH = 8
+COUNT_RANGE = 9
+SUM_COST_RANGE = 10
+RANK = 11
+SELECT = 12
+PEEK_NEXT_RIDES = 13
+REMOVE_RIDES = 14
+ADVANCE_CLOCK = 15
+HEIGHT = 16
+
+
+# Returns the (rideCost, tripDuration, rideNumber) of the cheapest ride of service, or None if it has no rides
+def headOf(service):
+    smallest = service.minHeap.peekSmallest(1)
+    if not smallest:
+        return None
+    node = smallest[0]
+    return (node.rideCost, node.tripDuration, node.rideNumber)
+
+
+# Main loop of a shard process. Every message gets the reply (head, size, result).
+def workerLoop(connection, heap, ttl):
+    output = io.StringIO()
+    service = gatorTaxi.CabService(output, heap=heap, ttl=ttl)
+    redBlack = service.redBlack
+    while True:
+        message = connection.recv()
+        kind = message[0]
+        result = None
+        if kind == STOP:
+            break
+        elif kind == INSERT:
+            result = service.insert(*message[1:])
+        elif kind == GET_NEXT_RIDE:
+            service.getNextRide()
+            result = output.getvalue()
+        elif kind == CANCEL_RIDE:
+            service.cancelRide(message[1])
+        elif kind == UPDATE_TRIP:
+            service.updateTrip(message[1], message[2])
+        elif kind == PRINT:
+            service.print(message[1])
+            result = output.getvalue()
+        elif kind == PRINT_RANGE:
+            result = ",".join(["(%d,%d,%d)" % (node.rideNumber, node.rideCost, node.tripDuration)
+                               for node in redBlack.iter_range(message[1], message[2])])
+        elif kind == CHECK_BATCH:
+            # Index of the first ride of the batch that is a duplicate, or None
+            seen = set()
+            for i, ride in enumerate(message[1]):
+                if ride[0] in seen or redBlack.search(ride[0], redBlack.getRoot()) is not None:
+                    result = i
+                    break
+                seen.add(ride[0])
+        elif kind == LOAD_BATCH:
+            result = service.bulk_load(message[1])
+        elif kind == COUNT_RANGE:
+            result = redBlack.count_range(message[1], message[2])
+        elif kind == SUM_COST_RANGE:
+            result = redBlack.sum_cost_range(message[1], message[2])
+        elif kind == RANK:
+            result = redBlack.rank(message[1])
+        elif kind == SELECT:
+            node = redBlack.select(message[1])
+            if node is not None:
+                result = "(%d,%d,%d)" % (node.rideNumber, node.rideCost, node.tripDuration)
+        elif kind == PEEK_NEXT_RIDES:
+            result = [(node.rideCost, node.tripDuration, node.rideNumber)
+                      for node in service.minHeap.peekSmallest(message[1])]
+        elif kind == REMOVE_RIDES:
+            for rideNumber in message[1]:
+                service.cancelRide(rideNumber)
+        elif kind == ADVANCE_CLOCK:
+            service.advanceClock(message[1])
+        elif kind == HEIGHT:
+            result = service.height()
+        output.seek(0)
+        output.truncate()
+        connection.send((headOf(service), service.size(), result))
+    connection.close()
+
+
+# Splits [1, maxRideNumber] into numShards ranges of equal width and returns the boundaries between them
+def evenBoundaries(numShards, maxRideNumber):
+    return [1 + (maxRideNumber * i) // numShards for i in range(1, numShards)]
+
+
+class ShardedCabService:
+    # Starts len(boundaries)+1 shard processes, whose CabServices use the priority queue backend named heap and
+    # expire rides after ttl ticks if it is set.
+    # Results are written to out, which defaults to sys.stdout.
+    def __init__(self, boundaries, out=None, heap="binary", ttl=None):
+        self.out = out if out is not None else sys.stdout
+        self.boundaries = sorted(boundaries)
+        numShards = len(self.boundaries) + 1
+        self.connections = []
+        self.processes = []
+        for _ in range(numShards):
+            connection, workerConnection = multiprocessing.Pipe()
+            process = multiprocessing.Process(
+                target=workerLoop, args=(workerConnection, heap, ttl), daemon=True)
+            process.start()
+            workerConnection.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+        self.heads = [None] * numShards
+        self.sizes = [0] * numShards
+        self.outstanding = [0] * numShards
+
+    # Returns the index of the shard that owns rideNumber
+    def shardOf(self, rideNumber):
+        return bisect.bisect_right(self.boundaries, rideNumber)
+
+    # Sends a message to a shard without waiting for its reply
+    def post(self, shard, message):
+        self.connections[shard].send(message)
+        self.outstanding[shard] += 1
+
+    # Receives the next reply of a shard, refreshes its cached head and size and returns the result
+    def receive(self, shard):
+        head, size, result = self.connections[shard].recv()
+        self.outstanding[shard] -= 1
+        self.heads[shard] = head
+        self.sizes[shard] = size
+        return result
+
+    # Collects all outstanding replies of a shard
+    def drain(self, shard):
+        while self.outstanding[shard]:
+            self.receive(shard)
+
+    # Sends a message to a shard and waits for its result
+    def request(self, shard, message):
+        self.drain(shard)
+        self.post(shard, message)
+        return self.receive(shard)
+
+    def size(self):
+        for shard in range(len(self.connections)):
+            self.drain(shard)
+        return sum(self.sizes)
+
+    # Returns the height of the tallest RBTree of the shards, asking all of them in parallel
+    def height(self):
+        shards = range(len(self.connections))
+        for shard in shards:
+            self.drain(shard)
+            self.post(shard, (HEIGHT,))
+        return max([self.receive(shard) for shard in shards])
+
+    def print(self, rideNumber):
+        self.out.write(self.request(self.shardOf(rideNumber), (PRINT, rideNumber)))
+
+    # Asks every overlapping shard in parallel and concatenates their results in shard order
+    def printRange(self, rideNumber1, rideNumber2):
+        shards = range(self.shardOf(rideNumber1),
+                       self.shardOf(rideNumber2) + 1)
+        for shard in shards:
+            self.drain(shard)
+            self.post(shard, (PRINT_RANGE, rideNumber1, rideNumber2))
+        parts = [self.receive(shard) for shard in shards]
+        result = ",".join([part for part in parts if part])
+        self.out.write((result if result else "(0,0,0)") + "\n")
+
+    # Asks every overlapping shard in parallel and returns the sum of their results
+    def sumOverRange(self, kind, rideNumber1, rideNumber2):
+        if rideNumber1 > rideNumber2:
+            return 0
+        shards = range(self.shardOf(rideNumber1),
+                       self.shardOf(rideNumber2) + 1)
+        for shard in shards:
+            self.drain(shard)
+            self.post(shard, (kind, rideNumber1, rideNumber2))
+        return sum([self.receive(shard) for shard in shards])
+
+    def countRange(self, rideNumber1, rideNumber2):
+        self.out.write("%d\n" % self.sumOverRange(COUNT_RANGE, rideNumber1, rideNumber2))
+
+    def sumCostRange(self, rideNumber1, rideNumber2):
+        self.out.write("%d\n" % self.sumOverRange(SUM_COST_RANGE, rideNumber1, rideNumber2))
+
+    # All rides of the shards before the owning shard have smaller rideNumbers
+    def rank(self, rideNumber):
+        owner = self.shardOf(rideNumber)
+        for shard in range(owner):
+            self.drain(shard)
+        result = sum(self.sizes[:owner]) + self.request(owner, (RANK, rideNumber))
+        self.out.write("%d\n" % result)
+
+    # Skips whole shards by their cached sizes and asks the shard that holds the k-th ride
+    def select(self, k):
+        result = None
+        if k >= 1:
+            for shard in range(len(self.connections)):
+                self.drain(shard)
+                if k <= self.sizes[shard]:
+                    result = self.request(shard, (SELECT, k))
+                    break
+                k -= self.sizes[shard]
+        self.out.write((result if result is not None else "(0,0,0)") + "\n")
+
+    def insert(self, rideNumber, rideCost, tripDuration):
+        if self.request(self.shardOf(rideNumber), (INSERT, rideNumber, rideCost, tripDuration)) is False:
+            self.out.write("Duplicate RideNumber")
+            return False
+        return True
+
+    # Loads a batch in two phases so that, as in CabService.bulk_load, exactly the rides before the first
+    # duplicate in batch order are inserted: every shard first reports its first duplicate, then loads the
+    # rides that precede the earliest one.
+    def bulk_load(self, rides):
+        batches = {}
+        for i, ride in enumerate(rides):
+            batches.setdefault(self.shardOf(ride[0]), []).append((i, ride))
+        for shard, batch in batches.items():
+            self.drain(shard)
+            self.post(shard, (CHECK_BATCH, [ride for i, ride in batch]))
+        firstDuplicate = len(rides)
+        for shard, batch in batches.items():
+            localIdx = self.receive(shard)
+            if localIdx is not None:
+                firstDuplicate = min(firstDuplicate, batch[localIdx][0])
+        for shard, batch in batches.items():
+            self.post(shard, (LOAD_BATCH, [
+                      ride for i, ride in batch if i < firstDuplicate]))
+        for shard in batches:
+            self.receive(shard)
+        if firstDuplicate < len(rides):
+            self.out.write("Duplicate RideNumber")
+            return False
+        return True
+
+    # Selects the shard with the cheapest cached head (ties by tripDuration, then rideNumber) and pops it there
+    def getNextRide(self):
+        best = None
+        for shard in range(len(self.connections)):
+            self.drain(shard)
+            head = self.heads[shard]
+            if head is not None and (best is None or head < self.heads[best]):
+                best = shard
+        if best is None:
+            self.out.write("No active ride requests\n")
+        else:
+            self.out.write(self.request(best, (GET_NEXT_RIDE,)))
+
+    # Asks every shard in parallel for its k cheapest rides and returns the k cheapest of all as
+    # (rideCost, tripDuration, rideNumber, shard) tuples in ascending order
+    def smallestRides(self, k):
+        shards = range(len(self.connections))
+        for shard in shards:
+            self.drain(shard)
+            self.post(shard, (PEEK_NEXT_RIDES, k))
+        candidates = [[ride + (shard,) for ride in self.receive(shard)] for shard in shards]
+        return list(heapq.merge(*candidates))[:max(k, 0)]
+
+    # Writes rides given as (rideCost, tripDuration, rideNumber, shard) tuples as one comma separated line
+    def writeSmallestRides(self, rides):
+        result = ",".join(["(%d,%d,%d)" % (rideNumber, rideCost, tripDuration)
+                           for rideCost, tripDuration, rideNumber, shard in rides])
+        self.out.write((result if result else "(0,0,0)") + "\n")
+
+    def getNextRides(self, k):
+        if self.size() == 0:
+            self.out.write("No active ride requests\n")
+            return
+        rides = self.smallestRides(k)
+        batches = {}
+        for rideCost, tripDuration, rideNumber, shard in rides:
+            batches.setdefault(shard, []).append(rideNumber)
+        for shard, rideNumbers in batches.items():
+            self.post(shard, (REMOVE_RIDES, rideNumbers))
+        self.writeSmallestRides(rides)
+
+    def peekNextRides(self, k):
+        if self.size() == 0:
+            self.out.write("No active ride requests\n")
+        else:
+            self.writeSmallestRides(self.smallestRides(k))
+
+    def cancelRide(self, rideNumber):
+        self.post(self.shardOf(rideNumber), (CANCEL_RIDE, rideNumber))
+
+    def updateTrip(self, rideNumber, newTripDuration):
+        self.post(self.shardOf(rideNumber),
+                  (UPDATE_TRIP, rideNumber, newTripDuration))
+
+    def advanceClock(self, now):
+        for shard in range(len(self.connections)):
+            self.post(shard, (ADVANCE_CLOCK, now))
+
+    # Stops all shard processes
+    def close(self):
+        for shard, connection in enumerate(self.connections):
+            self.drain(shard)
+            connection.send((STOP,))
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,101 @@
+# Binary snapshots of the rides held by a CabService
+#
+# A snapshot file consists of
+#   header:      magic (8 bytes), number of rides n (uint64), write-ahead log sequence number (uint64),
+#                heap arity (uint64)
+#   rides:       n records of (rideNumber, rideCost, tripDuration) as int64, sorted by rideNumber
+#   heap order:  n uint32 indices into the rides section, listing the rides in heap order
+# All values are little-endian. Storing the heap order lets a restore rebuild the exact same array heap without
+# heapifying, as long as it has the saved arity; an arity of 0 means the order is not an array heap.
+# The log sequence number is the number of the first write-ahead log record that is not contained in the snapshot.
+# Version 2 snapshots, which have no arity in their header, were written by a binary heap.
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIC = b"GTAXSNP3"
+HEADER = struct.Struct("<8sQQQ")
+MAGIC_V2 = b"GTAXSNP2"
+HEADER_V2 = struct.Struct("<8sQQ")
+RIDE_RECORD = struct.Struct("<qqq")
+HEAP_RECORD = struct.Struct("<I")
+
+
+class SnapshotError(Exception):
+    pass
+
+
+# Writes a snapshot of sortedNodes (tree nodes in ascending order of rideNumber) and heapNodes (heap nodes in
+# heap order, whose RBTNode pointers refer to sortedNodes) together with logSequence and heapArity. The file is
+# written next to path and renamed over it, so a crash never leaves a partially written snapshot behind.
+# Time complexity : O(n)
+def write(path, sortedNodes, heapNodes, logSequence=0, heapArity=2):
+    rides = array("q")
+    index = {}
+    for i, node in enumerate(sortedNodes):
+        rides.append(node.rideNumber)
+        rides.append(node.rideCost)
+        rides.append(node.tripDuration)
+        index[id(node)] = i
+    heapOrder = array("I", [index[id(heapNode.RBTNode)]
+                       for heapNode in heapNodes])
+    if sys.byteorder != "little":
+        rides.byteswap()
+        heapOrder.byteswap()
+
+    tmpPath = path + ".tmp"
+    with open(tmpPath, "wb") as snapshotFile:
+        snapshotFile.write(HEADER.pack(MAGIC, len(index), logSequence, heapArity))
+        rides.tofile(snapshotFile)
+        heapOrder.tofile(snapshotFile)
+        snapshotFile.flush()
+        os.fsync(snapshotFile.fileno())
+    os.replace(tmpPath, path)
+
+
+# Memory-maps a snapshot and calls restore(rides, heapOrder, heapArity) with an iterator of
+# (rideNumber, rideCost, tripDuration) tuples in ascending order of rideNumber, a sequence of indices into it in heap
+# order and the arity of the heap that wrote it.
+# Both are views of the mapped file, so restore must consume them before it returns.
+# Returns the log sequence number stored in the snapshot.
+def read(path, restore):
+    with open(path, "rb") as snapshotFile:
+        if os.fstat(snapshotFile.fileno()).st_size < HEADER_V2.size:
+            raise SnapshotError("Snapshot is truncated: " + path)
+        with mmap.mmap(snapshotFile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if mapped[:len(MAGIC_V2)] == MAGIC_V2:
+                header = HEADER_V2
+                magic, count, logSequence = header.unpack_from(mapped)
+                heapArity = 2
+            else:
+                header = HEADER
+                if len(mapped) < header.size:
+                    raise SnapshotError("Snapshot is truncated: " + path)
+                magic, count, logSequence, heapArity = header.unpack_from(mapped)
+                if magic != MAGIC:
+                    raise SnapshotError("Not a snapshot file: " + path)
+            ridesEnd = header.size + count * RIDE_RECORD.size
+            heapEnd = ridesEnd + count * HEAP_RECORD.size
+            if len(mapped) != heapEnd:
+                raise SnapshotError("Snapshot has the wrong size: " + path)
+
+            with memoryview(mapped) as view:
+                with view[header.size: ridesEnd] as ridesView, view[ridesEnd: heapEnd] as heapView:
+                    if sys.byteorder == "little":
+                        heapOrder = heapView.cast("I")
+                    else:
+                        heapOrder = array("I")
+                        heapOrder.frombytes(heapView)
+                        heapOrder.byteswap()
+                    rides = RIDE_RECORD.iter_unpack(ridesView)
+                    try:
+                        restore(rides, heapOrder, heapArity)
+                    finally:
+                        # Drop the exports of the mapped buffer before it is unmapped
+                        del rides
+                        if isinstance(heapOrder, memoryview):
+                            heapOrder.release()
+    return logSequence
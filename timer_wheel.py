@@ -0,0 +1,89 @@
+# Hierarchical timer wheel for expiring rides by deadline
+#
+# The wheel has LEVELS levels of SLOTS slots. Level l counts time in units of SLOTS^l ticks: an entry is kept at the
+# lowest level whose digit is the highest base-SLOTS digit in which its deadline differs from the current time, in the
+# slot of that digit of the deadline. Deadlines beyond the range of the top level wait in an overflow list.
+# When time advances, the slots that were passed are emptied: entries whose deadline has come are returned as
+# expired, the others are placed again relative to the new time, which always puts them on a lower level.
+# An entry therefore moves at most LEVELS times, so scheduling and expiring cost O(1) amortized per entry, and
+# advancing the clock by one tick visits at most one slot per level instead of scanning the entries.
+# Entries cannot be removed; their owner ignores the ones that are no longer live when they expire. Items should
+# therefore be keys rather than the objects they stand for, which an entry would keep alive until it expires.
+# Slots store deadlines and items alternately in one flat list rather than as (deadline, item) tuples: with hundreds
+# of thousands of rides scheduled, the tuples alone made the garbage collector's passes noticeably slower.
+
+SLOT_BITS = 8
+SLOTS = 1 << SLOT_BITS
+SLOT_MASK = SLOTS - 1
+LEVELS = 4
+
+
+class TimerWheel:
+    def __init__(self, now=0):
+        self.now = now
+        self.wheel = [[[] for _ in range(SLOTS)] for _ in range(LEVELS)]
+        self.overflow = []
+        # Entries scheduled at or before the current time, expired by the next advance
+        self.due = []
+        self.size = 0
+
+    # Schedules item to expire at deadline
+    # Time complexity : O(1)
+    def schedule(self, deadline, item):
+        self.size += 1
+        self.place(deadline, item)
+
+    # Stores an entry on the level of the highest digit in which deadline and the current time differ
+    def place(self, deadline, item):
+        now = self.now
+        if deadline <= now:
+            self.due.append(item)
+            return
+        level = ((deadline ^ now).bit_length() - 1) // SLOT_BITS
+        if level < LEVELS:
+            slot = self.wheel[level][(deadline >> (level * SLOT_BITS)) & SLOT_MASK]
+        else:
+            slot = self.overflow
+        slot.append(deadline)
+        slot.append(item)
+
+    # Advances the time to now and returns the items whose deadline is at or before it. Earlier times are ignored.
+    # Time complexity : O(LEVELS*SLOTS) at most per call, plus O(1) amortized per expired item
+    def advance(self, now):
+        expired = self.due
+        self.due = []
+        oldNow = self.now
+        if now <= oldNow:
+            self.size -= len(expired)
+            return expired
+        self.now = now
+        cascade = []
+        shift = 0
+        for level in range(LEVELS):
+            slots = self.wheel[level]
+            if oldNow >> (shift + SLOT_BITS) != now >> (shift + SLOT_BITS):
+                # The time left the range of this level, so all of its entries are due
+                digits = range(SLOTS)
+            else:
+                digits = range(((oldNow >> shift) & SLOT_MASK) + 1, ((now >> shift) & SLOT_MASK) + 1)
+            for digit in digits:
+                slot = slots[digit]
+                if slot:
+                    slots[digit] = []
+                    for i in range(0, len(slot), 2):
+                        if slot[i] <= now:
+                            expired.append(slot[i + 1])
+                        else:
+                            cascade.append(slot[i])
+                            cascade.append(slot[i + 1])
+            shift += SLOT_BITS
+        if self.overflow and oldNow >> shift != now >> shift:
+            cascade.extend(self.overflow)
+            self.overflow = []
+        for i in range(0, len(cascade), 2):
+            if cascade[i] <= now:
+                expired.append(cascade[i + 1])
+            else:
+                self.place(cascade[i], cascade[i + 1])
+        self.size -= len(expired)
+        return expired
@@ -0,0 +1,149 @@
+# Append-only write-ahead log of the mutations applied to a CabService
+#
+# A log file consists of
+#   header:   magic (8 bytes), sequence number of the first record (uint64)
+#   records:  fixed-width (recordType uint8, three int64 arguments), one per mutation
+# All values are little-endian. Records are numbered consecutively from the header's sequence number,
+# so a snapshot that stores the sequence number of the next record tells recovery where to resume.
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"GTAXWAL1"
+HEADER = struct.Struct("<8sQ")
+RECORD = struct.Struct("<Bqqq")
+
+# Types of the logged mutations
+INSERT = 1
+# No longer written: GetNextRide is logged as a CANCEL_RIDE of the ride it removed. Still replayed for old logs.
+GET_NEXT_RIDE = 2
+CANCEL_RIDE = 3
+UPDATE_TRIP = 4
+
+# Group commit defaults: fsync after this many records or this many milliseconds, whichever comes first
+DEFAULT_SYNC_EVERY_OPS = 1000
+DEFAULT_SYNC_INTERVAL_MS = 10.0
+
+
+class WALError(Exception):
+    pass
+
+
+# Reads the header of the log file at path and returns (startSequence, numberOfCompleteRecords).
+def readHeader(path):
+    with open(path, "rb") as logFile:
+        header = logFile.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise WALError("Log is truncated: " + path)
+        magic, startSequence = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise WALError("Not a write-ahead log: " + path)
+        size = os.fstat(logFile.fileno()).st_size
+    return startSequence, (size - HEADER.size) // RECORD.size
+
+
+# Yields (sequence, recordType, arg1, arg2, arg3) for every complete record of the log at path, starting at
+# sequence fromSequence. A partially written last record, e.g. from a crash during a write, is ignored.
+def records(path, fromSequence=0):
+    startSequence, count = readHeader(path)
+    skip = max(0, fromSequence - startSequence)
+    if skip >= count:
+        return
+    with open(path, "rb") as logFile:
+        with mmap.mmap(logFile.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                with view[HEADER.size + skip * RECORD.size: HEADER.size + count * RECORD.size] as recordsView:
+                    sequence = startSequence + skip
+                    recordIter = RECORD.iter_unpack(recordsView)
+                    try:
+                        for recordType, arg1, arg2, arg3 in recordIter:
+                            yield sequence, recordType, arg1, arg2, arg3
+                            sequence += 1
+                    finally:
+                        # Drop the export of the mapped buffer before it is unmapped
+                        del recordIter
+
+
+class WriteAheadLog:
+    # Opens the log at path for appending, creating it if needed. A partially written last record is cut off.
+    # The log is fsynced after syncEveryOps records or syncIntervalMs milliseconds since the last fsync,
+    # whichever comes first. syncEveryOps=1 fsyncs every record.
+    # append only sees the time limit when the next record comes, so a sync thread wakes up when the oldest pending
+    # record is syncIntervalMs old and fsyncs it even if no further record is appended. The lock keeps the two
+    # threads from writing and fsyncing the file at the same time.
+    def __init__(self, path, syncEveryOps=DEFAULT_SYNC_EVERY_OPS, syncIntervalMs=DEFAULT_SYNC_INTERVAL_MS):
+        self.path = path
+        self.syncEveryOps = syncEveryOps
+        self.syncInterval = syncIntervalMs / 1000.0
+        self.lock = threading.RLock()
+        self.closing = threading.Event()
+        self.syncThread = None
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            startSequence, count = readHeader(path)
+            self.logFile = open(path, "r+b")
+            self.logFile.truncate(HEADER.size + count * RECORD.size)
+            self.logFile.seek(0, os.SEEK_END)
+            self.sequence = startSequence + count
+        else:
+            self.logFile = open(path, "wb")
+            self.logFile.write(HEADER.pack(MAGIC, 0))
+            self.sequence = 0
+        self.sync()
+        # Every record is fsynced by append itself when either limit allows no grouping
+        if syncEveryOps > 1 and self.syncInterval > 0:
+            self.syncThread = threading.Thread(target=self.syncLoop, name="wal-sync", daemon=True)
+            self.syncThread.start()
+
+    # Appends one record and fsyncs the log if the group commit limits are reached.
+    # Time complexity: O(1)
+    def append(self, recordType, arg1=0, arg2=0, arg3=0):
+        with self.lock:
+            self.logFile.write(RECORD.pack(recordType, arg1, arg2, arg3))
+            self.sequence += 1
+            self.pendingOps += 1
+            if self.pendingOps >= self.syncEveryOps or time.monotonic() - self.lastSync >= self.syncInterval:
+                self.sync()
+
+    # Writes all buffered records to the file and fsyncs it
+    def sync(self):
+        with self.lock:
+            self.logFile.flush()
+            os.fsync(self.logFile.fileno())
+            self.pendingOps = 0
+            self.lastSync = time.monotonic()
+
+    # Body of the sync thread. A record appended while the log has no pending records is either fsynced by append
+    # (if the last fsync is syncInterval old) or made pending after a fsync less than syncInterval ago, so sleeping
+    # until syncInterval after the last fsync and fsyncing then keeps every record pending for at most syncInterval.
+    def syncLoop(self):
+        timeout = self.syncInterval
+        while not self.closing.wait(timeout):
+            with self.lock:
+                if self.logFile.closed:
+                    return
+                timeout = self.syncInterval
+                if self.pendingOps:
+                    timeout = self.lastSync + self.syncInterval - time.monotonic()
+                    if timeout <= 0:
+                        self.sync()
+                        timeout = self.syncInterval
+
+    # Discards all records. The next record keeps its sequence number, which becomes the new start of the log.
+    # Called after a snapshot containing every logged mutation has been written.
+    def reset(self):
+        with self.lock:
+            self.logFile.seek(0)
+            self.logFile.truncate()
+            self.logFile.write(HEADER.pack(MAGIC, self.sequence))
+            self.sync()
+
+    def close(self):
+        self.closing.set()
+        if self.syncThread is not None:
+            self.syncThread.join()
+        if not self.logFile.closed:
+            self.sync()
+            self.logFile.close()